@@ -1,12 +1,51 @@
+import logging
+import os
+import time
+_import_start=time.perf_counter()
+
 from flask import Flask
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from backend.app.api.chat import chat_bp
+from backend.app.api.health import health_bp
 from backend.app.api.knowledge_graph import kg_bp
+from backend.app.api.metrics import metrics_bp
+from backend.app.api.search import search_bp
+from backend.app.service.startup import STARTUP_SECONDS, WARMUP
+from backend.app.service.tracing import init_request_tracing
+
+# 应用包(含各蓝图及其依赖)的导入耗时
+IMPORT_SECONDS=time.perf_counter()-_import_start
 
 def create_app():
+    start=time.perf_counter()
+    # LOG_LEVEL=DEBUG 时输出各阶段耗时明细
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=os.getenv('LOG_LEVEL','INFO').upper(),
+                            format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+
     app=Flask(__name__)
+    # 前面的反向代理层数(如 nginx 为 1),按 X-Forwarded-For 中代理追加的地址还原 remote_addr;
+    # 为 0 时不信任任何转发头
+    trusted_proxies=int(os.getenv('TRUSTED_PROXIES','0'))
+    if trusted_proxies>0:
+        app.wsgi_app=ProxyFix(app.wsgi_app,x_for=trusted_proxies,x_proto=trusted_proxies)
     CORS(app,supports_credentials=True)
+    init_request_tracing(app)
 
     app.register_blueprint(chat_bp,url_prefix='/chat')
     app.register_blueprint(kg_bp,url_prefix='/knowledge_graph')
-    return app
\ No newline at end of file
+    app.register_blueprint(search_bp,url_prefix='/search')
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(health_bp)
+
+    # 服务构建和数据库连接放到后台预热,不阻塞 worker 启动;
+    # gunicorn --preload 时 create_app 在主进程执行,worker 收到第一个请求时再开始预热
+    app.before_request(WARMUP.ensure_started)
+    WARMUP.ensure_started()
+
+    STARTUP_SECONDS.set(round(IMPORT_SECONDS,4),phase='import')
+    STARTUP_SECONDS.set(round(time.perf_counter()-start,4),phase='create_app')
+    logging.getLogger(__name__).info("应用导入 %.1fms, create_app %.1fms",
+                                     IMPORT_SECONDS*1000,(time.perf_counter()-start)*1000)
+    return app
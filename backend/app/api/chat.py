@@ -1,31 +1,166 @@
-from flask import Blueprint,request,jsonify
+from flask import Blueprint,request,jsonify,Response,stream_with_context,url_for
+from backend.app.service.admission import AdmissionController, AdmissionRejected
+from backend.app.service.batch_qa import MAX_QUESTIONS, DEFAULT_CONCURRENCY, answer_questions_batch
+from backend.app.service.jobs import JobQueue, JobQueueFull
 from backend.app.service.kg_retrieval import KnowledgeGraphRetrieval
+from backend.app.service.startup import LazyService, register_preload
 from datetime import datetime
+import json
+import math
 import os
 
 chat_bp=Blueprint('chat',__name__)
 
-NEO4J_URI = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASSWORD = "aqzdwsfneo"
+NEO4J_URI = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
+NEO4J_USER = os.getenv('NEO4J_USERNAME', 'neo4j')
+NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', 'aqzdwsfneo')
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY') or "sk-8cbf10f456ae40aba1be330eaa3c2397"
 
-retrieval=KnowledgeGraphRetrieval(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD,DEEPSEEK_API_KEY)
+# 第一次使用(或启动预热)时才构建
+retrieval=LazyService('retrieval',lambda: KnowledgeGraphRetrieval(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD,DEEPSEEK_API_KEY))
+# 实体链接与答案验证用的图谱词表(WARMUP_PRELOAD 包含 entity_lexicon 时在预热阶段加载)
+register_preload('entity_lexicon',lambda: retrieval.lexicon.load())
+
+def _parse_question(data):
+    """校验问答请求体,返回 (message, deadline_ms, 错误信息)"""
+    user_message=str((data or {}).get('message','')).strip()
+    if not user_message:
+        return None,None,"消息不能为空"
+
+    # 可选的延迟预算(毫秒),不传时取 REQUEST_DEADLINE_MS
+    deadline_ms=data.get('deadline_ms')
+    if deadline_ms is not None and (isinstance(deadline_ms,bool) or not isinstance(deadline_ms,(int,float))):
+        return None,None,"deadline_ms 必须是数字"
+    return user_message,deadline_ms,None
+
+
+def _answer(user_message,deadline_ms):
+    response=retrieval.controlled_generation_with_subgraph(user_message,use_consistency=True,use_reasoning=True,
+                                                          deadline_ms=deadline_ms)
+    return {
+        "response":response['answer'],
+        "skipped_stages":response['budget']['skipped'],
+        "timestamp":datetime.utcnow().isoformat()
+    }
+
+
+# 问答准入控制: 客户端令牌桶 + 并发上限与有界等待队列
+admission=AdmissionController()
+# 按 Key 单独限流的 API Key(逗号分隔);未配置或不在其中的 Key 按来源地址限流
+CHAT_API_KEYS=frozenset(key.strip() for key in os.getenv('CHAT_API_KEYS','').split(',') if key.strip())
+
+
+def _client_key():
+    """
+    限流用的客户端标识: 已配置的 API Key 优先,其次是来源地址
+    (部署在反向代理后时由 TRUSTED_PROXIES 启用 ProxyFix,remote_addr 即代理记录的客户端地址;
+    不直接读取客户端可以任意填写的 X-Real-IP / X-Forwarded-For)
+    """
+    api_key=request.headers.get('X-API-Key')
+    if api_key and api_key in CHAT_API_KEYS:
+        return f"key:{api_key}"
+    return f"ip:{request.remote_addr}"
+
+
+def _rejected(e):
+    return jsonify({"error":str(e)}),e.status,{'Retry-After':str(max(1,math.ceil(e.retry_after)))}
+
+
+# 异步问答任务由本进程的有界线程池执行,任务状态在本机 worker 之间共享
+jobs=JobQueue(lambda payload: _answer(payload['message'],payload.get('deadline_ms')))
+
 
 @chat_bp.route('/answer_questions',methods=['POST'])
 def chat():
     try:
-        data=request.get_json()
-        user_message=data.get('message','').strip()
-
-        if not user_message:
-            return jsonify({"error":"消息不能为空"}),400
-
-        response=retrieval.controlled_generation_with_subgraph(user_message,use_consistency=True,use_reasoning=True)
-        return jsonify({
-            "response":response['answer'],
-            "timestamp":datetime.utcnow().isoformat()
-        })
+        user_message,deadline_ms,error=_parse_question(request.get_json(silent=True))
+        if error:
+            return jsonify({"error":error}),400
+        with admission.admit(_client_key()):
+            return jsonify(_answer(user_message,deadline_ms))
 
+    except AdmissionRejected as e:
+        return _rejected(e)
     except Exception as e:
         return jsonify({"error":f"处理问答消息时出错{str(e)}"}),500
+
+
+@chat_bp.route('/jobs',methods=['POST'])
+def submit_job():
+    """
+    提交异步问答任务,立即返回任务ID,结果通过 GET /chat/jobs/<job_id> 查询
+    请求体与 /chat/answer_questions 相同: {"message": ..., "deadline_ms": ...}
+    """
+    user_message,deadline_ms,error=_parse_question(request.get_json(silent=True))
+    if error:
+        return jsonify({"error":error}),400
+    try:
+        # 任务与同步问答共用客户端令牌桶;并发由任务线程池限制
+        admission.check_rate(_client_key())
+        job_id=jobs.submit({'message':user_message,'deadline_ms':deadline_ms})
+    except AdmissionRejected as e:
+        return _rejected(e)
+    except JobQueueFull as e:
+        return jsonify({"error":f"问答任务繁忙,请稍后重试({e})"}),503,{'Retry-After':'5'}
+    return jsonify({"job_id":job_id,"status":"queued"}),202,{'Location':url_for('chat.get_job',job_id=job_id)}
+
+
+@chat_bp.route('/jobs/<job_id>',methods=['GET'])
+def get_job(job_id):
+    """
+    查询问答任务: status 为 queued / running / done / failed,done 时 result 与 /chat/answer_questions 的响应相同;
+    ?wait=秒 时长轮询,任务在等待期间结束则立即返回
+    """
+    try:
+        wait=float(request.args.get('wait',0))
+    except ValueError:
+        return jsonify({"error":"wait 必须是数字"}),400
+    if not math.isfinite(wait):
+        return jsonify({"error":"wait 必须是有限的数字"}),400
+    job=jobs.get(job_id,wait=wait)
+    if job is None:
+        return jsonify({"error":"任务不存在或已过期"}),404
+    return jsonify(job)
+
+
+@chat_bp.route('/answer_questions_batch',methods=['POST'])
+def chat_batch():
+    """
+    批量问答,按完成顺序以 NDJSON 流式返回,每行一个结果,最后一行为 summary
+    请求体: {"questions": [...], "concurrency": 4, "use_consistency": true, "use_reasoning": true}
+    """
+    data=request.get_json(silent=True) or {}
+    questions=data.get('questions')
+    if not isinstance(questions,list) or not questions:
+        return jsonify({"error":"questions 必须是非空数组"}),400
+    if len(questions)>MAX_QUESTIONS:
+        return jsonify({"error":f"单次最多 {MAX_QUESTIONS} 个问题"}),400
+
+    try:
+        concurrency=int(data.get('concurrency',DEFAULT_CONCURRENCY))
+    except (TypeError,ValueError):
+        return jsonify({"error":"concurrency 必须是整数"}),400
+    concurrency=min(max(concurrency,1),DEFAULT_CONCURRENCY*4)
+    if admission.max_concurrent>0:
+        # 并发不超过准入上限,批量请求自己的问题不会互相挤出等待队列
+        concurrency=min(concurrency,admission.max_concurrent)
+    try:
+        # 按问题数扣除客户端令牌;检索准备与每个在途问题各占用一个执行名额,与同步问答共用并发上限
+        admission.check_rate(_client_key(),cost=len(questions))
+    except AdmissionRejected as e:
+        return _rejected(e)
+    results=answer_questions_batch(retrieval.get(),[str(q) for q in questions],
+                                   concurrency=concurrency,
+                                   use_consistency=bool(data.get('use_consistency',True)),
+                                   use_reasoning=bool(data.get('use_reasoning',True)),
+                                   slot=admission.slot)
+
+    def generate():
+        try:
+            for item in results:
+                yield json.dumps(item,ensure_ascii=False)+'\n'
+        except Exception as e:
+            # 响应头已发出,以一行错误结束流
+            yield json.dumps({"error":f"批量问答出错{str(e)}"},ensure_ascii=False)+'\n'
+
+    return Response(stream_with_context(generate()),mimetype='application/x-ndjson')
@@ -0,0 +1,16 @@
+from flask import Blueprint,jsonify
+from backend.app.service.startup import WARMUP
+
+health_bp=Blueprint('health',__name__)
+
+@health_bp.route('/healthz',methods=['GET'])
+def healthz():
+    """存活检查: 进程能处理请求即返回 200"""
+    return jsonify({"status":"alive"})
+
+@health_bp.route('/ready',methods=['GET'])
+def ready():
+    """就绪检查: 后台预热(服务构建、图存储连接)完成前返回 503"""
+    WARMUP.ensure_started()
+    status=WARMUP.status()
+    return jsonify(status),(200 if status['ready'] else 503)
@@ -1,5 +1,7 @@
 from flask import Blueprint,jsonify,request
 from backend.app.service.kg import Neo4jKnowledgeGraph
+from backend.app.service.startup import LazyService,register_preload
+from backend.app.service.suggest import DEFAULT_LIMIT,MAX_LIMIT
 import os
 
 kg_bp=Blueprint('knowledge_graph',__name__)
@@ -9,7 +11,10 @@ NEO4J_URI = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
 NEO4J_USERNAME = os.getenv('NEO4J_USERNAME', 'neo4j')
 NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', 'aqzdwsfneo')
 
-graph_db=Neo4jKnowledgeGraph(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)
+# 第一次使用(或启动预热)时才构建
+graph_db=LazyService('graph_db',lambda: Neo4jKnowledgeGraph(NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD))
+# 联想索引(WARMUP_PRELOAD 包含 suggest_index 时在预热阶段构建)
+register_preload('suggest_index',lambda: graph_db.suggest_index.get())
 
 @kg_bp.route('/test_connection', methods=["GET"])
 def test_connection():
@@ -35,18 +40,46 @@ def get_kg():
     except Exception as e:
         print(f"获取知识图谱失败{str(e)}")
 
+@kg_bp.route('/suggest', methods=['GET'])
+def suggest():
+    """输入联想: q 为输入的前缀(名称、别名或拼音),limit 为返回条数"""
+    prefix = request.args.get('q', default='').strip()
+    limit = request.args.get('limit', default=DEFAULT_LIMIT, type=int)
+    if not 1 <= limit <= MAX_LIMIT:
+        return jsonify({"error": f"limit 取 1-{MAX_LIMIT}"}), 400
+    if not prefix:
+        return jsonify({"query": prefix, "suggestions": []})
+    try:
+        suggestions = graph_db.suggest(prefix, limit=limit)
+    except Exception as e:
+        return jsonify({"error": f"联想失败{str(e)}"}), 500
+    return jsonify({"query": prefix, "suggestions": suggestions})
+
+@kg_bp.route('/query_stats', methods=['GET'])
+def query_stats():
+    """Cypher 剖析统计,按总耗时降序"""
+    stats = graph_db.query_stats()
+    if stats is None:
+        return jsonify({
+            "enabled": False,
+            "message": "未开启查询剖析,请设置 NEO4J_PROFILE=summary 或 profile"
+        })
+    limit = request.args.get('limit', default=50, type=int)
+    return jsonify({
+        "enabled": True,
+        "templates": stats[:limit]
+    })
+
 @kg_bp.route('/neo4j/status', methods=['GET'])
 def neo4j_status():
     try:
         if graph_db:
-            with graph_db.driver.session() as session:
-                result = session.run("RETURN 1 as test")
-                record = result.single()
-                return jsonify({
-                    "status": "connected",
-                    "uri": NEO4J_URI,
-                    "message": "Neo4j连接正常"
-                })
+            graph_db.status()
+            return jsonify({
+                "status": "connected",
+                "uri": NEO4J_URI,
+                "message": "Neo4j连接正常"
+            })
         else:
             return jsonify({
                 "status": "disconnected",
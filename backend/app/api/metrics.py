@@ -0,0 +1,8 @@
+from flask import Blueprint,Response
+from backend.app.service.metrics import REGISTRY
+
+metrics_bp=Blueprint('metrics',__name__)
+
+@metrics_bp.route('/metrics',methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(),mimetype='text/plain; version=0.0.4; charset=utf-8')
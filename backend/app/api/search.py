@@ -1,7 +1,46 @@
-from flask import Blueprint,jsonify
+from flask import Blueprint,jsonify,request
+from backend.app.api.knowledge_graph import graph_db
+from backend.app.service.search_index import MAX_PAGE_SIZE
+from backend.app.service.startup import register_preload
+import time
 
 search_bp=Blueprint('search',__name__)
 
-@search_bp.route('/knowledge_search',methods=['POST'])
+# 检索索引(WARMUP_PRELOAD 包含 search_index 时在预热阶段构建)
+register_preload('search_index',lambda: graph_db.search_index.get())
+
+@search_bp.route('/knowledge_search',methods=['GET','POST'])
 def knowledge_search():
-    return jsonify("返回的搜索内容"),400
\ No newline at end of file
+    """
+    知识检索: 节点名称、别名与文本属性上的 BM25 检索
+    参数(POST JSON 或 GET 查询参数): query 检索词, types 节点类型列表(GET 时逗号分隔), page 页码(从 1 开始), page_size 每页条数
+    """
+    data=(request.get_json(silent=True) or {}) if request.method=='POST' else request.args
+    query=str(data.get('query') or '').strip()
+    if not query:
+        return jsonify({"error":"检索词不能为空"}),400
+
+    types=data.get('types')
+    if isinstance(types,str):
+        types=[t for t in types.split(',') if t]
+    if types is not None and not isinstance(types,list):
+        return jsonify({"error":"types 必须是类型列表"}),400
+    try:
+        page=int(data.get('page',1))
+        page_size=int(data.get('page_size',20))
+    except (TypeError,ValueError):
+        return jsonify({"error":"page / page_size 必须是整数"}),400
+    if page<1 or not 1<=page_size<=MAX_PAGE_SIZE:
+        return jsonify({"error":f"page 从 1 开始, page_size 取 1-{MAX_PAGE_SIZE}"}),400
+
+    start=time.perf_counter()
+    try:
+        result=graph_db.search(query,types=types,page=page,page_size=page_size)
+    except Exception as e:
+        return jsonify({"error":f"检索失败{str(e)}"}),500
+    for item in result['results']:
+        # 前端按 details 展示节点属性
+        item['details']=item['properties']
+    result['query']=query
+    result['took_ms']=round((time.perf_counter()-start)*1000,2)
+    return jsonify(result)
@@ -0,0 +1,167 @@
+"""
+问答接口准入控制
+
+流量高峰时在途问题不受限制,DeepSeek 配额和 Neo4j 连接池同时被耗尽,所有请求一起变慢。
+AdmissionController 在问答前依次检查:
+1. 客户端令牌桶: 每个客户端(已配置的 X-API-Key,没有时按来源地址)每秒补充 CHAT_CLIENT_RATE 个令牌,
+   最多积攒 CHAT_CLIENT_BURST 个,令牌不足时立即拒绝(429);批量请求按问题数扣除令牌,
+   超过桶容量的部分记为欠额,补足之前该客户端的请求都被拒绝
+2. 并发上限: 同时执行的问题最多 CHAT_MAX_CONCURRENT 个,超出时进入等待队列;
+   队列最多 CHAT_MAX_WAITING 个,已满或等待超过 CHAT_ADMISSION_WAIT_MS 时拒绝(503)
+被准入的请求不与超量请求争抢下游资源,过载时延迟保持稳定,超出的部分快速失败。
+
+限制按进程生效(与 gunicorn 的其他进程内状态一致),整机上限为 worker 数乘以各项配置;
+同步 worker 每个进程只处理一个请求,并发上限需配合 --threads 使用。
+
+    with admission.admit(client_key):
+        ...
+
+    admission.check_rate(client_key, cost=len(questions))    # 批量问答: 先按问题数扣令牌
+    with admission.slot():                                     # 再为每个在途问题占用执行名额
+        ...
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from backend.app.service.metrics import REGISTRY
+
+DEFAULT_MAX_CONCURRENT = int(os.getenv('CHAT_MAX_CONCURRENT', '8'))
+DEFAULT_MAX_WAITING = int(os.getenv('CHAT_MAX_WAITING', '8'))
+DEFAULT_WAIT_MS = float(os.getenv('CHAT_ADMISSION_WAIT_MS', '2000'))
+DEFAULT_CLIENT_RATE = float(os.getenv('CHAT_CLIENT_RATE', '1'))
+DEFAULT_CLIENT_BURST = float(os.getenv('CHAT_CLIENT_BURST', '10'))
+# 记录令牌桶的客户端数上限,超过时淘汰最久未访问的客户端
+MAX_CLIENTS = 10000
+
+ADMISSIONS = REGISTRY.counter(
+    'kg_admission_requests_total',
+    "问答准入结果(admitted 直接准入, queued 排队后准入, rate_limited 客户端限流, overloaded 队列已满, timeout 排队超时)",
+    ['result'])
+IN_FLIGHT = REGISTRY.gauge(
+    'kg_admission_in_flight', "本进程正在执行的问答请求数")
+WAITING = REGISTRY.gauge(
+    'kg_admission_waiting', "本进程排队等待准入的问答请求数")
+WAIT_SECONDS = REGISTRY.histogram(
+    'kg_admission_wait_seconds', "排队请求的等待时间(含超时)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+
+class AdmissionRejected(Exception):
+    """
+    Args:
+        status: 建议的 HTTP 状态码
+        retry_after: 建议的重试等待秒数
+    """
+
+    def __init__(self, message: str, status: int, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Args:
+        max_concurrent: 同时执行的请求数上限,<= 0 表示不限
+        max_waiting: 等待队列长度
+        wait_ms: 排队最长等待时间
+        rate / burst: 每个客户端的令牌补充速率(每秒)与桶容量,rate <= 0 表示不限流
+    """
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT, max_waiting: int = DEFAULT_MAX_WAITING,
+                 wait_ms: float = DEFAULT_WAIT_MS, rate: float = DEFAULT_CLIENT_RATE,
+                 burst: float = DEFAULT_CLIENT_BURST):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max(0, max_waiting)
+        self.wait = wait_ms / 1000
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._waiting = 0
+        # 客户端 -> [令牌数, 上次补充时间]
+        self._buckets: 'OrderedDict[str, list]' = OrderedDict()
+
+    def check_rate(self, client: str, cost: int = 1):
+        """
+        消耗客户端的 cost 个令牌,不足时抛出 AdmissionRejected(429);
+        cost 超过桶容量时桶满即可通过,不足的部分记为欠额
+        """
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now]
+                if len(self._buckets) > MAX_CLIENTS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            needed = min(max(1, cost), self.burst)
+            if bucket[0] < needed:
+                ADMISSIONS.inc(result='rate_limited')
+                raise AdmissionRejected("请求过于频繁", 429, (needed - bucket[0]) / self.rate)
+            bucket[0] -= max(1, cost)
+
+    def admit(self, client: str):
+        """限流检查后占用一个执行名额,退出时释放;无法准入时抛出 AdmissionRejected"""
+        self.check_rate(client)
+        return self.slot()
+
+    @contextmanager
+    def slot(self):
+        """不检查限流,只占用一个执行名额(调用方已按请求扣过令牌)"""
+        self._acquire()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                IN_FLIGHT.set(self._in_flight)
+                self._released.notify()
+
+    def _acquire(self):
+        with self._lock:
+            if self.max_concurrent <= 0 or self._in_flight < self.max_concurrent:
+                self._admitted('admitted')
+                return
+            if self._waiting >= self.max_waiting:
+                ADMISSIONS.inc(result='overloaded')
+                raise AdmissionRejected("服务繁忙", 503, self.wait or 1.0)
+
+            self._waiting += 1
+            WAITING.set(self._waiting)
+            start = time.monotonic()
+            deadline = start + self.wait
+            try:
+                while self._in_flight >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        ADMISSIONS.inc(result='timeout')
+                        raise AdmissionRejected("服务繁忙,排队超时", 503, self.wait or 1.0)
+                    self._released.wait(remaining)
+                self._admitted('queued')
+            finally:
+                self._waiting -= 1
+                WAITING.set(self._waiting)
+                WAIT_SECONDS.observe(time.monotonic() - start)
+
+    def _admitted(self, result: str):
+        # 调用方持有锁
+        self._in_flight += 1
+        IN_FLIGHT.set(self._in_flight)
+        ADMISSIONS.inc(result=result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'in_flight': self._in_flight, 'waiting': self._waiting,
+                    'max_concurrent': self.max_concurrent, 'max_waiting': self.max_waiting,
+                    'clients': len(self._buckets)}
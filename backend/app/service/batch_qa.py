@@ -0,0 +1,178 @@
+"""
+批量问答
+
+用于回归测试集、FAQ 预生成等一次回答大量问题的场景,相比逐个调用 /chat/answer_questions:
+1. 问题规范化空白后去重,重复问题只回答一次
+2. 多个问题的实体抽取合并为一次 LLM 调用(每批 extraction_batch_size 个)
+3. 实体匹配、子图扩展、推理路径查询各自合并为一次批量图查询
+4. 答案生成与验证在有界线程池中并发执行,完成一个输出一个
+
+自一致性检索在单问题路径中对同一问题以 temperature=0 采样三次,三次结果相同,
+批量路径直接用一次检索结果做一致性统计,不再重复调用。
+
+命令行用法(项目根目录下):
+    python -m backend.app.service.batch_qa questions.txt --output answers.ndjson
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.getenv('BATCH_QA_CONCURRENCY', '4'))
+DEFAULT_EXTRACTION_BATCH_SIZE = int(os.getenv('BATCH_QA_EXTRACTION_BATCH_SIZE', '20'))
+MAX_QUESTIONS = int(os.getenv('BATCH_QA_MAX_QUESTIONS', '1000'))
+
+
+def normalize_question(question: str) -> str:
+    return ' '.join(str(question).split())
+
+
+def answer_questions_batch(retrieval, questions: List[str],
+                           concurrency: int = DEFAULT_CONCURRENCY,
+                           use_consistency: bool = True,
+                           use_reasoning: bool = True,
+                           extraction_batch_size: int = DEFAULT_EXTRACTION_BATCH_SIZE,
+                           slot: Callable[[], ContextManager] = nullcontext) -> Iterator[Dict[str, Any]]:
+    """
+    批量回答问题,按完成顺序逐条产出结果
+    Args:
+        retrieval: KnowledgeGraphRetrieval
+        questions: 问题列表
+        concurrency: 并发生成的线程数
+        slot: 执行名额(如 AdmissionController.slot),检索准备阶段与每个问题的生成各占用一个;
+            无法获得名额时抛出的异常作为该问题的错误返回
+    Yields:
+        {'index', 'question', 'answer', 'validation_score', 'entities'}(重复问题附带 duplicate_of,
+        失败时为 {'index', 'question', 'error'}),最后一条为 {'summary': {...}}
+    """
+    start = time.perf_counter()
+
+    # 1. 去重: 规范化后的问题 -> 原始下标
+    positions: Dict[str, List[int]] = {}
+    for index, question in enumerate(questions):
+        normalized = normalize_question(question)
+        if normalized:
+            positions.setdefault(normalized, []).append(index)
+    unique = list(positions)
+
+    extraction_batch_size = max(1, extraction_batch_size)
+    with slot():
+        # 2. 批量实体抽取
+        entity_lists: List[List[str]] = []
+        for i in range(0, len(unique), extraction_batch_size):
+            entity_lists.extend(retrieval._extract_entities_batch(unique[i:i + extraction_batch_size]))
+
+        # 3. 批量匹配与扩展,一致性统计
+        seed_groups = retrieval._find_matching_nodes_batch(entity_lists)
+        top_k = 8 if use_consistency else 10
+        subgraphs = retrieval._expand_subgraphs_batch(seed_groups, max_depth=2, top_k=top_k)
+        consistency_infos = [''] * len(unique)
+        if use_consistency:
+            for i, (question, subgraph) in enumerate(zip(unique, subgraphs)):
+                subgraphs[i] = retrieval._aggregate_consistency(question, [subgraph] * 3)['consistent_subgraph']
+                consistency_infos[i] = retrieval._format_consistency_info(subgraphs[i])
+
+        # 4. 批量推理链
+        if use_reasoning:
+            chain_lists = retrieval._reasoning_chains_batch(entity_lists, max_hops=3)
+        else:
+            chain_lists = [[] for _ in unique]
+
+    prepared_ms = (time.perf_counter() - start) * 1000
+    logger.info("批量问答: %d 个问题(去重后 %d 个),检索准备 %.1fms",
+                len(questions), len(unique), prepared_ms)
+
+    def answer(i: int) -> Dict[str, Any]:
+        with slot():
+            return retrieval._answer_with_subgraph(unique[i], subgraphs[i], chain_lists[i], consistency_infos[i])
+
+    # 5. 有界并发生成
+    answered = failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='batch-qa') as pool:
+        futures = {pool.submit(answer, i): i for i in range(len(unique))}
+        for future in as_completed(futures):
+            i = futures[future]
+            question = unique[i]
+            first, *duplicates = positions[question]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning("批量问答第 %d 题失败: %s", first, e)
+                failed += 1
+                for index in positions[question]:
+                    yield {'index': index, 'question': questions[index], 'error': str(e)}
+                continue
+
+            answered += 1
+            item = {
+                'index': first,
+                'question': questions[first],
+                'answer': result['answer'],
+                'validation_score': result['validation']['overall_score'],
+                'entities': entity_lists[i]
+            }
+            yield item
+            for index in duplicates:
+                yield dict(item, index=index, question=questions[index], duplicate_of=first)
+
+    yield {'summary': {
+        'questions': len(questions),
+        'unique': len(unique),
+        'answered': answered,
+        'failed': failed,
+        'extraction_batches': (len(unique) + extraction_batch_size - 1) // extraction_batch_size,
+        'prepare_ms': round(prepared_ms, 1),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
+    }}
+
+
+def load_questions(path: str) -> List[str]:
+    """读取问题文件: JSON 数组,或每行一个问题的文本"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if path.endswith('.json'):
+        return [str(question) for question in json.loads(content)]
+    return [line.strip() for line in content.splitlines() if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量问答,结果按 NDJSON 输出")
+    parser.add_argument('questions', help="问题文件: .json 数组或每行一个问题")
+    parser.add_argument('--output', default='-', help="输出文件,默认标准输出")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--extraction-batch-size', type=int, default=DEFAULT_EXTRACTION_BATCH_SIZE)
+    parser.add_argument('--no-consistency', action='store_true')
+    parser.add_argument('--no-reasoning', action='store_true')
+    args = parser.parse_args()
+
+    from backend.app.service.kg_retrieval import KnowledgeGraphRetrieval
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), stream=sys.stderr)
+    retrieval = KnowledgeGraphRetrieval(os.getenv('NEO4J_URI', 'bolt://localhost:7687'),
+                                        os.getenv('NEO4J_USERNAME', 'neo4j'),
+                                        os.getenv('NEO4J_PASSWORD', 'aqzdwsfneo'),
+                                        os.getenv('DEEPSEEK_API_KEY'))
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        for item in answer_questions_batch(retrieval, load_questions(args.questions),
+                                           concurrency=args.concurrency,
+                                           use_consistency=not args.no_consistency,
+                                           use_reasoning=not args.no_reasoning,
+                                           extraction_batch_size=args.extraction_batch_size):
+            output.write(json.dumps(item, ensure_ascii=False) + '\n')
+            output.flush()
+    finally:
+        retrieval.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
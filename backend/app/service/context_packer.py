@@ -0,0 +1,276 @@
+"""
+按 token 预算打包生成提示词中的图谱上下文
+
+_generate_with_hard_constraints 的提示词由三部分可变内容组成: 允许的实体列表、允许的关系列表、
+结构化知识(实体属性、知识关联路径、推理链)。子图越大提示词越长,生成越慢越贵。
+ContextPacker 对这些内容按与问题的相关度和一致性打分,去掉重复的事实,
+按分数从高到低放入预算,并报告被舍弃的条目数。
+
+打分:
+- 相关度: 名称完整出现在问题中记 1,否则为名称字二元组在问题中的覆盖率,与子图排序给出的
+  PPR 得分('rank')取较大者;问题提到"用药""检查"等类别词时,对应类型的实体加分
+- 一致性: 自一致性检索给出的 consistency(没有时为 0)
+去重:
+- 关系列表按 (起点, 类型, 终点) 去重
+- 单跳路径与关系列表中的事实相同,不再放入知识关联部分;描述相同的路径只保留一条
+- 放入的知识卡片(knowledge_cards)已包含的实体行与关系不再单独放入
+预算按字符估算 token(中文每字约 1 个,其余每 4 个字符约 1 个),只计可变内容,不含提示词模板。
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from backend.app.service.metrics import REGISTRY
+
+CONTEXT_TOKENS = REGISTRY.histogram(
+    'kg_context_tokens', "生成提示词中图谱上下文的估算 token 数", [],
+    buckets=(100, 200, 400, 800, 1200, 1600, 2400, 3200, 4800, 6400))
+CONTEXT_DROPPED = REGISTRY.counter(
+    'kg_context_dropped_total', "因超出 token 预算被舍弃的上下文条目数", ['kind'])
+
+DEFAULT_BUDGET = int(os.getenv('GENERATION_CONTEXT_TOKENS', '1200'))
+
+# 问题中的类别词 -> 对应实体类型
+TYPE_HINTS = {
+    '药物': ('药', '剂量', '给药'),
+    '检查': ('检查', '诊断', '化验'),
+    '治疗': ('治疗', '处理', '抢救', '处置'),
+    '并发症': ('并发症', '风险', '后果'),
+    '生命体征': ('指标', '体征', '监测'),
+}
+
+# 关系类型 -> 终点实体类型,用于关系的类别加分
+RELATION_TARGET_TYPES = {
+    '需要治疗': '治疗',
+    '需要检查': '检查',
+    '使用药物': '药物',
+    '监测指标': '生命体征',
+    '引起并发症': '并发症',
+}
+
+_CJK = re.compile(r'[㐀-鿿豈-﫿]')
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _bigrams(text: str) -> Set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+class ContextPacker:
+    """
+    Args:
+        budget_tokens: 可变上下文的 token 预算
+        relevance_weight / consistency_weight / type_weight: 打分权重
+    """
+
+    def __init__(self, budget_tokens: int = DEFAULT_BUDGET, relevance_weight: float = 0.5,
+                 consistency_weight: float = 0.3, type_weight: float = 0.2):
+        self.budget_tokens = budget_tokens
+        self.relevance_weight = relevance_weight
+        self.consistency_weight = consistency_weight
+        self.type_weight = type_weight
+
+    # ========== 打分 ==========
+
+    @staticmethod
+    def _relevance(name: str, query: str, query_bigrams: Set[str]) -> float:
+        if not name:
+            return 0.0
+        if name in query:
+            return 1.0
+        grams = _bigrams(name)
+        return len(grams & query_bigrams) / len(grams)
+
+    def _score(self, relevance: float, consistency: float, type_match: bool) -> float:
+        return (self.relevance_weight * relevance + self.consistency_weight * consistency
+                + (self.type_weight if type_match else 0.0))
+
+    # ========== 格式化(与 _format_subgraph_with_reasoning 的行格式一致) ==========
+
+    @staticmethod
+    def _node_line(node: Dict) -> str:
+        props = node.get('properties', {}) or {}
+        consistency = node.get('consistency', 0)
+        valid_props = {k: v for k, v in props.items() if k not in ['id', 'name'] and v}
+        line = f"  - {node['name']}"
+        if valid_props:
+            line += f" ({', '.join(f'{k}:{v}' for k, v in valid_props.items())})"
+        if consistency > 0:
+            line += f" [一致性:{consistency:.0%}]"
+        return line
+
+    @staticmethod
+    def _path_line(path: Dict) -> str:
+        consistency = path.get('consistency', 0)
+        if consistency > 0:
+            return f"  {path['description']} [一致性:{consistency:.0%}]"
+        return f"  {path['description']}"
+
+    @staticmethod
+    def _chain_lines(chain: Dict) -> List[str]:
+        path = chain['path']
+        lines = [f"\n从 {chain['from']} 到 {chain['to']} 的推理:"]
+        for i in range(len(path['relations'])):
+            lines.append(f"  步骤{i + 1}: {path['nodes'][i]} "
+                         f"--[{path['relations'][i]}]--> {path['nodes'][i + 1]}")
+        return lines
+
+    # ========== 打包 ==========
+
+    def pack(self, query: str, subgraph: Dict, reasoning_chains: List[Dict],
+             budget_tokens: Optional[int] = None, cards: List[Dict] = ()) -> Dict[str, Any]:
+        """
+        Args:
+            cards: 匹配节点的知识卡片,按优先级排列,在推理链之后优先放入
+        Returns:
+            {'knowledge': 结构化知识文本, 'allowed_entities': [...], 'allowed_relations': [...],
+             'tokens': 估算 token 数, 'budget': 预算, 'cards': 放入的卡片,
+             'dropped': {'nodes', 'relationships', 'paths', 'reasoning_chains', 'cards'}, 'deduplicated': 去重条目数}
+        """
+        budget = self.budget_tokens if budget_tokens is None else budget_tokens
+        query_bigrams = _bigrams(query)
+        hinted_types = {t for t, words in TYPE_HINTS.items() if any(w in query for w in words)}
+
+        nodes_by_name: Dict[str, Dict] = {}
+        for node in subgraph['nodes']:
+            nodes_by_name.setdefault(node['name'], node)
+
+        relevance = {name: max(self._relevance(name, query, query_bigrams), node.get('rank', 0))
+                     for name, node in nodes_by_name.items()}
+
+        def name_relevance(name: str) -> float:
+            if name not in relevance:
+                relevance[name] = self._relevance(name, query, query_bigrams)
+            return relevance[name]
+
+        # 候选条目: (分数, 类别, 条目, 需要的实体名)
+        candidates: List[Tuple[float, str, Any, Tuple[str, ...]]] = []
+        for name, node in nodes_by_name.items():
+            score = self._score(relevance[name], node.get('consistency', 0), node['type'] in hinted_types)
+            candidates.append((score, 'nodes', node, (name,)))
+
+        facts: Dict[Tuple[str, str, str], Dict] = {}
+        duplicates = 0
+        for rel in subgraph['relationships']:
+            key = (rel['from_name'], rel['type'], rel['to_name'])
+            if key in facts:
+                duplicates += 1
+                continue
+            facts[key] = rel
+            score = self._score(max(name_relevance(key[0]), name_relevance(key[2])), rel.get('consistency', 0),
+                                RELATION_TARGET_TYPES.get(rel['type']) in hinted_types)
+            candidates.append((score, 'relationships', rel, (key[0], key[2])))
+
+        seen_paths: Set[str] = set()
+        for path in subgraph['paths']:
+            if len(path['relationships']) <= 1 or path['description'] in seen_paths:
+                duplicates += 1
+                continue
+            seen_paths.add(path['description'])
+            names = tuple(node['name'] for node in path['nodes'])
+            types = {rel['type'] for rel in path['relationships']}
+            score = self._score(max(max(name_relevance(name) for name in names), path.get('rank', 0)),
+                                path.get('consistency', 0),
+                                any(RELATION_TARGET_TYPES.get(t) in hinted_types for t in types))
+            # 同等相关度下短路径优先
+            candidates.append((score - 0.02 * len(path['relationships']), 'paths', path, names))
+
+        candidates.sort(key=lambda item: item[0], reverse=True)
+
+        # 推理链是专门为本问题计算的,优先放入
+        used = 0
+        entities: Dict[str, None] = {}
+        selected = {'nodes': [], 'relationships': [], 'paths': [], 'reasoning_chains': [], 'cards': []}
+        dropped = {'nodes': 0, 'relationships': 0, 'paths': 0, 'reasoning_chains': 0, 'cards': 0}
+
+        def entity_cost(names) -> int:
+            return sum(estimate_tokens(name) + 1 for name in dict.fromkeys(names) if name not in entities)
+
+        def take(kind: str, item: Any, names, text_cost: int) -> bool:
+            nonlocal used
+            cost = text_cost + entity_cost(names)
+            if budget and used + cost > budget:
+                dropped[kind] += 1
+                return False
+            used += cost
+            for name in names:
+                entities.setdefault(name)
+            selected[kind].append(item)
+            return True
+
+        for chain in reasoning_chains:
+            lines = self._chain_lines(chain)
+            take('reasoning_chains', chain, chain['path']['nodes'],
+                 sum(estimate_tokens(line) for line in lines))
+
+        # 卡片的 tokens 已包含其事实对应的允许关系行
+        card_subjects: Set[Tuple[str, str]] = set()
+        card_facts: Set[Tuple[str, str, str]] = set()
+        for card in cards:
+            if take('cards', card, card['entities'], card['tokens']):
+                card_subjects.add((card['type'], card['name']))
+                card_facts.update(tuple(fact) for fact in card['facts'])
+
+        for _, kind, item, names in candidates:
+            if kind == 'nodes' and (item['type'], item['name']) in card_subjects:
+                duplicates += 1
+                continue
+            if kind == 'relationships' and (item['from_name'], item['type'], item['to_name']) in card_facts:
+                duplicates += 1
+                continue
+            if kind == 'nodes':
+                cost = estimate_tokens(self._node_line(item))
+            elif kind == 'relationships':
+                cost = estimate_tokens(f"{item['from_name']} → {item['type']} → {item['to_name']}")
+            else:
+                cost = estimate_tokens(self._path_line(item))
+            take(kind, item, names, cost)
+
+        knowledge = self._render(selected)
+        allowed_relations = list(dict.fromkeys(
+            [f"{start} → {rel_type} → {end}" for card in selected['cards'] for start, rel_type, end in card['facts']]
+            + [f"{rel['from_name']} → {rel['type']} → {rel['to_name']}" for rel in selected['relationships']]))
+
+        CONTEXT_TOKENS.observe(used)
+        for kind, count in dropped.items():
+            if count:
+                CONTEXT_DROPPED.inc(count, kind=kind)
+
+        return {
+            'knowledge': knowledge,
+            'allowed_entities': list(entities),
+            'allowed_relations': allowed_relations,
+            'tokens': used,
+            'budget': budget,
+            'cards': selected['cards'],
+            'dropped': dropped,
+            'deduplicated': duplicates
+        }
+
+    def _render(self, selected: Dict[str, List]) -> str:
+        knowledge_parts = []
+        if selected['cards']:
+            knowledge_parts.append("【实体知识卡片】")
+            knowledge_parts.extend(card['text'] for card in selected['cards'])
+            knowledge_parts.append("")
+        knowledge_parts.append("【相关医疗实体】")
+        nodes_by_type: Dict[str, List[Dict]] = {}
+        for node in selected['nodes']:
+            nodes_by_type.setdefault(node['type'], []).append(node)
+        for node_type, nodes in nodes_by_type.items():
+            knowledge_parts.append(f"\n{node_type}:")
+            knowledge_parts.extend(self._node_line(node) for node in nodes)
+
+        knowledge_parts.append("\n【医疗知识关联】")
+        knowledge_parts.extend(self._path_line(path) for path in selected['paths'])
+
+        if selected['reasoning_chains']:
+            knowledge_parts.append("\n【推理链】")
+            for chain in selected['reasoning_chains']:
+                knowledge_parts.extend(self._chain_lines(chain))
+
+        return '\n'.join(knowledge_parts)
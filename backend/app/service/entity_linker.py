@@ -0,0 +1,194 @@
+"""
+本地实体链接
+
+问题中的实体先在本地链接到图谱,只有置信度不足时才调用 LLM 提取:
+1. 精确匹配: 用图谱词表(名称与别名)对问题做最长匹配,命中的得分为 1
+2. 模糊匹配: 去掉精确命中部分后,剩余文本按标点和常见疑问/虚词切成片段,
+   每个含两个及以上汉字的片段在名称与别名的字符 n-gram(1-2 字)TF-IDF 向量上做余弦 top-k 检索,
+   得分不低于阈值的最佳候选记为链接结果(可处理简称、错别字等)
+置信度为已链接实体得分的最小值;没有链接到实体时为最佳候选的得分(没有候选为 0)。
+
+TF-IDF 矩阵按列(n-gram)存储为 CSC 形式的 NumPy 数组,查询只取问题中出现的 n-gram 的列,
+用 np.bincount 累加得到所有名称的点积,不需要 SciPy。
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.app.service.lexicon import GraphLexicon, Lexicon, find_spans
+from backend.app.service.metrics import REGISTRY
+
+DEFAULT_THRESHOLD = float(os.getenv('ENTITY_LINK_THRESHOLD', '0.45'))
+DEFAULT_TOP_K = int(os.getenv('ENTITY_LINK_TOP_K', '5'))
+
+NGRAM_RANGE = (1, 2)
+
+LINKS = REGISTRY.counter(
+    'kg_entity_linking_total', "问题实体的来源: local 本地链接, llm 调用 LLM, fallback 图谱匹配", ['source'])
+LINK_CONFIDENCE = REGISTRY.histogram(
+    'kg_entity_link_confidence', "本地实体链接的置信度", [],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+
+# 模糊匹配前从剩余文本中切除的疑问词与虚词(长词在前)
+_STOPWORDS = sorted((
+    '为什么', '是什么', '什么', '怎么办', '怎么', '怎样', '如何', '哪些', '哪个', '多少', '是否', '能否',
+    '需要', '应该', '可以', '患者', '病人', '出现', '发生', '使用', '进行', '之间', '关系', '时候',
+    '的', '了', '和', '与', '及', '或', '是', '有', '在', '时', '后', '吗', '呢', '要', '给', '用', '吃',
+), key=len, reverse=True)
+_SEGMENT_SPLIT = re.compile('|'.join([r'[\s\W_]+'] + [re.escape(word) for word in _STOPWORDS]))
+# 只对含两个及以上汉字的片段做模糊匹配,单独的数字、字母片段(如 "51")容易误配
+_CJK = re.compile(r'[㐀-鿿豈-﫿]')
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Counter:
+    low, high = ngram_range
+    return Counter(text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1))
+
+
+class CharNgramIndex:
+    """
+    字符 n-gram TF-IDF 索引(tf 取 1 + log,idf 平滑,向量按 L2 归一化)
+    Args:
+        texts: 被检索的文本(名称与别名),search 返回其下标
+    """
+
+    def __init__(self, texts: List[str], ngram_range: Tuple[int, int] = NGRAM_RANGE):
+        import numpy as np
+
+        self.ngram_range = ngram_range
+        self.size = len(texts)
+        self.vocab: Dict[str, int] = {}
+        rows, cols, counts = [], [], []
+        for row, text in enumerate(texts):
+            for gram, count in char_ngrams(text, ngram_range).items():
+                rows.append(row)
+                cols.append(self.vocab.setdefault(gram, len(self.vocab)))
+                counts.append(count)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        df = np.bincount(cols, minlength=len(self.vocab))
+        self.idf = np.log((1 + self.size) / (1 + df)) + 1
+        # 查询中出现、词表中没有的 n-gram 按 df=0 计,只影响查询向量的模长
+        self.unseen_idf = math.log(1 + self.size) + 1
+
+        values = (1 + np.log(np.asarray(counts, dtype=np.float64))) * self.idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=self.size))
+        values /= norms[rows]
+
+        order = np.argsort(cols, kind='stable')
+        self.col_rows = rows[order]
+        self.col_values = values[order]
+        self.col_ptr = np.concatenate(([0], np.cumsum(df)))
+
+    def search(self, text: str, top_k: int = DEFAULT_TOP_K) -> List[Tuple[int, float]]:
+        """余弦相似度最高的 top_k 个 [(下标, 得分)],按得分降序"""
+        import numpy as np
+
+        grams = char_ngrams(text, self.ngram_range)
+        if not grams or not self.size:
+            return []
+
+        norm = 0.0
+        row_parts, value_parts = [], []
+        for gram, count in grams.items():
+            col = self.vocab.get(gram)
+            weight = (1 + math.log(count)) * (self.idf[col] if col is not None else self.unseen_idf)
+            norm += weight * weight
+            if col is not None:
+                start, end = self.col_ptr[col], self.col_ptr[col + 1]
+                row_parts.append(self.col_rows[start:end])
+                value_parts.append(self.col_values[start:end] * weight)
+        if not row_parts:
+            return []
+
+        scores = np.bincount(np.concatenate(row_parts), weights=np.concatenate(value_parts),
+                             minlength=self.size) / math.sqrt(norm)
+        k = min(top_k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+
+class EntityLinker:
+    """
+    Args:
+        lexicon: 图谱词表
+        threshold: 模糊匹配接受的最低得分,也是调用方判断置信度是否足够的阈值
+        top_k: 每个片段检索的候选数(结果中保留以便调试)
+    """
+
+    def __init__(self, lexicon: GraphLexicon, threshold: float = DEFAULT_THRESHOLD,
+                 top_k: int = DEFAULT_TOP_K):
+        self.lexicon = lexicon
+        self.threshold = threshold
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        # n-gram 索引随词表快照一起构建(预热或后台重新加载时),请求线程直接使用
+        lexicon.derive('ngram_index', self._build_ngram_index)
+
+    @staticmethod
+    def _build_ngram_index(lexicon: Lexicon) -> Tuple[List[str], CharNgramIndex]:
+        surfaces = list(lexicon.canonical)
+        return surfaces, CharNgramIndex(surfaces)
+
+    def _ngram_index(self, lexicon: Lexicon) -> Tuple[List[str], CharNgramIndex]:
+        index = lexicon.derived.get('ngram_index')
+        if index is None:
+            # 注册之前已加载的快照: 构建一次后随快照保存
+            with self._lock:
+                index = lexicon.derived.get('ngram_index')
+                if index is None:
+                    index = lexicon.derived['ngram_index'] = self._build_ngram_index(lexicon)
+        return index
+
+    def link(self, query: str) -> Dict[str, Any]:
+        """
+        Returns:
+            {'entities': 标准名列表(按在问题中出现的顺序), 'confidence': 置信度,
+             'matches': [{'text', 'entity', 'score', 'method': 'exact'|'fuzzy', 'candidates'?}]}
+        """
+        lexicon = self.lexicon.get()
+        if lexicon is None:
+            return {'entities': [], 'confidence': 0.0, 'matches': []}
+
+        # (位置, 匹配结果)
+        matches: List[Tuple[int, Dict]] = []
+        spans = find_spans(query, [lexicon.matcher])
+        for start, end in spans:
+            text = query[start:end]
+            matches.append((start, {'text': text, 'entity': lexicon.canonical[text],
+                                    'score': 1.0, 'method': 'exact'}))
+
+        # 精确命中之间的剩余文本做模糊匹配
+        best_rejected = 0.0
+        bounds = [0] + [pos for span in spans for pos in span] + [len(query)]
+        for gap_start, gap_end in zip(bounds[::2], bounds[1::2]):
+            offset = gap_start
+            for segment in _SEGMENT_SPLIT.split(query[gap_start:gap_end]):
+                start = query.find(segment, offset) if segment else offset
+                offset = start + len(segment)
+                if len(_CJK.findall(segment)) < 2:
+                    continue
+                surfaces, index = self._ngram_index(lexicon)
+                candidates = index.search(segment, self.top_k)
+                if not candidates:
+                    continue
+                row, score = candidates[0]
+                if score < self.threshold:
+                    best_rejected = max(best_rejected, score)
+                    continue
+                matches.append((start, {
+                    'text': segment, 'entity': lexicon.canonical[surfaces[row]],
+                    'score': round(score, 4), 'method': 'fuzzy',
+                    'candidates': [(lexicon.canonical[surfaces[i]], round(s, 4)) for i, s in candidates]
+                }))
+
+        matches = [match for _, match in sorted(matches, key=lambda item: item[0])]
+        entities = list(dict.fromkeys(match['entity'] for match in matches))
+        confidence = min(match['score'] for match in matches) if matches else best_rejected
+        LINK_CONFIDENCE.observe(confidence)
+        return {'entities': entities, 'confidence': confidence, 'matches': matches}
@@ -0,0 +1,100 @@
+"""
+图版本监听
+
+构建器每个写入批次都会递增数据库中的图版本(见 store.GraphStore.graph_version),
+GraphVersionWatcher 在进程内缓存最近读到的版本,距上次读取超过 GRAPH_VERSION_POLL_SECONDS 秒时,
+由下一个调用 current() 的请求顺带重新读取(同一时刻只有一个线程读取,其余线程直接用缓存值)。
+版本变化时依次调用 on_change 注册的回调,进程内缓存据此失效。
+
+不使用后台线程,gunicorn fork 出的 worker 各自按需读取。
+
+    watcher = GraphVersionWatcher(store)
+    cache = SubgraphCache(version=watcher.current)
+    watcher.on_change(lambda old, new: lexicon.invalidate())
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.app.service.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = float(os.getenv('GRAPH_VERSION_POLL_SECONDS', '5'))
+
+GRAPH_VERSION = REGISTRY.gauge(
+    'kg_graph_version', "最近读到的图版本")
+VERSION_CHANGES = REGISTRY.counter(
+    'kg_graph_version_changes_total', "检测到的图版本变化次数")
+POLL_ERRORS = REGISTRY.counter(
+    'kg_graph_version_poll_errors_total', "读取图版本失败次数")
+
+
+def changed_counters(old: Optional[Dict[str, Any]], new: Dict[str, Any], kind: str) -> List[str]:
+    """两个版本之间累计变更计数不同的节点标签(kind='nodes')或关系类型(kind='relationships')"""
+    before = old[kind] if old else {}
+    after = new[kind]
+    return sorted(name for name in set(before) | set(after) if before.get(name) != after.get(name))
+
+
+class GraphVersionWatcher:
+    """
+    Args:
+        store: 图存储
+        interval: 两次读取图版本的最小间隔(秒),<= 0 时每次 current() 都读取
+    """
+
+    def __init__(self, store, interval: float = DEFAULT_POLL_SECONDS):
+        self.store = store
+        self.interval = interval
+        self._state: Optional[Dict[str, Any]] = None
+        self._checked_at = float('-inf')
+        self._callbacks: List[Callable[[Optional[Dict], Dict], None]] = []
+        self._lock = threading.Lock()
+
+    def on_change(self, callback: Callable[[Optional[Dict], Dict], None]):
+        """注册版本变化回调 callback(旧版本信息, 新版本信息);第一次读到版本时不回调"""
+        self._callbacks.append(callback)
+
+    def current(self) -> Optional[int]:
+        """当前图版本,从未读取成功时为 None"""
+        if time.monotonic() - self._checked_at >= self.interval:
+            # 已有版本时不等待正在进行的读取
+            if self._lock.acquire(blocking=self._state is None):
+                try:
+                    if time.monotonic() - self._checked_at >= self.interval:
+                        self.poll()
+                finally:
+                    self._lock.release()
+        return self._state['version'] if self._state is not None else None
+
+    def poll(self) -> bool:
+        """读取一次图版本,返回是否发生变化;读取失败时沿用旧版本,间隔后再试"""
+        self._checked_at = time.monotonic()
+        try:
+            state = self.store.graph_version()
+        except Exception as e:
+            POLL_ERRORS.inc()
+            logger.warning("⚠️  读取图版本失败: %s", e)
+            return False
+
+        old = self._state
+        self._state = state
+        GRAPH_VERSION.set(state['version'])
+        if old is None or old['version'] == state['version']:
+            return False
+
+        VERSION_CHANGES.inc()
+        logger.info("图版本 %d -> %d, 变化的节点类型 %s, 关系类型 %s", old['version'], state['version'],
+                    changed_counters(old, state, 'nodes'), changed_counters(old, state, 'relationships'))
+        for callback in self._callbacks:
+            try:
+                callback(old, state)
+            except Exception:
+                logger.exception("图版本变化回调出错")
+        return True
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        return self._state
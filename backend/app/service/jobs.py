@@ -0,0 +1,269 @@
+"""
+问答异步任务
+
+gunicorn 同步 worker 在整个问答期间被占用,几个慢问题就能占满全部 worker,
+连 /knowledge_graph/test_connection 都要排队。任务模式把 HTTP 请求与 LLM 延迟解耦:
+
+    POST /chat/jobs              {"message": ..., "deadline_ms": ...}  -> 202 {"job_id", "status": "queued"}
+    GET  /chat/jobs/<job_id>?wait=10                                  -> 任务状态,完成时带结果
+
+- 每个进程一个有界线程池(CHAT_JOB_WORKERS)执行任务,排队任务超过 CHAT_JOB_QUEUE_SIZE 时拒绝提交
+- 任务状态写入本机 SQLite 文件(CHAT_JOB_DB),同一台机器上的 gunicorn worker 共享,
+  轮询请求落到哪个 worker 都能查到;结果保留 CHAT_JOB_TTL 秒
+- wait > 0 时长轮询: 任务在 wait 秒内结束则立即返回,最多 CHAT_JOB_MAX_WAIT 秒
+  (同步 worker 在等待期间同样被占用,wait 宜短)
+- 执行任务的进程退出后,其未完成的任务在查询时标记为失败
+
+    jobs = JobQueue(lambda payload: {...})
+    job_id = jobs.submit({'message': '...'})
+    jobs.get(job_id, wait=5)
+"""
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from backend.app.service.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv('CHAT_JOB_WORKERS', '4'))
+DEFAULT_QUEUE_SIZE = int(os.getenv('CHAT_JOB_QUEUE_SIZE', '32'))
+DEFAULT_DB_PATH = os.getenv('CHAT_JOB_DB', 'chat_jobs.db')
+DEFAULT_TTL = float(os.getenv('CHAT_JOB_TTL', '600'))
+MAX_WAIT = float(os.getenv('CHAT_JOB_MAX_WAIT', '25'))
+
+# 长轮询查询其他进程任务状态的间隔(秒)
+POLL_SECONDS = 0.2
+# 清理过期任务的最小间隔(秒)
+PURGE_SECONDS = 60.0
+
+FINISHED = ('done', 'failed')
+
+JOBS = REGISTRY.counter(
+    'kg_chat_jobs_total', "问答任务数(submitted 已提交, rejected 队列已满, done 完成, failed 失败)", ['status'])
+QUEUE_DEPTH = REGISTRY.gauge(
+    'kg_chat_job_queue_depth', "本进程排队等待执行的问答任务数")
+RUNNING = REGISTRY.gauge(
+    'kg_chat_jobs_running', "本进程正在执行的问答任务数")
+WAIT_SECONDS = REGISTRY.histogram(
+    'kg_chat_job_wait_seconds', "问答任务从提交到开始执行的等待时间")
+RUN_SECONDS = REGISTRY.histogram(
+    'kg_chat_job_run_seconds', "问答任务的执行时间",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0))
+
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """
+    Args:
+        runner: 执行任务的函数 payload -> 可 JSON 序列化的结果
+        workers: 每个进程同时执行的任务数
+        max_queue: 每个进程排队(未开始执行)的任务数上限
+        db_path: 任务状态文件
+        ttl: 任务记录保留秒数
+    """
+
+    def __init__(self, runner: Callable[[Dict[str, Any]], Any], workers: int = DEFAULT_WORKERS,
+                 max_queue: int = DEFAULT_QUEUE_SIZE, db_path: str = DEFAULT_DB_PATH, ttl: float = DEFAULT_TTL):
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid: Optional[int] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queued = 0
+        self._running = 0
+        # 本进程任务的完成通知,长轮询据此立即返回
+        self._events: Dict[str, threading.Event] = {}
+        self._purged_at = float('-inf')
+
+    # ========== 状态存储 ==========
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程一个连接;fork 后的子进程不复用父进程的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    pid INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_jobs_created ON chat_jobs(created_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _update(self, job_id: str, **fields):
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._conn() as conn:
+            conn.execute(f"UPDATE chat_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def _purge(self, now: float):
+        if now - self._purged_at < PURGE_SECONDS:
+            return
+        self._purged_at = now
+        with self._conn() as conn:
+            deleted = conn.execute("DELETE FROM chat_jobs WHERE created_at < ?", (now - self.ttl,)).rowcount
+        if deleted:
+            logger.info("清理过期问答任务 %d 个", deleted)
+
+    # ========== 提交与执行 ==========
+
+    def _ensure_started(self):
+        # 线程池按进程创建,fork 后的子进程重新创建
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='chat-job')
+            self._queued = self._running = 0
+            self._events = {}
+            self._pid = os.getpid()
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        """提交任务,返回任务ID;本进程排队任务已满时抛出 JobQueueFull"""
+        self._ensure_started()
+        with self._lock:
+            if self._queued >= self.max_queue + max(0, self.workers - self._running):
+                JOBS.inc(status='rejected')
+                raise JobQueueFull(f"排队任务已达上限 {self.max_queue}")
+            self._queued += 1
+            QUEUE_DEPTH.set(self._queued)
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            with self._conn() as conn:
+                conn.execute("INSERT INTO chat_jobs (id, status, payload, pid, created_at) VALUES (?, ?, ?, ?, ?)",
+                             (job_id, 'queued', json.dumps(payload, ensure_ascii=False), os.getpid(), now))
+            self._events[job_id] = threading.Event()
+            self._executor.submit(self._run, job_id, payload, time.perf_counter())
+        except Exception:
+            self._events.pop(job_id, None)
+            with self._lock:
+                self._queued -= 1
+                QUEUE_DEPTH.set(self._queued)
+            raise
+        JOBS.inc(status='submitted')
+        self._purge(now)
+        return job_id
+
+    def _run(self, job_id: str, payload: Dict[str, Any], submitted: float):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            QUEUE_DEPTH.set(self._queued)
+            RUNNING.set(self._running)
+        WAIT_SECONDS.observe(time.perf_counter() - submitted)
+
+        start = time.perf_counter()
+        try:
+            self._update(job_id, status='running', started_at=time.time())
+            result = self.runner(payload)
+            self._update(job_id, status='done', result=json.dumps(result, ensure_ascii=False),
+                         finished_at=time.time())
+            JOBS.inc(status='done')
+        except Exception as e:
+            logger.warning("问答任务 %s 失败: %s", job_id, e)
+            JOBS.inc(status='failed')
+            try:
+                self._update(job_id, status='failed', error=str(e), finished_at=time.time())
+            except Exception:
+                logger.exception("记录问答任务 %s 状态失败", job_id)
+        finally:
+            RUN_SECONDS.observe(time.perf_counter() - start)
+            with self._lock:
+                self._running -= 1
+                RUNNING.set(self._running)
+            event = self._events.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    # ========== 查询 ==========
+
+    def get(self, job_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        任务状态,不存在(或已过期清理)时返回 None;wait > 0 时最多等待 wait 秒(不超过 CHAT_JOB_MAX_WAIT)
+        Returns:
+            {'job_id', 'status': queued|running|done|failed, 'created_at', 'started_at', 'finished_at',
+             'result'(done), 'error'(failed)}
+        """
+        # NaN 与任何数比较都为假,视为不等待
+        wait = wait if math.isfinite(wait) else (MAX_WAIT if wait > 0 else 0)
+        deadline = time.monotonic() + min(max(wait, 0), MAX_WAIT)
+        while True:
+            job, pid = self._load(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in FINISHED or remaining <= 0:
+                return job
+            event = self._events.get(job_id) if pid == os.getpid() else None
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(POLL_SECONDS, remaining))
+
+    def _load(self, job_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        """(任务状态, 执行任务的进程号)"""
+        row = self._conn().execute("SELECT * FROM chat_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None, None
+        pid = row['pid']
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at']
+        }
+        if job['status'] not in FINISHED and pid != os.getpid() and not _alive(pid):
+            # 执行任务的 worker 已退出(重启、超时被杀),任务不会再完成
+            job.update(status='failed', finished_at=time.time())
+            self._update(job_id, status='failed', error="执行任务的进程已退出", finished_at=job['finished_at'])
+            row = {'result': None, 'error': "执行任务的进程已退出"}
+        if job['status'] == 'done':
+            job['result'] = json.loads(row['result'])
+        elif job['status'] == 'failed':
+            job['error'] = row['error']
+        return job, pid
+
+    def stats(self) -> Dict[str, Any]:
+        """本进程的排队与执行数"""
+        with self._lock:
+            return {'queued': self._queued, 'running': self._running,
+                    'workers': self.workers, 'max_queue': self.max_queue}
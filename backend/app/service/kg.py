@@ -1,141 +1,128 @@
-from neo4j import GraphDatabase
+from backend.knowledge.graph.store import GraphStore, create_graph_store
+from backend.app.service.graph_version import GraphVersionWatcher
+from backend.app.service.search_index import GraphSearch
+from backend.app.service.suggest import DEFAULT_LIMIT as DEFAULT_SUGGEST_LIMIT, GraphSuggest
+from backend.app.service.tracing import instrument_store
+
+# 映射实体类型到颜色组
+GROUP_MAPPING = {
+    "疾病": "disease",
+    "治疗": "treatment",
+    "检查": "examination",
+    "药物": "medication",
+    "生命体征": "vital_signs",
+    "并发症": "complication"
+}
+
+# 每种实体类型在可视化中展示的属性
+NODE_DISPLAY_PROPERTY = {
+    "疾病": "严重程度",
+    "治疗": "紧急程度",
+    "检查": "检查目的",
+    "药物": "用药途径",
+    "生命体征": "正常范围",
+    "并发症": "发生率"
+}
+
+# 每种关系类型在可视化中展示的属性
+RELATIONSHIP_DISPLAY_PROPERTIES = {
+    "需要治疗": ["时机", "顺序", "条件"],
+    "需要检查": ["频率", "目的"],
+    "使用药物": ["剂量", "给药方式", "使用时机", "注意事项"],
+    "监测指标": ["监测频率", "目标值"],
+    "引起并发症": ["发生率", "条件"]
+}
 
 
 class Neo4jKnowledgeGraph:
-    def __init__(self, uri, username, password):
-        self.driver = GraphDatabase.driver(uri, auth=(username, password))
+    def __init__(self, uri, username, password, store: GraphStore = None):
+        # GRAPH_BACKEND=sqlite 时使用嵌入式存储
+        self.store = instrument_store(
+            store or create_graph_store(neo4j_uri=uri, neo4j_user=username, neo4j_password=password))
+        # 知识检索走进程内倒排索引,图版本变化后重建
+        self.graph_version = GraphVersionWatcher(self.store)
+        self.search_index = GraphSearch(self.store, self.graph_version.current)
+        self.suggest_index = GraphSuggest(self.store, self.graph_version.current)
 
     def close(self):
-        self.driver.close()
+        self.store.close()
+
+    def _format_node(self, node):
+        entity_type = node["type"]
+        display_property = NODE_DISPLAY_PROPERTY.get(entity_type)
+        return {
+            "id": node["key"],
+            "label": node["name"] or node["key"],
+            "group": GROUP_MAPPING.get(entity_type, "other"),
+            "type": entity_type,
+            "properties": node["properties"].get(display_property) if display_property else None
+        }
 
     def get_knowledge_graph(self):
-        """从 Neo4j 获取知识图谱数据"""
-        with self.driver.session() as session:
-            # 获取所有节点，适配新的实体类型
-            nodes_result = session.run("""
-                MATCH (n)
-                RETURN n.id as id, 
-                       n.name as name, 
-                       labels(n)[0] as entityType,
-                       CASE 
-                        WHEN labels(n)[0] = '疾病' THEN n.严重程度
-                        WHEN labels(n)[0] = '治疗' THEN n.紧急程度
-                        WHEN labels(n)[0] = '检查' THEN n.检查目的
-                        WHEN labels(n)[0] = '药物' THEN n.用药途径
-                        WHEN labels(n)[0] = '生命体征' THEN n.正常范围
-                        WHEN labels(n)[0] = '并发症' THEN n.发生率
-                        ELSE null
-                       END as properties
-                ORDER BY id
-            """)
-            nodes = []
-            for record in nodes_result:
-                entity_type = record["entityType"]
-                name = record["name"] or record["id"]
-
-                # 映射实体类型到颜色组
-                group_mapping = {
-                    "疾病": "disease",
-                    "治疗": "treatment",
-                    "检查": "examination",
-                    "药物": "medication",
-                    "生命体征": "vital_signs",
-                    "并发症": "complication"
-                }
-
-                nodes.append({
-                    "id": record["id"],
-                    "label": name,
-                    "group": group_mapping.get(entity_type, "other"),
-                    "type": entity_type,
-                    "properties": record["properties"]
-                })
-
-            # 获取所有关系，适配新的关系类型
-            links_result = session.run("""
-                MATCH (a)-[r]->(b)
-                RETURN a.id as source, 
-                       b.id as target, 
-                       type(r) as relationshipType,
-                       CASE 
-                        WHEN type(r) = '需要治疗' THEN {时机: r.时机, 顺序: r.顺序, 条件: r.条件}
-                        WHEN type(r) = '需要检查' THEN {频率: r.频率, 目的: r.目的}
-                        WHEN type(r) = '使用药物' THEN {剂量: r.剂量, 给药方式: r.给药方式, 使用时机: r.使用时机, 注意事项: r.注意事项}
-                        WHEN type(r) = '监测指标' THEN {监测频率: r.监测频率, 目标值: r.目标值}
-                        WHEN type(r) = '引起并发症' THEN {发生率: r.发生率, 条件: r.条件}
-                        ELSE {}
-                       END as properties
-                ORDER BY source
-            """)
-            links = []
-            for record in links_result:
-                relationship_type = record["relationshipType"]
-
-                # 简化关系权重用于可视化
+        """从图存储获取知识图谱数据"""
+        # 获取所有节点，适配新的实体类型
+        nodes = [self._format_node(node) for node in self.store.dump_nodes()]
+
+        # 获取所有关系，适配新的关系类型
+        links = []
+        for rel in self.store.dump_relationships():
+            relationship_type = rel["type"]
+
+            # 简化关系权重用于可视化
+            weight = 1
+            if "治疗" in relationship_type:
+                weight = 3
+            elif "药物" in relationship_type:
+                weight = 2
+            elif "检查" in relationship_type or "监测" in relationship_type:
                 weight = 1
-                if "治疗" in relationship_type:
-                    weight = 3
-                elif "药物" in relationship_type:
-                    weight = 2
-                elif "检查" in relationship_type or "监测" in relationship_type:
-                    weight = 1
-                elif "并发症" in relationship_type:
-                    weight = 2
-
-                links.append({
-                    "source": record["source"],
-                    "target": record["target"],
-                    "value": weight,
-                    "relationshipType": relationship_type,
-                    "properties": record["properties"]
-                })
-
-            return {"nodes": nodes, "links": links}
+            elif "并发症" in relationship_type:
+                weight = 2
+
+            display_keys = RELATIONSHIP_DISPLAY_PROPERTIES.get(relationship_type, [])
+            links.append({
+                "source": rel["source"],
+                "target": rel["target"],
+                "value": weight,
+                "relationshipType": relationship_type,
+                "properties": {key: rel["properties"].get(key) for key in display_keys}
+            })
+
+        return {"nodes": nodes, "links": links}
+
+    def search(self, query, types=None, page=1, page_size=20):
+        """
+        知识检索(BM25 排序,可按类型过滤、分页);索引不可用时退回图存储的子串扫描(不排序、不分页)
+        Returns:
+            {'total', 'page', 'page_size', 'results': [{'key', 'name', 'type', 'properties', 'score', 'matched_fields'}]}
+        """
+        result = self.search_index.search(query, types, page, page_size)
+        if result is not None:
+            return result
+        nodes = [node for node in self.store.search_nodes(query, limit=page_size)
+                 if not types or node['type'] in types]
+        return {'total': len(nodes), 'page': 1, 'page_size': page_size, 'results': nodes}
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGEST_LIMIT):
+        """
+        实体名称联想(名称、别名、拼音前缀,按度数排序);索引不可用时退回图存储的子串扫描
+        Returns:
+            [{'key', 'name', 'type', 'degree', 'matched'}]
+        """
+        result = self.suggest_index.suggest(prefix, limit)
+        if result is not None:
+            return result
+        return [{'key': node['key'], 'name': node['name'], 'type': node['type'], 'degree': None, 'matched': 'name'}
+                for node in self.store.search_nodes(prefix, limit=limit)]
 
     def search_nodes(self, query):
         """搜索节点"""
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (n)
-                WHERE toLower(n.name) CONTAINS toLower($query) 
-                   OR toLower(n.症状描述) CONTAINS toLower($query)
-                   OR toLower(n.注意事项) CONTAINS toLower($query)
-                RETURN n.id as id, 
-                       n.name as name, 
-                       labels(n)[0] as entityType,
-                       CASE 
-                        WHEN labels(n)[0] = '疾病' THEN n.严重程度
-                        WHEN labels(n)[0] = '治疗' THEN n.紧急程度
-                        WHEN labels(n)[0] = '检查' THEN n.检查目的
-                        WHEN labels(n)[0] = '药物' THEN n.用药途径
-                        WHEN labels(n)[0] = '生命体征' THEN n.正常范围
-                        WHEN labels(n)[0] = '并发症' THEN n.发生率
-                        ELSE null
-                       END as properties
-                LIMIT 20
-            """, query=query)
-
-            nodes = []
-            for record in result:
-                entity_type = record["entityType"]
-                name = record["name"] or record["id"]
-
-                # 映射实体类型到颜色组
-                group_mapping = {
-                    "疾病": "disease",
-                    "治疗": "treatment",
-                    "检查": "examination",
-                    "药物": "medication",
-                    "生命体征": "vital_signs",
-                    "并发症": "complication"
-                }
-
-                nodes.append({
-                    "id": record["id"],
-                    "label": name,
-                    "group": group_mapping.get(entity_type, "other"),
-                    "type": entity_type,
-                    "properties": record["properties"]
-                })
-
-            return nodes
\ No newline at end of file
+        return [self._format_node(node) for node in self.search(query)['results']]
+
+    def query_stats(self):
+        """按查询模板聚合的剖析统计(需开启 NEO4J_PROFILE),未开启时返回 None"""
+        return self.store.query_stats()
+
+    def status(self):
+        """图存储连通性检查,失败时抛出异常"""
+        self.store.ping()
@@ -1,40 +1,108 @@
 import json
+import logging
 import re
-from typing import List, Dict, Any, Tuple
-from neo4j import GraphDatabase
-import requests
+from typing import List, Dict, Any, Optional, Tuple
+from backend.knowledge.graph.deadline import DeadlineExceeded, check_deadline, remaining
+from backend.knowledge.graph.store import GraphStore, create_graph_store
+from backend.app.service.context_packer import DEFAULT_BUDGET, ContextPacker
+from backend.app.service.entity_linker import LINKS, EntityLinker
+from backend.app.service.graph_version import GraphVersionWatcher, changed_counters
+from backend.app.service.knowledge_cards import DEFAULT_PATH as KNOWLEDGE_CARDS_PATH, KnowledgeCards, \
+    fact_line, with_card_facts
+from backend.app.service.lexicon import GraphLexicon
+from backend.app.service.microbatch import MicroBatcher
+from backend.app.service.path_index import DEFAULT_PATH as PATH_INDEX_PATH, PathIndex
+from backend.app.service.ranking import DEFAULT_ALPHA, rank_subgraph, score_reasoning_paths
+from backend.app.service.request_budget import RequestBudget
+from backend.app.service.resilience import CircuitBreaker, CircuitOpenError, Hedger
+from backend.app.service.sidecar import SidecarFile
+from backend.app.service.subgraph import Subgraph
+from backend.app.service.subgraph_cache import SubgraphCache
+from backend.app.service.tracing import span, traced, instrument_store
+from backend.app.service.validation import AnswerValidator
 import os
+import time
+
+logger = logging.getLogger(__name__)
 
 class KnowledgeGraphRetrieval:
     """知识图谱检索与推理系统"""
 
     def __init__(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str,
-                 deepseek_api_key: str = None):
-        """初始化"""
-        # 验证 Neo4j 连接
-        try:
-            self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-            with self.driver.session() as session:
-                session.run("RETURN 1")
-            print("✓ Neo4j 连接成功")
-        except Exception as e:
-            print(f"✗ Neo4j 连接失败: {e}")
-            raise
+                 deepseek_api_key: str = None, store: GraphStore = None):
+        """初始化(不连接数据库,连通性由启动预热或第一次查询时检查)"""
+        # GRAPH_BACKEND=sqlite 时使用嵌入式存储
+        self.store = store or create_graph_store(neo4j_uri=neo4j_uri, neo4j_user=neo4j_user,
+                                                 neo4j_password=neo4j_password)
+        instrument_store(self.store)
 
         # 验证 DeepSeek API
         self.deepseek_api_key = deepseek_api_key or os.getenv('DEEPSEEK_API_KEY')
         if not self.deepseek_api_key or self.deepseek_api_key == "your_api_key":
-            print("⚠️  DeepSeek API key 未配置,将使用简化方法")
+            logger.warning("⚠️  DeepSeek API key 未配置,将使用简化方法")
             self.use_llm = False
         else:
             self.use_llm = True
-            print("✓ DeepSeek API key 已配置")
+            logger.info("✓ DeepSeek API key 已配置")
 
         self.deepseek_api_url = "https://api.deepseek.com/v1/chat/completions"
+        self.deepseek_timeout = float(os.getenv('DEEPSEEK_TIMEOUT', '60'))
+        self.deepseek_connect_timeout = float(os.getenv('DEEPSEEK_CONNECT_TIMEOUT', '5'))
+
+        # API 连续出错或变慢时熔断,熔断期间生成与实体提取直接走备用方法
+        self.llm_breaker = CircuitBreaker('deepseek')
+        # 单个问题的实体提取超过 DEEPSEEK_HEDGE_MS 未返回时再发一次,默认关闭
+        self.llm_hedger = Hedger('deepseek_extraction', float(os.getenv('DEEPSEEK_HEDGE_MS', '0')))
+
+        # 图谱实体词表(名称与别名),实体链接与答案验证共用
+        self.lexicon = GraphLexicon(self.store, version=lambda: self.graph_version.current())
+        # 问题实体先在本地链接,置信度低于 ENTITY_LINK_THRESHOLD 时才调用 LLM;设为大于 1 时总是调用 LLM
+        self.entity_linker = EntityLinker(self.lexicon)
+
+        # 并发请求的实体提取在 EXTRACTION_BATCH_WINDOW_MS 窗口内合并为一次调用,设为 0 关闭
+        window_ms = float(os.getenv('EXTRACTION_BATCH_WINDOW_MS', '20'))
+        self.extraction_batcher = None
+        if self.use_llm and window_ms > 0:
+            self.extraction_batcher = MicroBatcher(
+                'extraction', self._llm_extract_entities_batch, window_ms=window_ms,
+                max_batch=int(os.getenv('EXTRACTION_BATCH_MAX', '16')))
+
+        # 子图排序: 先取 top_k * RANKING_CANDIDATE_FACTOR 条候选路径,再按个性化 PageRank 选出 top_k 条;
+        # 设为 0 时沿用按路径长度截断
+        self.ranking_candidate_factor = int(os.getenv('RANKING_CANDIDATE_FACTOR', '4'))
+
+        # 子图扩展与推理路径查询结果缓存(SUBGRAPH_CACHE_SIZE=0 关闭);扩展规则变化时键随之变化,
+        # 条目按图版本失效
+        self.graph_version = GraphVersionWatcher(self.store)
+        self.subgraph_cache = SubgraphCache(version=self.graph_version.current)
+        self.expansion_rules = (self.ranking_candidate_factor, DEFAULT_ALPHA)
+
+        # 离线推理路径索引(python -m backend.app.service.path_index 生成,路径见 PATH_INDEX_PATH),
+        # 命中时推理直接查表,未命中或与当前图版本不一致时在线搜索
+        self.path_index = SidecarFile(PATH_INDEX_PATH, PathIndex.load, '推理路径索引')
+
+        # 预先生成的疾病 / 治疗知识卡片(python -m backend.app.service.knowledge_cards 生成,路径见
+        # KNOWLEDGE_CARDS_PATH),每个回答最多拼接 KNOWLEDGE_CARDS_PER_ANSWER 张
+        self.knowledge_cards = SidecarFile(KNOWLEDGE_CARDS_PATH, KnowledgeCards.load, '知识卡片')
+        self.cards_per_answer = int(os.getenv('KNOWLEDGE_CARDS_PER_ANSWER', '3'))
+
+        # 生成提示词中的图谱上下文按 GENERATION_CONTEXT_TOKENS 预算打包,设为 0 时不限制
+        self.context_packer = ContextPacker(DEFAULT_BUDGET) if DEFAULT_BUDGET > 0 else None
+
+        # 答案验证: 子图倒排索引 + 图谱实体词表
+        self.validator = AnswerValidator(self.lexicon)
+
+        self.graph_version.on_change(self._on_graph_change)
+
+    def _on_graph_change(self, old: Dict, new: Dict):
+        """图版本变化: 清空子图缓存(旧条目按版本本已失效,这里只是释放内存),有节点变化时重新加载词表"""
+        self.subgraph_cache.invalidate()
+        if changed_counters(old, new, 'nodes'):
+            self.lexicon.invalidate()
 
     def close(self):
         """关闭连接"""
-        self.driver.close()
+        self.store.close()
 
     # ========== 1. 图检索模块 ==========
 
@@ -44,213 +112,319 @@ class KnowledgeGraphRetrieval:
         entities = self._extract_entities_from_query(query)
         matched_nodes = self._find_matching_nodes(entities)
         if not matched_nodes:
-            print("✗ 未找到匹配节点\n")
+            logger.debug("✗ 未找到匹配节点")
             return {"nodes": [], "relationships": [], "paths": []}
 
         subgraph = self._expand_subgraph(matched_nodes, max_depth, top_k)
-        print(f"✓ 扩展子图完成:")
-        print(f"  - 节点数: {len(subgraph['nodes'])}")
-        print(f"  - 关系数: {len(subgraph['relationships'])}")
-        print(f"  - 路径数: {len(subgraph['paths'])}\n")
+        logger.debug("✓ 扩展子图完成: 节点数 %d, 关系数 %d, 路径数 %d",
+                     len(subgraph['nodes']), len(subgraph['relationships']), len(subgraph['paths']))
 
         return subgraph
 
+    @traced('extraction')
     def _extract_entities_from_query(self, query: str) -> List[str]:
-        """从查询中提取关键实体"""
-        if self.use_llm:
-            prompt = f"""从以下医疗问题中提取关键实体(疾病、治疗、药物、检查等)。
+        """
+        从查询中提取关键实体: 本地链接置信度足够时直接使用,
+        否则调用 LLM(开启微批时与并发请求合并为一次调用)
+        """
+        linked = self._link_entities(query)
+        if linked is not None:
+            return linked
+
+        # 熔断期间直接用图谱匹配,不再进入微批窗口
+        if self.use_llm and self.llm_breaker.state != CircuitBreaker.OPEN:
+            if self.extraction_batcher is not None:
+                try:
+                    entities = self.extraction_batcher.submit(query, timeout=remaining())
+                except Exception as e:
+                    logger.warning("⚠️  合并提取失败: %s, 单独提取", e)
+                    entities = self._llm_extract_entities(query)
+            else:
+                entities = self._llm_extract_entities(query)
+            if entities:
+                LINKS.inc(source='llm')
+                return entities
+
+        return self._extract_entities_locally(query)
+
+    def _link_entities(self, query: str) -> Optional[List[str]]:
+        """本地实体链接,置信度低于阈值或没有链接到实体时返回 None"""
+        try:
+            result = self.entity_linker.link(query)
+        except Exception as e:
+            logger.warning("⚠️  本地实体链接失败: %s", e)
+            return None
+        if result['entities'] and result['confidence'] >= self.entity_linker.threshold:
+            LINKS.inc(source='local')
+            return result['entities']
+        logger.debug("本地实体链接置信度 %.2f,不足 %.2f", result['confidence'], self.entity_linker.threshold)
+        return None
+
+    def _llm_extract_entities(self, query: str) -> Optional[List[str]]:
+        """单个问题的 LLM 实体提取,失败或结果为空时返回 None"""
+        prompt = f"""从以下医疗问题中提取关键实体(疾病、治疗、药物、检查等)。
 
 问题: {query}
 
 只返回JSON数组,格式: ["实体1", "实体2", ...]
 """
-            try:
-                response = self._call_deepseek(prompt, max_tokens=200, temperature=0)
-                response = re.sub(r'```json\s*', '', response.strip())
-                response = re.sub(r'```\s*', '', response)
-                entities = json.loads(response)
-                if isinstance(entities, list) and entities:
-                    return entities
-            except Exception as e:
-                print(f"⚠️  LLM 提取失败: {e}, 使用备用方法")
+        try:
+            entities = self._parse_json(self._call_deepseek(prompt, max_tokens=200, temperature=0, hedge=True))
+            if isinstance(entities, list) and entities:
+                return entities
+        except CircuitOpenError:
+            logger.debug("LLM 熔断中,使用备用方法提取实体")
+        except Exception as e:
+            logger.warning("⚠️  LLM 提取失败: %s, 使用备用方法", e)
+        return None
+
+    def _llm_extract_entities_batch(self, queries: List[str]) -> List[Optional[List[str]]]:
+        """
+        一次 LLM 调用为多个问题提取实体,结果与 queries 一一对应(没有提取到实体的为 None)。
+        整体解析失败时逐个单独提取,个别问题缺失或格式不对时只对该问题单独提取。
+        """
+        if len(queries) == 1:
+            return [self._llm_extract_entities(queries[0])]
+
+        numbered = '\n'.join(f"{i + 1}. {' '.join(query.split())}" for i, query in enumerate(queries))
+        prompt = f"""从以下每个医疗问题中分别提取关键实体(疾病、治疗、药物、检查等)。
+
+问题列表:
+{numbered}
+
+只返回JSON对象,键为问题编号,值为该问题的实体数组,格式: {{"1": ["实体1", "实体2"], "2": [...]}}
+"""
+        parsed = {}
+        try:
+            response = self._parse_json(self._call_deepseek(
+                prompt, max_tokens=min(60 * len(queries) + 50, 4000), temperature=0))
+            if isinstance(response, dict):
+                parsed = {str(key).strip(): value for key, value in response.items()}
+            else:
+                logger.warning("⚠️  批量提取返回格式错误,逐个提取")
+        except CircuitOpenError:
+            logger.debug("LLM 熔断中,批量提取全部使用备用方法")
+            return [None] * len(queries)
+        except Exception as e:
+            logger.warning("⚠️  批量提取失败: %s, 逐个提取", e)
 
-        # 备用方法
+        results = []
+        for i, query in enumerate(queries):
+            entities = parsed.get(str(i + 1))
+            if not isinstance(entities, list) or not all(isinstance(e, str) for e in entities):
+                results.append(self._llm_extract_entities(query))
+            else:
+                results.append(entities or None)
+        return results
+
+    def _extract_entities_locally(self, query: str) -> List[str]:
+        """备用方法: 图谱中名称出现在问题里的节点"""
+        LINKS.inc(source='fallback')
         keywords = []
         try:
-            with self.driver.session() as session:
-                result = session.run("""
-                    MATCH (n)
-                    WHERE $query_text CONTAINS n.name
-                    RETURN DISTINCT n.name as name
-                    LIMIT 10
-                """, query_text=query)
-                keywords = [record['name'] for record in result]
+            keywords = self.store.find_names_in_text(query, limit=10)
         except Exception as e:
-            print(f"⚠️  图谱匹配失败: {e}")
+            logger.warning("⚠️  图谱匹配失败: %s", e)
 
         return keywords if keywords else [query]
 
+    @staticmethod
+    def _parse_json(response: str) -> Any:
+        """解析 LLM 返回的 JSON(去掉 markdown 代码块标记)"""
+        response = re.sub(r'```json\s*', '', response.strip())
+        response = re.sub(r'```\s*', '', response)
+        return json.loads(response)
+
+    @traced('extraction')
+    def _extract_entities_batch(self, queries: List[str]) -> List[List[str]]:
+        """
+        多个问题一次性提取实体,结果与 queries 一一对应:本地链接置信度不足的问题合并为一次 LLM 调用,
+        LLM 也没有提取到实体的问题用图谱匹配
+        """
+        results = [self._link_entities(query) for query in queries]
+        pending = [i for i, entities in enumerate(results) if entities is None]
+        if pending and self.use_llm:
+            extracted = self._llm_extract_entities_batch([queries[i] for i in pending])
+            for i, entities in zip(pending, extracted):
+                if entities:
+                    LINKS.inc(source='llm')
+                    results[i] = entities
+        return [entities or self._extract_entities_locally(query)
+                for query, entities in zip(queries, results)]
+
+    @traced('matching')
     def _find_matching_nodes(self, entities: List[str]) -> List[Dict]:
         """查找匹配的图谱节点"""
         matched = []
-        with self.driver.session() as session:
-            for entity in entities:
-                result = session.run("""
-                    MATCH (n)
-                    WHERE n.name CONTAINS $entity
-                    RETURN id(n) as node_id, 
-                           labels(n)[0] as type,
-                           n.name as name,
-                           properties(n) as properties
-                    LIMIT 5
-                """, entity=entity)
-
-                for record in result:
-                    matched.append({
-                        'id': record['node_id'],
-                        'type': record['type'],
-                        'name': record['name'],
-                        'properties': dict(record['properties'])
-                    })
+        for entity in entities:
+            matched.extend(self.store.find_nodes_by_name(entity, limit=5))
         return matched
 
+    @traced('matching')
+    def _find_matching_nodes_batch(self, entity_lists: List[List[str]]) -> List[List[Dict]]:
+        """多个问题的实体一次性匹配,相同实体只查询一次"""
+        distinct = list(dict.fromkeys(entity for entities in entity_lists for entity in entities))
+        matches = dict(zip(distinct, self.store.find_nodes_by_names(distinct, limit=5)))
+        return [[node for entity in entities for node in matches[entity]] for entities in entity_lists]
+
+    def _expansion_key(self, node_ids: List[int], max_depth: int, top_k: int) -> tuple:
+        return SubgraphCache.key('expand', node_ids, max_depth, top_k, self.expansion_rules)
+
+    @traced('expansion')
+    def _expand_subgraphs_batch(self, seed_groups: List[List[Dict]], max_depth: int,
+                                top_k: int) -> List[Dict[str, Any]]:
+        """多组种子节点一次性扩展,结果与 seed_groups 一一对应;缓存未命中的组合并为一次批量查询"""
+        groups = [[node['id'] for node in seed_nodes] for seed_nodes in seed_groups]
+        keys = [self._expansion_key(node_ids, max_depth, top_k) for node_ids in groups]
+        results = [self.subgraph_cache.get(key) for key in keys]
+        missing = [i for i, subgraph in enumerate(results) if subgraph is None]
+        if missing:
+            version = self.subgraph_cache.version()
+            loaded = self._load_subgraphs_batch([groups[i] for i in missing], max_depth, top_k)
+            for i, subgraph in zip(missing, loaded):
+                self.subgraph_cache.put(keys[i], subgraph, version)
+                results[i] = subgraph
+        return results
+
+    def _load_subgraphs_batch(self, groups: List[List[int]], max_depth: int,
+                              top_k: int) -> List[Dict[str, Any]]:
+        if self.ranking_candidate_factor <= 0:
+            return [Subgraph.from_tables(tables)
+                    for tables in self.store.expand_subgraph_batch(groups, max_depth, top_k)]
+
+        results = self.store.expand_subgraph_batch(groups, max_depth, top_k * self.ranking_candidate_factor)
+        with span('ranking', candidates=sum(len(tables['paths']) for tables in results)):
+            return [rank_subgraph(Subgraph.from_tables(tables), node_ids, top_k)
+                    for node_ids, tables in zip(groups, results)]
+
+    @traced('expansion')
     def _expand_subgraph(self, seed_nodes: List[Dict], max_depth: int,
                          top_k: int) -> Dict[str, Any]:
-        """扩展子图"""
+        """扩展子图(相同种子与参数的结果在图版本不变时直接取缓存)"""
         node_ids = [node['id'] for node in seed_nodes]
+        return self.subgraph_cache.get_or_load(self._expansion_key(node_ids, max_depth, top_k),
+                                               lambda: self._load_subgraph(node_ids, max_depth, top_k))
 
-        with self.driver.session() as session:
-            result = session.run(f"""
-                MATCH path = (start)-[*1..{max_depth}]-(end)
-                WHERE id(start) IN $node_ids
-                WITH path, 
-                     length(path) as path_length,
-                     [rel in relationships(path) | type(rel)] as rel_types
-                RETURN path,
-                       [node in nodes(path) | {{
-                           id: id(node),
-                           type: labels(node)[0],
-                           name: node.name,
-                           properties: properties(node)
-                       }}] as nodes,
-                       [rel in relationships(path) | {{
-                           type: type(rel),
-                           properties: properties(rel)
-                       }}] as relationships,
-                       path_length,
-                       rel_types
-                ORDER BY path_length ASC
-                LIMIT $top_k
-            """, node_ids=node_ids, top_k=top_k)
-
-            all_nodes = {}
-            all_relationships = []
-            all_paths = []
-
-            for record in result:
-                nodes = record['nodes']
-                rels = record['relationships']
-
-                for node in nodes:
-                    node_id = node['id']
-                    if node_id not in all_nodes:
-                        all_nodes[node_id] = node
-
-                for i, rel in enumerate(rels):
-                    rel_data = {
-                        'from': nodes[i]['id'],
-                        'from_name': nodes[i]['name'],
-                        'to': nodes[i + 1]['id'],
-                        'to_name': nodes[i + 1]['name'],
-                        'type': rel['type'],
-                        'properties': rel['properties']
-                    }
-                    all_relationships.append(rel_data)
-
-                path_desc = ' -> '.join([
-                                            f"{nodes[i]['name']}[{rels[i]['type']}]"
-                                            for i in range(len(rels))
-                                        ] + [nodes[-1]['name']])
-
-                all_paths.append({
-                    'nodes': nodes,
-                    'relationships': rels,
-                    'description': path_desc,
-                    'length': record['path_length']
-                })
-
-            return {
-                'nodes': list(all_nodes.values()),
-                'relationships': all_relationships,
-                'paths': all_paths
-            }
+    def _load_subgraph(self, node_ids: List[int], max_depth: int, top_k: int) -> Subgraph:
+        """节点表 / 关系表各取一份,路径为ID序列(见 subgraph.Subgraph)"""
+        if self.ranking_candidate_factor <= 0:
+            return Subgraph.from_tables(self.store.expand_subgraph(node_ids, max_depth, top_k))
+
+        tables = self.store.expand_subgraph(node_ids, max_depth, top_k * self.ranking_candidate_factor)
+        with span('ranking', candidates=len(tables['paths'])):
+            return rank_subgraph(Subgraph.from_tables(tables), node_ids, top_k)
 
     # ========== 2. 基于子图的控制生成 ==========
 
     def controlled_generation_with_subgraph(self, query: str,
                                             use_consistency: bool = True,
-                                            use_reasoning: bool = True) -> Dict[str, Any]:
+                                            use_reasoning: bool = True,
+                                            deadline_ms: Optional[float] = None) -> Dict[str, Any]:
         """
         基于子图的控制生成
         Args:
             query: 用户问题
             use_consistency: 是否使用自一致性检索
             use_reasoning: 是否使用多跳推理
+            deadline_ms: 本次请求的延迟预算,默认取 REQUEST_DEADLINE_MS;
+                预算不足时跳过可选阶段,记录在结果的 'budget' 中
         Returns:
             生成结果 (包含答案和验证)
         """
-        print(f"\n{'=' * 60}")
-        print(f"🎯 基于子图的控制生成")
-        print(f"{'=' * 60}\n")
-
-        # 1. 检索高一致性子图
-        if use_consistency:
-            consistency_result = self.self_consistency_retrieval(query, num_samples=3)
-            subgraph = consistency_result['consistent_subgraph']
-            consistency_info = f"""
-一致性分析:
-- 高一致性节点: {len(subgraph['nodes'])} 个
-- 高一致性路径: {len(subgraph['paths'])} 个
-- 平均一致性: {sum(n.get('consistency', 0) for n in subgraph['nodes']) / len(subgraph['nodes']) if subgraph['nodes'] else 0:.2%}
-"""
-        else:
-            subgraph = self.retrieve_relevant_subgraph(query, max_depth=2, top_k=10)
-            consistency_info = ""
-
-        # 2. 多跳推理 (如果启用)
-        reasoning_chains = []
-        if use_reasoning:
-            print("🧠 执行多跳推理...\n")
-            entities = self._extract_entities_from_query(query)
-
-            if len(entities) >= 2:
-                for i in range(len(entities) - 1):
-                    reasoning = self.multi_hop_reasoning(
-                        query=f"{entities[i]} 和 {entities[i + 1]} 的关系",
-                        max_hops=3
-                    )
+        logger.debug("🎯 基于子图的控制生成: %s", query)
+        budget = RequestBudget(deadline_ms)
+
+        with budget.scope():
+            # 1. 检索高一致性子图
+            try:
+                if use_consistency:
+                    consistency_result = self.self_consistency_retrieval(query, num_samples=3, budget=budget)
+                    subgraph = consistency_result['consistent_subgraph']
+                    consistency_info = self._format_consistency_info(subgraph)
+                else:
+                    subgraph = self.retrieve_relevant_subgraph(query, max_depth=2, top_k=10)
+                    consistency_info = ""
+            except DeadlineExceeded as e:
+                logger.warning("⚠️  检索超过截止时间: %s", e)
+                budget.skip('retrieval')
+                subgraph = {"nodes": [], "relationships": [], "paths": []}
+                consistency_info = ""
+
+            # 2. 多跳推理 (如果启用,预算不足时跳过靠后的实体对)
+            reasoning_chains = []
+            if use_reasoning and not budget.skipped.get('retrieval'):
+                entities = self._extract_entities_from_query(query)
+
+                pairs = [(entities[i], entities[i + 1]) for i in range(len(entities) - 1)]
+                for i, (start, end) in enumerate(pairs):
+                    if not budget.affords('reasoning_pair', reserve=('generation',)):
+                        budget.skip('reasoning_pair', len(pairs) - i)
+                        break
+                    try:
+                        with budget.stage('reasoning_pair'):
+                            reasoning = self.multi_hop_reasoning(query=f"{start} 和 {end} 的关系", max_hops=3)
+                    except DeadlineExceeded:
+                        budget.skip('reasoning_pair', len(pairs) - i)
+                        break
                     if reasoning and reasoning.get('paths'):
                         reasoning_chains.append({
-                            'from': entities[i],
-                            'to': entities[i + 1],
+                            'from': start,
+                            'to': end,
                             'path': reasoning['paths'][0]
                         })
 
-            print(f"✓ 找到 {len(reasoning_chains)} 条推理链\n")
+                logger.debug("✓ 找到 %d 条推理链", len(reasoning_chains))
 
-        # 3. 构建结构化知识
-        structured_knowledge = self._format_subgraph_with_reasoning(
-            subgraph, reasoning_chains
-        )
+            result = self._answer_with_subgraph(query, subgraph, reasoning_chains, consistency_info, budget)
+
+        result['budget'] = budget.summary()
+        if budget.skipped:
+            logger.info("延迟预算 %.0fms 内跳过阶段: %s", budget.deadline_ms, budget.skipped)
+        return result
+
+    @staticmethod
+    def _format_consistency_info(subgraph: Dict) -> str:
+        return f"""
+一致性分析:
+- 高一致性节点: {len(subgraph['nodes'])} 个
+- 高一致性路径: {len(subgraph['paths'])} 个
+- 平均一致性: {sum(n.get('consistency', 0) for n in subgraph['nodes']) / len(subgraph['nodes']) if subgraph['nodes'] else 0:.2%}
+"""
+
+    def _answer_with_subgraph(self, query: str, subgraph: Dict, reasoning_chains: List[Dict],
+                              consistency_info: str, budget: RequestBudget = None) -> Dict[str, Any]:
+        """在已检索的子图和推理链上生成答案并验证(budget 不足时跳过验证,validation 为 None)"""
+        # 3. 构建结构化知识(匹配节点的知识卡片在前;按 token 预算选取与问题最相关的部分)
+        cards = self._select_cards(subgraph)
+        context = None
+        if self.context_packer is not None:
+            context = self.context_packer.pack(query, subgraph, reasoning_chains, cards=cards)
+            structured_knowledge = context['knowledge']
+            cards = context['cards']
+            logger.debug("上下文打包: %d/%d tokens, 舍弃 %s, 去重 %d",
+                         context['tokens'], context['budget'], context['dropped'], context['deduplicated'])
+        else:
+            structured_knowledge = self._format_subgraph_with_reasoning(
+                subgraph, reasoning_chains, cards
+            )
 
         # 4. 硬约束生成
-        print("📝 生成答案 (硬约束模式)...\n")
-        answer, constrained_entities = self._generate_with_hard_constraints(
-            query, structured_knowledge, consistency_info, subgraph
-        )
+        if budget is None:
+            answer, constrained_entities = self._generate_with_hard_constraints(
+                query, structured_knowledge, consistency_info, subgraph, context, cards
+            )
+        else:
+            with budget.stage('generation'):
+                answer, constrained_entities = self._generate_with_hard_constraints(
+                    query, structured_knowledge, consistency_info, subgraph, context, cards
+                )
 
-        # 5. 验证
-        validation = self.validate_generation_with_subgraph(answer, subgraph)
+        # 5. 验证(卡片中的事实也作为依据)
+        validation = None
+        if budget is None or budget.affords('validation'):
+            validation = self.validate_generation_with_subgraph(answer, with_card_facts(subgraph, cards))
+        else:
+            budget.skip('validation')
 
         return {
             'query': query,
@@ -259,19 +433,41 @@ class KnowledgeGraphRetrieval:
             'reasoning_chains': reasoning_chains,
             'validation': validation,
             'constrained_entities': constrained_entities,
-            'consistency_info': consistency_info
+            'consistency_info': consistency_info,
+            'knowledge_cards': [card['name'] for card in cards],
+            'context': {key: context[key] for key in ('tokens', 'budget', 'dropped', 'deduplicated')}
+            if context else None
         }
 
+    def _select_cards(self, subgraph: Dict) -> List[Dict]:
+        """子图节点中有知识卡片的,按子图排序得分取前几张(未排序时按子图中的顺序,种子节点在前)"""
+        cards = self.knowledge_cards.get()
+        if cards is None or self.cards_per_answer <= 0 or not subgraph['nodes']:
+            return []
+        nodes = sorted(subgraph['nodes'], key=lambda node: node.get('rank', 0), reverse=True)
+        return cards.select(nodes, self.graph_version.current(), self.cards_per_answer)
+
     def _format_subgraph_with_reasoning(self, subgraph: Dict,
-                                        reasoning_chains: List[Dict]) -> str:
-        """格式化子图信息,融合推理链"""
+                                        reasoning_chains: List[Dict], cards: List[Dict] = ()) -> str:
+        """格式化子图信息,融合推理链(有知识卡片的节点直接使用卡片)"""
         knowledge_parts = []
 
+        # 0. 知识卡片
+        carded = set()
+        if cards:
+            knowledge_parts.append("【实体知识卡片】")
+            for card in cards:
+                knowledge_parts.append(card['text'])
+                carded.add((card['type'], card['name']))
+            knowledge_parts.append("")
+
         # 1. 格式化节点信息
         knowledge_parts.append("【相关医疗实体】")
 
         nodes_by_type = {}
         for node in subgraph['nodes']:
+            if (node['type'], node['name']) in carded:
+                continue
             node_type = node['type']
             if node_type not in nodes_by_type:
                 nodes_by_type[node_type] = []
@@ -336,19 +532,32 @@ class KnowledgeGraphRetrieval:
 
         return '\n'.join(knowledge_parts)
 
+    @traced('generation')
     def _generate_with_hard_constraints(self, query: str, structured_knowledge: str,
-                                        consistency_info: str, subgraph: Dict) -> Tuple[str, List[str]]:
-        """硬约束生成"""
-        # 构建实体允许列表
-        allowed_entities = [node['name'] for node in subgraph['nodes']]
+                                        consistency_info: str, subgraph: Dict,
+                                        context: Dict = None, cards: List[Dict] = ()) -> Tuple[str, List[str]]:
+        """
+        硬约束生成(context 为 ContextPacker 的打包结果,提供时实体和关系列表取自其中;
+        cards 为结构化知识中的知识卡片,其实体与关系也在允许列表中,备用回答同样使用)
+        """
+        if context is not None:
+            allowed_entities = context['allowed_entities']
+            allowed_relations = context['allowed_relations']
+        else:
+            # 构建实体允许列表
+            allowed_entities = list(dict.fromkeys(
+                [node['name'] for node in subgraph['nodes']]
+                + [name for card in cards for name in card['entities']]))
+
+            # 构建关系允许列表
+            allowed_relations = list(dict.fromkeys(
+                [fact_line(fact) for card in cards for fact in card['facts']]
+                + list(set([
+                    f"{rel['from_name']} → {rel['type']} → {rel['to_name']}"
+                    for rel in subgraph['relationships']
+                ]))[:20]))
         allowed_entities_str = ', '.join(allowed_entities)
-
-        # 构建关系允许列表
-        allowed_relations = list(set([
-            f"{rel['from_name']} → {rel['type']} → {rel['to_name']}"
-            for rel in subgraph['relationships']
-        ]))
-        allowed_relations_str = '\n  '.join(allowed_relations[:20])
+        allowed_relations_str = '\n  '.join(allowed_relations)
 
         prompt = f"""你是专业的医疗知识问答助手。基于提供的知识图谱信息回答问题。
 
@@ -387,11 +596,17 @@ class KnowledgeGraphRetrieval:
         if self.use_llm:
             try:
                 response = self._call_deepseek(prompt, max_tokens=800, temperature=0.1)
+            except CircuitOpenError:
+                logger.debug("LLM 熔断中,使用备用生成")
+                response = self._generate_fallback_answer(query, subgraph, cards)
+            except DeadlineExceeded:
+                logger.debug("已超过请求截止时间,使用备用生成")
+                response = self._generate_fallback_answer(query, subgraph, cards)
             except Exception as e:
-                print(f"⚠️  LLM 生成失败: {e}")
-                response = self._generate_fallback_answer(query, subgraph)
+                logger.warning("⚠️  LLM 生成失败: %s", e)
+                response = self._generate_fallback_answer(query, subgraph, cards)
         else:
-            response = self._generate_fallback_answer(query, subgraph)
+            response = self._generate_fallback_answer(query, subgraph, cards)
 
         # 后处理: 验证和过滤
         constrained_response, used_entities = self._enforce_entity_constraints(
@@ -400,12 +615,18 @@ class KnowledgeGraphRetrieval:
 
         return constrained_response, used_entities
 
-    def _generate_fallback_answer(self, query: str, subgraph: Dict) -> str:
-        """备用生成方法 (不使用LLM)"""
+    def _generate_fallback_answer(self, query: str, subgraph: Dict, cards: List[Dict] = ()) -> str:
+        """备用生成方法 (不使用LLM,有知识卡片时直接给出卡片内容)"""
         answer_parts = []
 
         answer_parts.append("【基于知识图谱的回答】\n")
 
+        if cards:
+            answer_parts.append("相关知识卡片:")
+            for card in cards:
+                answer_parts.append(card['text'])
+            answer_parts.append("")
+
         if subgraph['nodes']:
             answer_parts.append("相关实体:")
             for node in subgraph['nodes'][:5]:
@@ -431,19 +652,33 @@ class KnowledgeGraphRetrieval:
 
     # ========== 3. 自一致性检索 ==========
 
-    def self_consistency_retrieval(self, query: str, num_samples: int = 3) -> Dict[str, Any]:
-        """自一致性检索"""
-        print(f"\n{'=' * 60}")
-        print(f"🔄 自一致性检索 (采样{num_samples}次)")
-        print(f"{'=' * 60}\n")
-
+    @traced('consistency')
+    def self_consistency_retrieval(self, query: str, num_samples: int = 3,
+                                   budget: RequestBudget = None) -> Dict[str, Any]:
+        """自一致性检索(提供 budget 时,第一次之后的采样在预算不足时跳过)"""
         all_subgraphs = []
         for i in range(num_samples):
-            print(f"第 {i + 1}/{num_samples} 次检索...")
-            subgraph = self.retrieve_relevant_subgraph(query, max_depth=2, top_k=8)
-            all_subgraphs.append(subgraph)
+            if budget is None:
+                all_subgraphs.append(self.retrieve_relevant_subgraph(query, max_depth=2, top_k=8))
+                continue
+            if i > 0 and not budget.affords('consistency_sample', reserve=('generation',)):
+                budget.skip('consistency_sample', num_samples - i)
+                break
+            try:
+                with budget.stage('consistency_sample'):
+                    all_subgraphs.append(self.retrieve_relevant_subgraph(query, max_depth=2, top_k=8))
+            except DeadlineExceeded:
+                if i == 0:
+                    raise
+                budget.skip('consistency_sample', num_samples - i)
+                break
+
+        return self._aggregate_consistency(query, all_subgraphs)
 
-        print(f"\n✓ 完成 {num_samples} 次检索\n")
+    @staticmethod
+    def _aggregate_consistency(query: str, all_subgraphs: List[Dict]) -> Dict[str, Any]:
+        """统计多次采样子图中节点、关系、路径的出现频率,保留过半数采样中出现的部分"""
+        num_samples = len(all_subgraphs)
 
         # 统计一致性
         node_counter = {}
@@ -506,10 +741,8 @@ class KnowledgeGraphRetrieval:
                 path['consistency'] = count / num_samples
                 consistent_paths.append(path)
 
-        print(f"✓ 高一致性子图构建完成:")
-        print(f"  - 一致性节点: {len(consistent_nodes)} 个")
-        print(f"  - 一致性关系: {len(consistent_relationships)} 个")
-        print(f"  - 一致性路径: {len(consistent_paths)} 个\n")
+        logger.debug("✓ 高一致性子图构建完成 (采样%d次): 节点 %d 个, 关系 %d 个, 路径 %d 个",
+                     num_samples, len(consistent_nodes), len(consistent_relationships), len(consistent_paths))
 
         consistent_subgraph = {
             'nodes': consistent_nodes,
@@ -530,6 +763,7 @@ class KnowledgeGraphRetrieval:
 
     # ========== 4. 多跳推理 ==========
 
+    @traced('reasoning')
     def multi_hop_reasoning(self, query: str, max_hops: int = 3) -> Dict[str, Any]:
         """
         多跳推理
@@ -539,29 +773,24 @@ class KnowledgeGraphRetrieval:
         Returns:
             推理链
         """
-        print(f"\n{'=' * 60}")
-        print(f"🧠 多跳推理 (最大{max_hops}跳)")
-        print(f"{'=' * 60}\n")
-
         # 1. 提取起始实体和目标
         entities = self._extract_entities_from_query(query)
         if len(entities) < 2:
-            print("✗ 需要至少2个实体进行多跳推理\n")
+            logger.debug("✗ 需要至少2个实体进行多跳推理")
             return None
 
         start_entity = entities[0]
         end_entity = entities[-1]
 
-        print(f"起始实体: {start_entity}")
-        print(f"目标实体: {end_entity}\n")
-
-        # 2. 查找推理路径
-        reasoning_paths = self._find_reasoning_paths(start_entity, end_entity, max_hops)
+        # 2. 查找推理路径(先查离线索引,其中的路径已评分)
+        scored_paths = self._indexed_paths(start_entity, end_entity, max_hops)
+        if scored_paths is None:
+            reasoning_paths = self._find_reasoning_paths(start_entity, end_entity, max_hops)
 
-        print(f"✓ 找到 {len(reasoning_paths)} 条推理路径\n")
+            # 3. 评分和排序
+            scored_paths = self._score_reasoning_paths(reasoning_paths)
 
-        # 3. 评分和排序
-        scored_paths = self._score_reasoning_paths(reasoning_paths)
+        logger.debug("✓ %s -> %s 找到 %d 条推理路径", start_entity, end_entity, len(scored_paths))
 
         return {
             'start': start_entity,
@@ -569,53 +798,70 @@ class KnowledgeGraphRetrieval:
             'paths': scored_paths
         }
 
+    @traced('reasoning')
+    def _reasoning_chains_batch(self, entity_lists: List[List[str]], max_hops: int = 3) -> List[List[Dict]]:
+        """
+        多个问题的推理链一次性查询: 每个问题相邻实体两两组成一对,所有问题的实体对合并去重后批量找路径,
+        每对取评分最高的路径(与 controlled_generation_with_subgraph 中逐对调用 multi_hop_reasoning 对应)
+        """
+        pairs = list(dict.fromkeys(
+            (entities[i], entities[i + 1]) for entities in entity_lists for i in range(len(entities) - 1)))
+        # 离线索引命中的实体对已评分,其余的查缓存,缓存也未命中的合并为一次批量查询
+        scored_by_pair = {}
+        paths_by_pair = {}
+        for pair in pairs:
+            indexed = self._indexed_paths(pair[0], pair[1], max_hops)
+            if indexed is not None:
+                scored_by_pair[pair] = indexed
+                continue
+            cached = self.subgraph_cache.get(self._paths_key(pair[0], pair[1], max_hops))
+            if cached is not None:
+                paths_by_pair[pair] = cached
+        missing = [pair for pair in pairs if pair not in paths_by_pair and pair not in scored_by_pair]
+        if missing:
+            version = self.subgraph_cache.version()
+            for pair, paths in zip(missing, self.store.find_paths_batch(missing, max_hops, limit=10)):
+                self.subgraph_cache.put(self._paths_key(pair[0], pair[1], max_hops), paths, version)
+                paths_by_pair[pair] = paths
+        for pair, paths in paths_by_pair.items():
+            scored_by_pair[pair] = self._score_reasoning_paths([dict(path) for path in paths])
+
+        results = []
+        for entities in entity_lists:
+            chains = []
+            for i in range(len(entities) - 1):
+                pair = (entities[i], entities[i + 1])
+                scored = scored_by_pair[pair]
+                if scored:
+                    chains.append({'from': pair[0], 'to': pair[1], 'path': scored[0]})
+            results.append(chains)
+        return results
+
+    def _indexed_paths(self, start: str, end: str, max_hops: int) -> Optional[List[Dict]]:
+        """离线索引中已评分的推理路径;没有索引、实体对未索引或索引已过期时返回 None"""
+        index = self.path_index.get()
+        if index is None:
+            return None
+        alpha = DEFAULT_ALPHA if self.ranking_candidate_factor > 0 else None
+        return index.lookup(start, end, max_hops, self.graph_version.current(), alpha)
+
+    @staticmethod
+    def _paths_key(start: str, end: str, max_hops: int) -> tuple:
+        return SubgraphCache.key('paths', (), start, end, max_hops, 10)
+
     def _find_reasoning_paths(self, start: str, end: str, max_hops: int) -> List[Dict]:
-        """查找推理路径"""
-        with self.driver.session() as session:
-            result = session.run(f"""
-                MATCH path = (start)-[*1..{max_hops}]-(end)
-                WHERE start.name CONTAINS $start AND end.name CONTAINS $end
-                WITH path,
-                     [node in nodes(path) | node.name] as node_names,
-                     [rel in relationships(path) | type(rel)] as rel_types,
-                     length(path) as hops
-                RETURN node_names, rel_types, hops
-                ORDER BY hops ASC
-                LIMIT 10
-            """, start=start, end=end)
-
-            paths = []
-            for record in result:
-                paths.append({
-                    'nodes': record['node_names'],
-                    'relations': record['rel_types'],
-                    'hops': record['hops']
-                })
-
-            return paths
+        """查找推理路径(缓存的路径由多个请求共享,评分前复制)"""
+        paths = self.subgraph_cache.get_or_load(self._paths_key(start, end, max_hops),
+                                                lambda: self.store.find_paths(start, end, max_hops, limit=10))
+        return [dict(path) for path in paths]
 
     def _score_reasoning_paths(self, paths: List[Dict]) -> List[Dict]:
         """评分推理路径"""
-        for path in paths:
-            # 评分因素:
-            # 1. 路径长度(越短越好)
-            length_score = 1.0 / (path['hops'] + 1)
-
-            # 2. 关系类型重要性
-            important_rels = ['需要治疗', '使用药物', '需要检查']
-            rel_score = sum(1 for r in path['relations'] if r in important_rels) / len(path['relations']) if path[
-                'relations'] else 0
-
-            # 综合评分
-            path['score'] = 0.6 * length_score + 0.4 * rel_score
-
-        # 排序
-        paths.sort(key=lambda x: x['score'], reverse=True)
-
-        return paths
+        return score_reasoning_paths(paths, use_centrality=self.ranking_candidate_factor > 0)
 
     # ========== 5. 子图验证 ==========
 
+    @traced('validation')
     def validate_generation_with_subgraph(self, generated_answer: str,
                                           subgraph: Dict) -> Dict[str, Any]:
         """
@@ -626,97 +872,25 @@ class KnowledgeGraphRetrieval:
         Returns:
             验证结果
         """
-        print(f"\n{'=' * 60}")
-        print(f"✅ 验证生成内容")
-        print(f"{'=' * 60}\n")
-
-        # 1. 提取答案中的实体
-        answer_entities = self._extract_entities_from_text(generated_answer)
-
-        # 2. 检查实体是否在子图中
-        subgraph_entity_names = {node['name'] for node in subgraph['nodes']}
-
-        valid_entities = [e for e in answer_entities if e in subgraph_entity_names]
-        invalid_entities = [e for e in answer_entities if e not in subgraph_entity_names]
+        result = self.validator.validate(generated_answer, subgraph)
 
-        # 3. 检查关系陈述
-        relation_claims = self._extract_relation_claims(generated_answer)
-        verified_claims = self._verify_claims_with_subgraph(relation_claims, subgraph)
+        logger.debug("验证结果: 实体一致性 %.2f%%, 关系一致性 %.2f%%, 总体一致性 %.2f%%",
+                     result['entity_consistency'] * 100, result['claim_consistency'] * 100,
+                     result['overall_score'] * 100)
 
-        # 4. 计算一致性分数
-        entity_consistency = len(valid_entities) / len(answer_entities) if answer_entities else 0
-        claim_consistency = sum(1 for c in verified_claims if c['verified']) / len(
-            verified_claims) if verified_claims else 0
-
-        overall_score = 0.5 * entity_consistency + 0.5 * claim_consistency
-
-        print(f"验证结果:")
-        print(f"  - 实体一致性: {entity_consistency:.2%}")
-        print(f"  - 关系一致性: {claim_consistency:.2%}")
-        print(f"  - 总体一致性: {overall_score:.2%}\n")
-
-        return {
-            'overall_score': overall_score,
-            'entity_consistency': entity_consistency,
-            'claim_consistency': claim_consistency,
-            'valid_entities': valid_entities,
-            'invalid_entities': invalid_entities,
-            'verified_claims': verified_claims
-        }
-
-    def _extract_entities_from_text(self, text: str) -> List[str]:
-        """从文本中提取实体"""
-        entities = []
-        try:
-            with self.driver.session() as session:
-                result = session.run("""
-                    MATCH (n)
-                    WHERE $text_content CONTAINS n.name
-                    RETURN DISTINCT n.name as name
-                """, text_content=text)
-                entities = [record['name'] for record in result]
-        except Exception as e:
-            print(f"⚠️  提取实体失败: {e}")
-
-        return entities
-
-    def _extract_relation_claims(self, text: str) -> List[str]:
-        """提取关系陈述"""
-        # 简化版本:提取句子
-        sentences = [s.strip() for s in text.split('。') if s.strip()]
-        return sentences
-
-    def _verify_claims_with_subgraph(self, claims: List[str],
-                                     subgraph: Dict) -> List[Dict]:
-        """验证陈述与子图的一致性"""
-        verified = []
-
-        for claim in claims:
-            # 检查陈述中是否包含子图的路径
-            is_verified = False
-            supporting_path = None
-
-            for path in subgraph['paths']:
-                # 简单检查:如果陈述包含路径中的关键实体
-                path_entities = [node['name'] for node in path['nodes']]
-                if any(entity in claim for entity in path_entities[:2]):
-                    is_verified = True
-                    supporting_path = path['description']
-                    break
-
-            verified.append({
-                'claim': claim,
-                'verified': is_verified,
-                'supporting_path': supporting_path
-            })
-
-        return verified
+        return result
 
     # ========== 辅助方法 ==========
 
     def _call_deepseek(self, prompt: str, max_tokens: int = 1000,
-                       temperature: float = 0) -> str:
-        """调用DeepSeek API"""
+                       temperature: float = 0, hedge: bool = False) -> str:
+        """
+        调用DeepSeek API
+        Args:
+            hedge: 幂等的短提示词(如单个问题的实体提取)可开启对冲请求
+        Raises:
+            CircuitOpenError: 熔断期间不发出请求
+        """
         if not self.use_llm:
             raise Exception("DeepSeek API 未配置")
 
@@ -735,9 +909,55 @@ class KnowledgeGraphRetrieval:
             "max_tokens": max_tokens
         }
 
-        response = requests.post(self.deepseek_api_url, headers=headers,
-                                 json=payload, timeout=60)
-        response.raise_for_status()
+        def post() -> str:
+            return self._post_deepseek(headers, payload)
 
-        response_data = response.json()
-        return response_data['choices'][0]['message']['content']
\ No newline at end of file
+        # 截止时间已过时在占用熔断名额之前失败
+        check_deadline('LLM 调用')
+        self.llm_breaker.before_call()
+        start = time.perf_counter()
+        try:
+            # 半开探测期间不对冲,避免探测流量翻倍
+            if hedge and temperature == 0 and self.llm_breaker.state == CircuitBreaker.CLOSED:
+                content = self.llm_hedger.call(post)
+            else:
+                content = post()
+        except DeadlineExceeded:
+            # 请求自身的截止时间到了(含按剩余时间缩短的超时),不是 DeepSeek 的故障,不计入熔断统计
+            self.llm_breaker.release()
+            raise
+        except Exception:
+            self.llm_breaker.record(time.perf_counter() - start, failed=True)
+            raise
+        self.llm_breaker.record(time.perf_counter() - start, failed=False)
+        return content
+
+    def _post_deepseek(self, headers: Dict[str, str], payload: Dict[str, Any]) -> str:
+        # requests 导入约占应用导入耗时的三分之一,推迟到第一次调用
+        import requests
+
+        # 有请求截止时间时,超时不超过剩余时间
+        read_timeout, connect_timeout = self.deepseek_timeout, self.deepseek_connect_timeout
+        left = check_deadline('LLM 调用')
+        if left is not None:
+            read_timeout, connect_timeout = min(read_timeout, left), min(connect_timeout, left)
+
+        with span('llm', max_tokens=payload['max_tokens']) as s:
+            try:
+                response = requests.post(self.deepseek_api_url, headers=headers, json=payload,
+                                         timeout=(connect_timeout, read_timeout))
+            except requests.exceptions.ConnectTimeout as e:
+                if connect_timeout < self.deepseek_connect_timeout:
+                    raise DeadlineExceeded("LLM 调用连接超过请求截止时间") from e
+                raise
+            except requests.exceptions.Timeout as e:
+                if read_timeout < self.deepseek_timeout:
+                    raise DeadlineExceeded("LLM 调用超过请求截止时间") from e
+                raise
+            response.raise_for_status()
+
+            response_data = response.json()
+            usage = response_data.get('usage') or {}
+            s.set(prompt_tokens=usage.get('prompt_tokens', 0),
+                  completion_tokens=usage.get('completion_tokens', 0))
+        return response_data['choices'][0]['message']['content']
@@ -0,0 +1,226 @@
+"""
+实体知识卡片
+
+同一批疾病的邻域每天被格式化成提示词成千上万次。构建后运行一次:
+
+    python -m backend.app.service.knowledge_cards --output knowledge_cards.json
+
+为每个疾病 / 治疗节点预先渲染一张卡片: 节点属性加 1-2 跳的关系事实,行格式与生成提示词一致。
+回答时直接拼接匹配节点的卡片作为结构化知识的开头(ContextPacker 按 token 预算放入,
+卡片覆盖的实体行和关系不再重复),LLM 不可用时备用回答也直接使用卡片内容。
+
+卡片记录构建时的图版本,与当前图版本不一致时不使用。
+
+卡片: {'type', 'name', 'text': 渲染好的文本, 'facts': [[起点, 关系类型, 终点], ...],
+       'entities': 卡片中出现的实体名, 'tokens': 估算 token 数(含事实对应的允许关系行)}
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.app.service.context_packer import estimate_tokens
+from backend.app.service.metrics import REGISTRY
+from backend.app.service.ranking import IMPORTANT_RELATIONS
+from backend.knowledge.graph.store import GraphStore, create_graph_store
+
+DEFAULT_PATH = os.getenv('KNOWLEDGE_CARDS_PATH', 'knowledge_cards.json')
+DEFAULT_CARD_TYPES = ('疾病', '治疗')
+# 每张卡片最多的关系事实数(一跳优先)
+DEFAULT_MAX_FACTS = int(os.getenv('KNOWLEDGE_CARD_MAX_FACTS', '8'))
+
+FORMAT_VERSION = 1
+
+CARD_LOOKUPS = REGISTRY.counter(
+    'kg_knowledge_card_lookups_total', "回答时选用的知识卡片数(hit),卡片与图版本不一致而跳过的次数(stale)",
+    ['result'])
+
+
+def _props_text(properties: Dict[str, Any]) -> str:
+    valid = {k: v for k, v in (properties or {}).items() if k not in ['id', 'name'] and v}
+    return ', '.join(f"{k}:{v}" for k, v in valid.items())
+
+
+def fact_line(fact: Iterable[str]) -> str:
+    """与允许关系列表相同的格式"""
+    start, rel_type, end = fact
+    return f"{start} → {rel_type} → {end}"
+
+
+def render_card(node: Dict, facts: List[Tuple[str, str, str, Dict]]) -> Dict[str, Any]:
+    """
+    Args:
+        node: {'name', 'type', 'properties'}
+        facts: [(起点名, 关系类型, 终点名, 关系属性)]
+    """
+    props = _props_text(node.get('properties'))
+    lines = [f"◆ {node['name']} [{node['type']}]" + (f" ({props})" if props else "")]
+    for start, rel_type, end, rel_props in facts:
+        rel_text = _props_text(rel_props)
+        lines.append(f"  - {fact_line((start, rel_type, end))}" + (f" ({rel_text})" if rel_text else ""))
+    text = '\n'.join(lines)
+
+    entities = list(dict.fromkeys([node['name']] + [name for fact in facts for name in (fact[0], fact[2])]))
+    return {
+        'type': node['type'],
+        'name': node['name'],
+        'text': text,
+        'facts': [[start, rel_type, end] for start, rel_type, end, _ in facts],
+        'entities': entities,
+        'tokens': estimate_tokens(text) + sum(estimate_tokens(fact_line(fact[:3])) for fact in facts)
+    }
+
+
+def with_card_facts(subgraph: Dict, cards: List[Dict]) -> Dict:
+    """子图加上卡片中的实体与关系(答案验证用: 卡片中的事实同样是图谱中的事实)"""
+    if not cards:
+        return subgraph
+    names = {node['name'] for node in subgraph['nodes']}
+    extra_nodes = [{'name': name, 'type': None} for name in dict.fromkeys(
+        name for card in cards for name in card['entities']) if name not in names]
+    extra_relationships = [{'from_name': start, 'type': rel_type, 'to_name': end, 'properties': {}}
+                           for card in cards for start, rel_type, end in card['facts']]
+    return dict(subgraph, nodes=subgraph['nodes'] + extra_nodes,
+                relationships=subgraph['relationships'] + extra_relationships)
+
+
+class KnowledgeCards:
+    """
+    Args:
+        meta: {'graph_version', 'card_types', 'max_facts', 'built_at'}
+        cards: 卡片列表
+    """
+
+    def __init__(self, meta: Dict[str, Any], cards: List[Dict]):
+        self.meta = meta
+        self.graph_version = meta['graph_version']
+        self.cards = {(card['type'], card['name']): card for card in cards}
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def get(self, node_type: str, name: str) -> Optional[Dict]:
+        return self.cards.get((node_type, name))
+
+    def select(self, nodes: Iterable[Dict], graph_version: Any, limit: int) -> List[Dict]:
+        """按 nodes 的顺序取有卡片的节点,最多 limit 张;与当前图版本不一致时返回空列表"""
+        if graph_version != self.graph_version:
+            CARD_LOOKUPS.inc(result='stale')
+            return []
+        selected = []
+        for node in nodes:
+            card = self.cards.get((node['type'], node['name']))
+            if card is None:
+                continue
+            selected.append(card)
+            if len(selected) >= limit:
+                break
+        CARD_LOOKUPS.inc(len(selected), result='hit')
+        return selected
+
+    def save(self, path: str) -> str:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.meta, format=FORMAT_VERSION, cards=list(self.cards.values())),
+                      f, ensure_ascii=False)
+        # 先写临时文件再替换,服务端不会读到写了一半的文件
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'KnowledgeCards':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.pop('format', None) != FORMAT_VERSION:
+            raise ValueError(f"{path} 不是支持的知识卡片文件")
+        cards = data.pop('cards')
+        return cls(data, cards)
+
+
+def build_knowledge_cards(store: GraphStore, card_types: Iterable[str] = DEFAULT_CARD_TYPES,
+                          max_facts: int = DEFAULT_MAX_FACTS) -> KnowledgeCards:
+    """从图存储为指定类型的节点生成卡片"""
+    # 先读版本再读数据: 读取期间有写入时,卡片的版本落后,服务端不会使用
+    graph_version = store.graph_version()['version']
+    nodes = store.dump_nodes()
+    relationships = store.dump_relationships()
+    card_types = tuple(card_types)
+
+    by_key: Dict[str, List[int]] = {}
+    for i, node in enumerate(nodes):
+        by_key.setdefault(node['key'], []).append(i)
+    # 节点下标 -> 关联的关系下标(两个方向)
+    incident: List[List[int]] = [[] for _ in nodes]
+    edges: List[Tuple[int, int, Dict]] = []
+    for rel in relationships:
+        for a in by_key.get(rel['source'], ()):
+            for b in by_key.get(rel['target'], ()):
+                incident[a].append(len(edges))
+                if a != b:
+                    incident[b].append(len(edges))
+                edges.append((a, b, rel))
+
+    def fact(edge: int) -> Tuple[str, str, str, Dict]:
+        a, b, rel = edges[edge]
+        return nodes[a]['name'], rel['type'], nodes[b]['name'], rel.get('properties') or {}
+
+    def neighbor(edge: int, node: int) -> int:
+        a, b, _ = edges[edge]
+        return b if a == node else a
+
+    def ordered(edge_ids: List[int]) -> List[int]:
+        # 重要关系类型在前
+        return sorted(edge_ids, key=lambda e: edges[e][2]['type'] not in IMPORTANT_RELATIONS)
+
+    cards = []
+    for i, node in enumerate(nodes):
+        if node['type'] not in card_types or not node['name']:
+            continue
+        one_hop = ordered(incident[i])
+        chosen = list(dict.fromkeys(one_hop))[:max_facts]
+        seen = set(chosen)
+        # 二跳: 一跳邻居的其他关系
+        for edge in one_hop:
+            if len(chosen) >= max_facts:
+                break
+            middle = neighbor(edge, i)
+            for second in ordered(incident[middle]):
+                if second in seen or i in edges[second][:2]:
+                    continue
+                seen.add(second)
+                chosen.append(second)
+                if len(chosen) >= max_facts:
+                    break
+        cards.append(render_card(node, [fact(edge) for edge in chosen]))
+
+    meta = {
+        'graph_version': graph_version,
+        'card_types': list(card_types),
+        'max_facts': max_facts,
+        'built_at': time.time()
+    }
+    return KnowledgeCards(meta, cards)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为疾病、治疗节点预先生成知识卡片")
+    parser.add_argument('--output', default=DEFAULT_PATH, help=f"卡片文件,默认 {DEFAULT_PATH}")
+    parser.add_argument('--backend', default=None, help="neo4j 或 sqlite,默认读取 GRAPH_BACKEND")
+    parser.add_argument('--sqlite-path', default=None)
+    parser.add_argument('--max-facts', type=int, default=DEFAULT_MAX_FACTS)
+    args = parser.parse_args()
+
+    store = create_graph_store(args.backend, sqlite_path=args.sqlite_path)
+    try:
+        start = time.perf_counter()
+        cards = build_knowledge_cards(store, max_facts=args.max_facts)
+        cards.save(args.output)
+    finally:
+        store.close()
+    print(f"已生成 {len(cards)} 张知识卡片(图版本 {cards.graph_version}, "
+          f"耗时 {time.perf_counter() - start:.1f}s),保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
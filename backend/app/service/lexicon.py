@@ -0,0 +1,206 @@
+"""
+图谱实体词表
+
+进程内缓存整个图谱的实体名称与别名,供问题的实体链接(entity_linker)和答案验证(validation)共用:
+- EntityMatcher / find_spans / spot_entities: 词典最长匹配,扫描一遍找出文本中的实体
+- Lexicon: 一次加载得到的快照(名称与别名 -> 标准名、匹配词典)
+- GraphLexicon: 懒加载快照,invalidate()(图版本变化)或设置的 ENTITY_LEXICON_TTL 秒过后重新加载;
+  已有旧快照时在后台线程加载,派生结构(如实体链接的 n-gram 索引,见 derive())随快照一起构建后整体替换,
+  请求线程不等待加载;有与当前图版本一致的快照(knowledge.graph.snapshot)时从快照读取节点
+
+别名取自节点属性 '别名' 或 'aliases'(列表,或以 、,，;；/ 分隔的字符串)。
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.knowledge.graph.snapshot import matching_snapshot
+
+logger = logging.getLogger(__name__)
+
+# 默认不按时间过期: 图版本变化且有节点变更时由 invalidate() 触发重新加载(见 KnowledgeGraphRetrieval._on_graph_change);
+# 只在没有图版本的部署中需要设置
+DEFAULT_TTL = float(os.getenv('ENTITY_LEXICON_TTL', '0'))
+
+# 加载失败后的重试间隔(秒)
+RETRY_SECONDS = 30.0
+
+ALIAS_PROPERTIES = ('别名', 'aliases')
+_ALIAS_SPLIT = re.compile(r'[、,，;；/]+')
+
+
+class EntityMatcher:
+    """词典最长匹配: 按首字记录名称长度,扫描时每个位置只尝试以该字开头的名称长度"""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: Set[str] = set()
+        self._lengths: Dict[str, List[int]] = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str):
+        if not name or name in self.names:
+            return
+        self.names.add(name)
+        lengths = self._lengths.setdefault(name[0], [])
+        if len(name) not in lengths:
+            lengths.append(len(name))
+            lengths.sort(reverse=True)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def find_spans(text: str, matchers: List[EntityMatcher]) -> List[Tuple[int, int]]:
+    """
+    text 中各词典实体的位置 [(start, end)],从左到右取最长匹配,匹配之间不重叠
+    (例如 "高血压危象" 只记为一个实体,不再同时记 "高血压")
+    """
+    spans = []
+    i, n = 0, len(text)
+    while i < n:
+        candidates = [matcher._lengths[text[i]] for matcher in matchers if text[i] in matcher._lengths]
+        if not candidates:
+            i += 1
+            continue
+        lengths = candidates[0] if len(candidates) == 1 else sorted(set().union(*candidates), reverse=True)
+        matched = 0
+        for length in lengths:
+            if i + length <= n and any(text[i:i + length] in matcher.names for matcher in matchers):
+                spans.append((i, i + length))
+                matched = length
+                break
+        i += matched or 1
+    return spans
+
+
+def spot_entities(text: str, matchers: List[EntityMatcher]) -> List[str]:
+    """text 中出现的实体,按出现顺序去重"""
+    return list(dict.fromkeys(text[start:end] for start, end in find_spans(text, matchers)))
+
+
+def node_aliases(properties: Dict) -> List[str]:
+    aliases = []
+    for key in ALIAS_PROPERTIES:
+        value = properties.get(key)
+        if isinstance(value, str):
+            aliases.extend(_ALIAS_SPLIT.split(value))
+        elif isinstance(value, (list, tuple)):
+            aliases.extend(str(item) for item in value)
+    return [alias.strip() for alias in aliases if alias and alias.strip()]
+
+
+class Lexicon:
+    """
+    词表快照
+    Args:
+        nodes: [{'name', 'properties'}],通常来自 GraphStore.dump_nodes()
+    """
+
+    def __init__(self, nodes: Iterable[Dict]):
+        # 名称/别名 -> 标准名;与其他实体名称相同的别名不生效
+        self.canonical: Dict[str, str] = {}
+        aliases = []
+        for node in nodes:
+            name = node.get('name')
+            if not name:
+                continue
+            self.canonical.setdefault(name, name)
+            aliases.extend((alias, name) for alias in node_aliases(node.get('properties') or {}))
+        self.names = set(self.canonical)
+        for alias, name in aliases:
+            self.canonical.setdefault(alias, name)
+
+        self.matcher = EntityMatcher(self.canonical)
+        # 由 GraphLexicon.derive() 注册的派生结构,名称 -> 对象
+        self.derived: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class GraphLexicon:
+    """
+    懒加载的图谱词表,超过 ttl 秒(ttl <= 0 表示不过期)或 invalidate() 后下次使用时重新加载。
+    第一次加载(通常在预热阶段)在调用线程中进行;之后的重新加载由一个后台线程完成,
+    期间所有调用直接使用旧快照。加载失败时沿用旧快照(没有时返回 None,调用方退回各自的备用方法)。
+    Args:
+        store: 图存储
+        ttl: 过期秒数
+        version: 返回当前图版本的函数,快照文件的版本与之一致时从快照读取节点
+    """
+
+    def __init__(self, store, ttl: float = DEFAULT_TTL, version: Callable[[], Any] = lambda: None):
+        self.store = store
+        self.ttl = ttl
+        self.version = version
+        self._lexicon: Optional[Lexicon] = None
+        self._loaded_at = 0.0
+        self._retry_at = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._builders: Dict[str, Callable[[Lexicon], Any]] = {}
+
+    def derive(self, name: str, builder: Callable[[Lexicon], Any]):
+        """注册派生结构: 每次加载时在替换快照之前构建,结果放在 lexicon.derived[name]"""
+        self._builders[name] = builder
+
+    def _stale(self) -> bool:
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        return (self._lexicon is None or self._dirty
+                or (self.ttl > 0 and now - self._loaded_at > self.ttl))
+
+    def get(self) -> Optional[Lexicon]:
+        if not self._stale():
+            return self._lexicon
+        if self._pid != os.getpid():
+            # fork 时父进程的后台加载线程不会带到子进程,锁可能处于持有状态
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+        if self._lexicon is None:
+            with self._lock:
+                if self._stale():
+                    self.load()
+        elif self._lock.acquire(blocking=False):
+            # 已有旧快照: 后台加载,本次及加载期间的调用都使用旧快照
+            threading.Thread(target=self._reload, name='lexicon-reload', daemon=True).start()
+        return self._lexicon
+
+    def _reload(self):
+        try:
+            if self._stale():
+                self.load()
+        finally:
+            self._lock.release()
+
+    def load(self):
+        start = time.perf_counter()
+        try:
+            snapshot = matching_snapshot(self.version())
+            lexicon = Lexicon(snapshot.iter_nodes() if snapshot is not None else self.store.dump_nodes())
+            for name, builder in self._builders.items():
+                lexicon.derived[name] = builder(lexicon)
+        except Exception as e:
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+            logger.warning("⚠️  加载实体词表失败: %s", e)
+            return
+        self._lexicon = lexicon
+        self._loaded_at = time.monotonic()
+        self._dirty = False
+        logger.info("实体词表加载完成: %d 个实体, %d 个别名(%s), %.1fms", len(lexicon),
+                    len(lexicon.canonical) - len(lexicon), "快照" if snapshot is not None else "图存储",
+                    (time.perf_counter() - start) * 1000)
+
+    def invalidate(self):
+        """下次使用时重新加载"""
+        self._dirty = True
+        self._retry_at = 0.0
@@ -0,0 +1,118 @@
+"""
+跨请求微批处理
+
+并发请求各自提交单个任务,MicroBatcher 收集时间窗口内到达的任务合并为一次批量调用,
+再把结果分发回各个等待的请求。单个请求最多多等一个窗口。
+
+    batcher = MicroBatcher('extraction', batch_func, window_ms=20, max_batch=16)
+    result = batcher.submit(item)   # 阻塞直到所在批次完成
+
+batch_func 接收去重后的任务列表,返回等长的结果列表;抛出异常时同批次的所有请求收到该异常。
+批量调用在执行线程中以批次内最早的请求截止时间(deadline_scope)运行,
+不会在提交方放弃等待之后继续占用批次名额与下游配额。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from backend.app.service.metrics import REGISTRY
+from backend.knowledge.graph.deadline import current_deadline, deadline_scope
+
+logger = logging.getLogger(__name__)
+
+BATCHES = REGISTRY.counter(
+    'kg_microbatch_batches_total', "微批处理发出的批量调用次数", ['name'])
+ITEMS = REGISTRY.counter(
+    'kg_microbatch_items_total', "微批处理收到的任务数", ['name'])
+BATCH_SIZE = REGISTRY.histogram(
+    'kg_microbatch_batch_size', "每次批量调用包含的任务数(去重后)", ['name'],
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+QUEUE_WAIT = REGISTRY.histogram(
+    'kg_microbatch_wait_seconds', "任务从提交到所在批次发出的等待时间", ['name'])
+
+
+class MicroBatcher:
+    """
+    Args:
+        name: 指标标签
+        batch_func: 批量处理函数 List[item] -> List[result]
+        window_ms: 收集窗口,从批次中第一个任务到达开始计时
+        max_batch: 单批最多任务数,达到后立即发出
+        max_concurrent_batches: 同时在执行的批量调用数上限
+    """
+
+    def __init__(self, name: str, batch_func: Callable[[List[Any]], List[Any]],
+                 window_ms: float = 20, max_batch: int = 16, max_concurrent_batches: int = 8):
+        self.name = name
+        self.batch_func = batch_func
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.max_concurrent_batches = max_concurrent_batches
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._queue: queue.Queue = queue.Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _ensure_started(self):
+        # 收集线程按进程启动,fork 后的子进程重新创建
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_batches,
+                                                thread_name_prefix=f'microbatch-{self.name}')
+            threading.Thread(target=self._collect, name=f'microbatch-{self.name}', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """提交一个任务并等待结果,超过 timeout 秒抛出 concurrent.futures.TimeoutError(批次执行到批内最早的截止时间为止)"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((item, future, time.perf_counter(), current_deadline()))
+        ITEMS.inc(name=self.name)
+        return future.result(timeout=timeout)
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            window_end = batch[0][2] + self.window
+            while len(batch) < self.max_batch:
+                remaining = window_end - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            now = time.perf_counter()
+            for _, _, submitted, _ in batch:
+                QUEUE_WAIT.observe(now - submitted, name=self.name)
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[tuple]):
+        # 同一批次内的相同任务只处理一次
+        items = list(dict.fromkeys(item for item, _, _, _ in batch))
+        # 执行线程没有提交方的上下文,按批次内最早的截止时间执行
+        deadlines = [expires_at for _, _, _, expires_at in batch if expires_at is not None]
+        BATCHES.inc(name=self.name)
+        BATCH_SIZE.observe(len(items), name=self.name)
+        try:
+            with deadline_scope(min(deadlines) if deadlines else None):
+                results = self.batch_func(items)
+            if len(results) != len(items):
+                raise ValueError(f"批量结果数量 {len(results)} 与任务数量 {len(items)} 不一致")
+        except Exception as e:
+            logger.warning("微批处理 %s 失败(%d 个任务): %s", self.name, len(items), e)
+            for _, future, _, _ in batch:
+                future.set_exception(e)
+            return
+
+        by_item = dict(zip(items, results))
+        for item, future, _, _ in batch:
+            future.set_result(by_item[item])
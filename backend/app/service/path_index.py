@@ -0,0 +1,336 @@
+"""
+离线推理路径索引
+
+问答中的推理实体对大多是 疾病→药物 / 疾病→并发症 / 疾病→检查,这些类型的节点在构建完成后就是确定的。
+构建后运行一次:
+
+    python -m backend.app.service.path_index --output reasoning_paths.kgp
+
+对每个疾病节点按层(跳数)展开,与在线 find_paths 语义一致(无向、同一路径内关系不重复),
+每个 (起点, 终点) 取跳数最少的 limit 条路径,按 ranking.score_reasoning_paths 评分后写入索引。
+在线推理先查索引,命中时直接返回已评分的路径;反向的实体对(如 药物→疾病)把路径倒过来返回。
+
+在线 find_paths 按名称包含匹配节点,名称被其他名称包含(或重名)的节点匹配到的不止一个,
+这类名称不进索引,查询时回退到在线搜索。索引记录构建时的图版本和评分规则,与当前不一致时整体不用。
+
+文件格式(小端序): 魔数、JSON 头部长度、JSON 头部(元信息、字符串表、各列长度)、各列数组;
+路径按列存放(节点与关系为字符串ID),加载后常驻内存的只有这些数组和实体对的位置表。
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from backend.app.service.metrics import REGISTRY
+from backend.app.service.ranking import DEFAULT_ALPHA, score_reasoning_paths
+from backend.knowledge.graph.store import MAX_FRONTIER_PATHS, GraphStore, create_graph_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.getenv('PATH_INDEX_PATH', 'reasoning_paths.kgp')
+DEFAULT_MAX_HOPS = 3
+# 与在线 find_paths 的 limit 一致
+DEFAULT_LIMIT = 10
+# (起点类型, 终点类型)
+DEFAULT_PAIR_TYPES = (('疾病', '药物'), ('疾病', '并发症'), ('疾病', '检查'))
+
+MAGIC = b'KGPATH\x00\x00'
+FORMAT_VERSION = 1
+_LENGTH = struct.Struct('<I')
+
+# 列名与类型码
+COLUMNS = (
+    ('name_ids', 'I'), ('name_types', 'I'),
+    ('pair_start', 'I'), ('pair_end', 'I'), ('pair_first', 'I'), ('pair_count', 'I'),
+    ('path_offsets', 'I'), ('path_nodes', 'I'), ('path_relations', 'I'),
+    ('path_scores', 'd'), ('path_centrality', 'd'),
+)
+
+INDEX_LOOKUPS = REGISTRY.counter(
+    'kg_path_index_lookups_total', "推理路径索引查询次数(hit 命中, miss 实体对不在索引中, stale 索引与图版本或评分规则不一致)",
+    ['result'])
+
+
+def ambiguous_names(names: Iterable[str]) -> set:
+    """重名或被其他名称包含的名称(在线按包含匹配时会匹配到多个节点)"""
+    counts = Counter(names)
+    result = {name for name, count in counts.items() if count > 1}
+    lengths = sorted({len(name) for name in counts})
+    for name in counts:
+        for length in lengths:
+            if length >= len(name):
+                break
+            for i in range(len(name) - length + 1):
+                part = name[i:i + length]
+                if part in counts:
+                    result.add(part)
+    return result
+
+
+def _le_bytes(column: array) -> bytes:
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+class PathIndex:
+    """
+    已加载的推理路径索引
+    Args:
+        meta: {'graph_version', 'max_hops', 'limit', 'alpha'(None 表示评分未使用中心度), 'pair_types'}
+        strings: 字符串表
+        columns: 各列数组
+    """
+
+    def __init__(self, meta: Dict[str, Any], strings: List[str], columns: Dict[str, array]):
+        self.meta = meta
+        self.graph_version = meta['graph_version']
+        self.max_hops = meta['max_hops']
+        self.alpha = meta['alpha']
+        self.pair_types = {tuple(pair) for pair in meta['pair_types']}
+        self.strings = strings
+        self.columns = columns
+        # 名称 -> 字符串ID、类型
+        self.ids = {strings[i]: i for i in columns['name_ids']}
+        self.types = {strings[i]: strings[t] for i, t in zip(columns['name_ids'], columns['name_types'])}
+        # (起点ID, 终点ID) -> (首条路径下标, 路径数)
+        self.pairs = {(s, e): (first, count) for s, e, first, count in zip(
+            columns['pair_start'], columns['pair_end'], columns['pair_first'], columns['pair_count'])}
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def lookup(self, start: str, end: str, max_hops: int, graph_version: Any,
+               alpha: Optional[float]) -> Optional[List[Dict]]:
+        """
+        已评分的路径(与在线 multi_hop_reasoning 的结果格式相同);
+        实体对不在索引中、或索引与当前图版本 / 跳数 / 评分规则不一致时返回 None
+        """
+        if graph_version != self.graph_version or max_hops != self.max_hops or alpha != self.alpha:
+            INDEX_LOOKUPS.inc(result='stale')
+            return None
+
+        start_type, end_type = self.types.get(start), self.types.get(end)
+        if (start_type, end_type) in self.pair_types:
+            key, reverse = (self.ids[start], self.ids[end]), False
+        elif (end_type, start_type) in self.pair_types:
+            key, reverse = (self.ids[end], self.ids[start]), True
+        else:
+            INDEX_LOOKUPS.inc(result='miss')
+            return None
+
+        INDEX_LOOKUPS.inc(result='hit')
+        # 两端都已索引但没有记录: 跳数内不连通
+        first, count = self.pairs.get(key, (0, 0))
+        return [self._path(i, reverse) for i in range(first, first + count)]
+
+    def _path(self, i: int, reverse: bool) -> Dict:
+        columns, strings = self.columns, self.strings
+        begin, end = columns['path_offsets'][i], columns['path_offsets'][i + 1]
+        # 第 i 条路径的关系比节点少一个,关系列中的位置为节点位置减 i
+        nodes = [strings[s] for s in columns['path_nodes'][begin:end]]
+        relations = [strings[s] for s in columns['path_relations'][begin - i:end - i - 1]]
+        if reverse:
+            nodes.reverse()
+            relations.reverse()
+        path = {'nodes': nodes, 'relations': relations, 'hops': len(relations)}
+        if self.alpha is not None:
+            path['centrality'] = columns['path_centrality'][i]
+        path['score'] = columns['path_scores'][i]
+        return path
+
+    # ========== 读写 ==========
+
+    def save(self, path: str) -> str:
+        header = dict(self.meta, format=FORMAT_VERSION, strings=self.strings,
+                      columns=[[name, len(self.columns[name])] for name, _ in COLUMNS])
+        encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_LENGTH.pack(len(encoded)))
+            f.write(encoded)
+            for name, _ in COLUMNS:
+                f.write(_le_bytes(self.columns[name]))
+        # 先写临时文件再替换,服务端不会读到写了一半的索引
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'PathIndex':
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} 不是推理路径索引文件")
+        offset = len(MAGIC)
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        header = json.loads(data[offset:offset + length].decode('utf-8'))
+        offset += length
+        if header.get('format') != FORMAT_VERSION:
+            raise ValueError(f"不支持的索引格式版本: {header.get('format')}")
+
+        typecodes = dict(COLUMNS)
+        columns = {}
+        for name, count in header.pop('columns'):
+            column = array(typecodes[name])
+            size = count * column.itemsize
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns[name] = column
+            offset += size
+        strings = header.pop('strings')
+        header.pop('format')
+        return cls(header, strings, columns)
+
+
+def build_path_index(store: GraphStore, max_hops: int = DEFAULT_MAX_HOPS, limit: int = DEFAULT_LIMIT,
+                     pair_types: Sequence[Tuple[str, str]] = DEFAULT_PAIR_TYPES,
+                     alpha: Optional[float] = DEFAULT_ALPHA) -> PathIndex:
+    """
+    从图存储构建索引
+    Args:
+        alpha: 路径评分中心度的 PPR 重启概率,None 表示不用中心度(对应 RANKING_CANDIDATE_FACTOR=0)
+    """
+    # 先读版本再读数据: 读取期间有写入时,索引的版本落后,服务端不会使用
+    graph_version = store.graph_version()['version']
+    nodes = store.dump_nodes()
+    relationships = store.dump_relationships()
+
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    targets_by_type: Dict[str, set] = {}
+    for start_type, end_type in pair_types:
+        targets_by_type.setdefault(start_type, set()).add(end_type)
+    indexed_types = set(targets_by_type) | {end_type for _, end_type in pair_types}
+
+    ambiguous = ambiguous_names(node['name'] for node in nodes if node['name'])
+    names = [node['name'] for node in nodes]
+    types = [node['type'] for node in nodes]
+    indexed = [bool(name) and name not in ambiguous and node_type in indexed_types
+               for name, node_type in zip(names, types)]
+
+    # 与 upsert_edges 一致: 关系端点按实体ID匹配任意标签的节点
+    by_key: Dict[str, List[int]] = {}
+    for i, node in enumerate(nodes):
+        by_key.setdefault(node['key'], []).append(i)
+    adjacency: List[List[Tuple[int, int]]] = [[] for _ in nodes]
+    edge_types: List[str] = []
+    for rel in relationships:
+        for a in by_key.get(rel['source'], ()):
+            for b in by_key.get(rel['target'], ()):
+                edge = len(edge_types)
+                edge_types.append(rel['type'])
+                adjacency[a].append((edge, b))
+                if a != b:
+                    adjacency[b].append((edge, a))
+
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    columns['path_offsets'].append(0)
+    name_ids = {}
+    for i, flag in enumerate(indexed):
+        if flag and names[i] not in name_ids:
+            name_ids[names[i]] = intern(names[i])
+            columns['name_ids'].append(name_ids[names[i]])
+            columns['name_types'].append(intern(types[i]))
+
+    truncated = 0
+    for start in range(len(nodes)):
+        end_types = targets_by_type.get(types[start])
+        if not indexed[start] or not end_types:
+            continue
+
+        # 逐层展开,每个终点按跳数升序收集前 limit 条路径: (节点序列, 关系序列)
+        found: Dict[int, List[Tuple[tuple, tuple]]] = {}
+        frontier = [((start,), ())]
+        for _ in range(max_hops):
+            next_frontier = []
+            for path_nodes, path_edges in frontier:
+                for edge, neighbor in adjacency[path_nodes[-1]]:
+                    if edge in path_edges:
+                        continue
+                    extended = (path_nodes + (neighbor,), path_edges + (edge,))
+                    next_frontier.append(extended)
+                    if indexed[neighbor] and types[neighbor] in end_types:
+                        paths = found.setdefault(neighbor, [])
+                        if len(paths) < limit:
+                            paths.append(extended)
+            if len(next_frontier) > MAX_FRONTIER_PATHS:
+                truncated += 1
+                next_frontier = next_frontier[:MAX_FRONTIER_PATHS]
+            frontier = next_frontier
+
+        for end, candidates in found.items():
+            paths = score_reasoning_paths([{
+                'nodes': [names[n] for n in path_nodes],
+                'relations': [edge_types[e] for e in path_edges],
+                'hops': len(path_edges)
+            } for path_nodes, path_edges in candidates], use_centrality=alpha is not None,
+                alpha=alpha if alpha is not None else DEFAULT_ALPHA)
+
+            columns['pair_start'].append(name_ids[names[start]])
+            columns['pair_end'].append(name_ids[names[end]])
+            columns['pair_first'].append(len(columns['path_scores']))
+            columns['pair_count'].append(len(paths))
+            for path in paths:
+                columns['path_nodes'].extend(intern(name) for name in path['nodes'])
+                columns['path_relations'].extend(intern(rel) for rel in path['relations'])
+                columns['path_offsets'].append(len(columns['path_nodes']))
+                columns['path_scores'].append(path['score'])
+                columns['path_centrality'].append(path.get('centrality', 0.0))
+
+    if truncated:
+        logger.warning("%d 个起点的展开超过 %d 条候选路径,已截断", truncated, MAX_FRONTIER_PATHS)
+
+    meta = {
+        'graph_version': graph_version,
+        'max_hops': max_hops,
+        'limit': limit,
+        'alpha': alpha,
+        'pair_types': [list(pair) for pair in pair_types],
+        'built_at': time.time()
+    }
+    return PathIndex(meta, strings, columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预计算 疾病→药物/并发症/检查 的推理路径索引")
+    parser.add_argument('--output', default=DEFAULT_PATH, help=f"索引文件,默认 {DEFAULT_PATH}")
+    parser.add_argument('--backend', default=None, help="neo4j 或 sqlite,默认读取 GRAPH_BACKEND")
+    parser.add_argument('--sqlite-path', default=None)
+    parser.add_argument('--max-hops', type=int, default=DEFAULT_MAX_HOPS)
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    # 评分规则与服务端一致: RANKING_CANDIDATE_FACTOR=0 时不用中心度
+    alpha = DEFAULT_ALPHA if int(os.getenv('RANKING_CANDIDATE_FACTOR', '4')) > 0 else None
+
+    store = create_graph_store(args.backend, sqlite_path=args.sqlite_path)
+    try:
+        start = time.perf_counter()
+        index = build_path_index(store, args.max_hops, args.limit, alpha=alpha)
+        index.save(args.output)
+    finally:
+        store.close()
+    print(f"已索引 {len(index)} 个实体对、{len(index.columns['path_scores'])} 条路径"
+          f"(图版本 {index.graph_version}, 耗时 {time.perf_counter() - start:.1f}s),保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
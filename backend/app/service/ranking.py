@@ -0,0 +1,183 @@
+"""
+检索子图的个性化 PageRank 排序
+
+以匹配到的种子节点为重启分布,在检索得到的邻域(无向)上做幂迭代:
+    r = alpha * p + (1 - alpha) * (W r + 悬挂节点质量 * p)
+W 的稀疏矩阵-向量乘用 np.bincount 按终点累加实现,不构造矩阵,
+几千条边的邻域每次迭代为微秒级,整次排序在 1ms 以内,可以在每个请求上执行。
+
+- rank_subgraph: 为子图节点打分,按路径经过节点的得分选出前 top_k 条路径
+- rank_reasoning_paths: 以起止实体为种子,在候选推理路径的并图上打分,得到各路径中间节点的中心度
+- score_reasoning_paths: 推理路径综合评分(路径长度、关系类型、中心度),在线推理与离线路径索引共用
+"""
+import os
+from typing import Dict, Hashable, List, Sequence
+
+from backend.app.service.subgraph import Subgraph
+
+# 重启概率(每步回到种子节点的概率);检索邻域本身就在种子附近,取值比全图 PageRank 常用的 0.15 大,收敛也更快
+DEFAULT_ALPHA = float(os.getenv('PPR_ALPHA', '0.25'))
+# 只用于排序,L1 误差 1e-4 足够;alpha=0.25 时约 30 次迭代收敛
+DEFAULT_TOL = 1e-4
+DEFAULT_MAX_ITER = 50
+
+
+def personalized_pagerank(src, dst, num_nodes: int, seeds, alpha: float = DEFAULT_ALPHA,
+                          tol: float = DEFAULT_TOL, max_iter: int = DEFAULT_MAX_ITER):
+    """
+    Args:
+        src/dst: 边的端点下标(0..num_nodes-1),按无向边处理;重复边按重数计权,需要时由调用方去重
+        seeds: 种子节点下标
+    Returns:
+        长度为 num_nodes 的得分数组,总和为 1
+    """
+    # numpy 导入约 50ms,推迟到第一次排序
+    import numpy as np
+
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    seeds = np.asarray(seeds, dtype=np.int64)
+    if num_nodes == 0:
+        return np.zeros(0)
+
+    p = np.bincount(seeds, minlength=num_nodes).astype(np.float64) if len(seeds) else np.ones(num_nodes)
+    p /= p.sum()
+    if len(src) == 0:
+        return p
+
+    # 双向展开,去掉自环(np.unique 去重要排序,比整个迭代还慢,交给调用方)
+    keep = src != dst
+    s = np.concatenate([src[keep], dst[keep]])
+    d = np.concatenate([dst[keep], src[keep]])
+
+    out_degree = np.bincount(s, minlength=num_nodes).astype(np.float64)
+    dangling = out_degree == 0
+    weight = 1.0 / out_degree[s]
+
+    r = p.copy()
+    for _ in range(max_iter):
+        spread = np.bincount(d, weights=r[s] * weight, minlength=num_nodes)
+        updated = alpha * p + (1 - alpha) * (spread + r[dangling].sum() * p)
+        delta = np.abs(updated - r).sum()
+        r = updated
+        if delta < tol:
+            break
+    return r
+
+
+def _index(keys: Sequence[Hashable]) -> Dict[Hashable, int]:
+    index: Dict[Hashable, int] = {}
+    for key in keys:
+        if key not in index:
+            index[key] = len(index)
+    return index
+
+
+def rank_subgraph(subgraph: Subgraph, seed_ids: List[int], top_k: int = None,
+                  alpha: float = DEFAULT_ALPHA) -> Subgraph:
+    """
+    为子图节点计算以 seed_ids 为种子的 PPR 得分(写入节点的 'rank',按最大值归一化到 0-1),
+    路径得分为除起点外各节点得分的均值(写入 'rank'),按得分降序保留前 top_k 条路径,
+    节点与关系只保留被选中路径覆盖的部分。
+    """
+    import numpy as np
+
+    nodes = subgraph['nodes']
+    if not nodes:
+        return subgraph
+
+    index = _index(node['id'] for node in nodes)
+    rels = subgraph['relationships']
+    # 同一条边会出现在多条路径中,按端点去重
+    edges = {(index[rel['from']], index[rel['to']]) for rel in rels}
+    src = np.fromiter((edge[0] for edge in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((edge[1] for edge in edges), dtype=np.int64, count=len(edges))
+    seeds = [index[node_id] for node_id in seed_ids if node_id in index]
+
+    scores = personalized_pagerank(src, dst, len(index), seeds, alpha=alpha)
+    top = scores.max() or 1.0
+    # 逐条路径取均值时,Python 列表比对数组做花式索引快
+    normalized = (scores / top).tolist()
+
+    for node in nodes:
+        node['rank'] = round(normalized[index[node['id']]], 4)
+
+    paths = subgraph['paths']
+    for path in paths:
+        tail = [normalized[index[node_id]] for node_id in path.node_ids[1:]] \
+            or [normalized[index[path.node_ids[0]]]]
+        path['rank'] = round(sum(tail) / len(tail), 4)
+    # 得分相同时短路径优先
+    paths = sorted(paths, key=lambda path: (-path['rank'], path['length']))
+    if top_k is not None:
+        paths = paths[:top_k]
+
+    kept_ids = {node_id for path in paths for node_id in path.node_ids}
+    kept_nodes = sorted((node for node in nodes if node['id'] in kept_ids),
+                        key=lambda node: node['rank'], reverse=True)
+
+    return subgraph.select(kept_nodes, paths)
+
+
+def rank_reasoning_paths(paths: List[Dict], alpha: float = DEFAULT_ALPHA) -> List[float]:
+    """
+    候选推理路径(节点为名称)的中心度: 以各路径首尾节点为种子,在所有候选路径的并图上做 PPR,
+    路径中心度为中间节点得分的均值(按最大值归一化);单跳路径直接相连,记为 1。
+    """
+    if not paths:
+        return []
+
+    index = _index(name for path in paths for name in path['nodes'])
+    edges, seeds = set(), []
+    for path in paths:
+        ids = [index[name] for name in path['nodes']]
+        edges.update(zip(ids[:-1], ids[1:]))
+        seeds.extend((ids[0], ids[-1]))
+    src = [edge[0] for edge in edges]
+    dst = [edge[1] for edge in edges]
+
+    scores = personalized_pagerank(src, dst, len(index), seeds, alpha=alpha)
+    seed_set = set(seeds)
+    inner = [scores[i] for i in range(len(index)) if i not in seed_set]
+    top = max(inner) if inner else 1.0
+
+    centrality = []
+    for path in paths:
+        middle = [index[name] for name in path['nodes'][1:-1]]
+        if not middle:
+            centrality.append(1.0)
+        else:
+            centrality.append(float(sum(scores[i] for i in middle) / len(middle) / (top or 1.0)))
+    return centrality
+
+
+# 推理路径评分中视为重要的关系类型
+IMPORTANT_RELATIONS = ('需要治疗', '使用药物', '需要检查')
+
+
+def score_reasoning_paths(paths: List[Dict], use_centrality: bool = True,
+                          alpha: float = DEFAULT_ALPHA) -> List[Dict]:
+    """为推理路径写入 'score'(以及 'centrality'),按得分降序原地排序并返回"""
+    # 3. 中间节点在候选路径并图上的 PPR 中心度(多条候选路径共同经过的节点更可信)
+    centrality = rank_reasoning_paths(paths, alpha=alpha) if use_centrality else None
+
+    for i, path in enumerate(paths):
+        # 评分因素:
+        # 1. 路径长度(越短越好)
+        length_score = 1.0 / (path['hops'] + 1)
+
+        # 2. 关系类型重要性
+        rel_score = sum(1 for r in path['relations'] if r in IMPORTANT_RELATIONS) / len(path['relations']) if path[
+            'relations'] else 0
+
+        # 综合评分
+        if centrality is None:
+            path['score'] = 0.6 * length_score + 0.4 * rel_score
+        else:
+            path['centrality'] = round(centrality[i], 4)
+            path['score'] = 0.4 * length_score + 0.3 * rel_score + 0.3 * centrality[i]
+
+    # 排序
+    paths.sort(key=lambda x: x['score'], reverse=True)
+
+    return paths
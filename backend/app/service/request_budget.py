@@ -0,0 +1,117 @@
+"""
+请求级延迟预算
+
+每个问答请求有一个截止时间(REQUEST_DEADLINE_MS,可按请求覆盖,<= 0 表示不限制)。
+RequestBudget.scope() 把截止时间放入上下文,图查询(Neo4j 事务超时 / SQLite 语句中断)
+和 LLM 调用(请求超时)都以剩余时间为上限。
+
+可选阶段(额外的一致性采样、靠后的推理实体对、答案验证)执行前先估算:
+剩余时间扣除后续必需阶段(生成)的预计耗时后,放不下该阶段就跳过并记录。
+各阶段的预计耗时按实际耗时的指数滑动平均在进程内持续更新。
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from backend.app.service.metrics import REGISTRY
+from backend.knowledge.graph.deadline import deadline_scope
+
+DEFAULT_DEADLINE_MS = float(os.getenv('REQUEST_DEADLINE_MS', '30000'))
+
+# 各阶段的初始耗时估计(秒)
+DEFAULT_STAGE_SECONDS = {
+    'consistency_sample': 0.2,
+    'reasoning_pair': 0.2,
+    'generation': 8.0,
+    'validation': 0.02,
+}
+
+STAGES_SKIPPED = REGISTRY.counter(
+    'kg_stages_skipped_total', "因延迟预算不足跳过的阶段数", ['stage'])
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    'kg_request_deadline_exceeded_total', "结束时已超过截止时间的请求数")
+STAGE_ESTIMATE = REGISTRY.gauge(
+    'kg_stage_estimate_seconds', "调度使用的阶段预计耗时", ['stage'])
+
+
+class StageEstimator:
+    """阶段耗时的指数滑动平均"""
+
+    def __init__(self, defaults: Dict[str, float], smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self._estimates = dict(defaults)
+        for stage, seconds in self._estimates.items():
+            STAGE_ESTIMATE.set(seconds, stage=stage)
+
+    def estimate(self, stage: str) -> float:
+        return self._estimates.get(stage, 0.0)
+
+    def observe(self, stage: str, seconds: float):
+        previous = self._estimates.get(stage)
+        value = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+        self._estimates[stage] = value
+        STAGE_ESTIMATE.set(round(value, 4), stage=stage)
+
+
+ESTIMATES = StageEstimator(DEFAULT_STAGE_SECONDS)
+
+
+class RequestBudget:
+    """
+    Args:
+        deadline_ms: 本请求的延迟预算,None 时取 REQUEST_DEADLINE_MS,<= 0 表示不限制
+    """
+
+    def __init__(self, deadline_ms: Optional[float] = None, estimator: StageEstimator = ESTIMATES):
+        self.deadline_ms = DEFAULT_DEADLINE_MS if deadline_ms is None else float(deadline_ms)
+        self.estimator = estimator
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.deadline_ms / 1000 if self.deadline_ms > 0 else None
+        self.skipped: Dict[str, int] = {}
+
+    def remaining(self) -> Optional[float]:
+        return None if self.expires_at is None else self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        left = self.remaining()
+        return left is not None and left <= 0
+
+    def affords(self, stage: str, reserve: Iterable[str] = ()) -> bool:
+        """剩余时间扣除 reserve 中各阶段的预计耗时后,是否还放得下 stage"""
+        left = self.remaining()
+        if left is None:
+            return True
+        needed = self.estimator.estimate(stage) + sum(self.estimator.estimate(r) for r in reserve)
+        return left >= needed
+
+    def skip(self, stage: str, count: int = 1):
+        if count <= 0:
+            return
+        self.skipped[stage] = self.skipped.get(stage, 0) + count
+        STAGES_SKIPPED.inc(count, stage=stage)
+
+    @contextmanager
+    def stage(self, name: str):
+        """计时一个阶段并更新该阶段的预计耗时"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.estimator.observe(name, time.monotonic() - start)
+
+    def scope(self):
+        """在 with 块内把截止时间传给图查询与 LLM 调用"""
+        return deadline_scope(self.expires_at)
+
+    def summary(self) -> Dict:
+        elapsed_ms = (time.monotonic() - self.started_at) * 1000
+        if self.expired:
+            DEADLINE_EXCEEDED.inc()
+        return {
+            'deadline_ms': self.deadline_ms if self.expires_at is not None else None,
+            'elapsed_ms': round(elapsed_ms, 1),
+            'expired': self.expired,
+            'skipped': dict(self.skipped)
+        }
@@ -0,0 +1,235 @@
+"""
+外部调用的熔断与对冲请求
+
+CircuitBreaker: 按最近 window 次调用统计失败率与慢调用率,任一超过阈值即熔断(open),
+熔断期间的调用直接抛出 CircuitOpenError,由调用方走备用逻辑;open_seconds 后进入半开(half_open),
+放行少量探测调用,探测成功且不慢则恢复(closed),否则重新熔断。
+
+    breaker = CircuitBreaker('deepseek')
+    breaker.before_call()                 # 熔断时抛出 CircuitOpenError
+    try:
+        result = call()
+    except Exception:
+        breaker.record(elapsed, failed=True)
+        raise
+    breaker.record(elapsed, failed=False)
+
+调用因请求自身的截止时间而中止(不反映下游状态)时用 release() 归还名额,不计入统计。
+
+Hedger: 幂等的短调用超过 delay 仍未返回时再发一次相同请求,取先成功的结果;
+同时在途的请求数有上限,达到上限时不再对冲,避免服务变慢时把负载翻倍。
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from backend.app.service.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = int(os.getenv('CIRCUIT_WINDOW', '20'))
+DEFAULT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', '5'))
+DEFAULT_FAILURE_RATE = float(os.getenv('CIRCUIT_FAILURE_RATE', '0.5'))
+DEFAULT_SLOW_SECONDS = float(os.getenv('CIRCUIT_SLOW_SECONDS', '15'))
+DEFAULT_SLOW_RATE = float(os.getenv('CIRCUIT_SLOW_RATE', '0.5'))
+DEFAULT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+
+CIRCUIT_STATE = REGISTRY.gauge(
+    'kg_circuit_state', "熔断器状态: 0 closed, 1 half_open, 2 open", ['name'])
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    'kg_circuit_transitions_total', "熔断器状态切换次数", ['name', 'state'])
+CIRCUIT_REJECTED = REGISTRY.counter(
+    'kg_circuit_rejected_total', "熔断期间被直接拒绝的调用数", ['name'])
+HEDGED = REGISTRY.counter(
+    'kg_hedged_requests_total', "发出的对冲请求数", ['name'])
+HEDGE_WINS = REGISTRY.counter(
+    'kg_hedge_wins_total', "对冲请求先于原请求成功返回的次数", ['name'])
+
+
+class CircuitOpenError(Exception):
+    """熔断期间拒绝调用"""
+
+
+class CircuitBreaker:
+    """
+    Args:
+        name: 指标标签
+        window: 统计最近多少次调用
+        min_calls: 窗口内调用数达到该值才判断是否熔断
+        failure_rate / slow_rate: 失败率、慢调用率阈值
+        slow_seconds: 耗时超过该值记为慢调用
+        open_seconds: 熔断持续时间,之后进入半开
+        half_open_calls: 半开状态同时放行的探测调用数
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, window: int = DEFAULT_WINDOW, min_calls: int = DEFAULT_MIN_CALLS,
+                 failure_rate: float = DEFAULT_FAILURE_RATE, slow_seconds: float = DEFAULT_SLOW_SECONDS,
+                 slow_rate: float = DEFAULT_SLOW_RATE, open_seconds: float = DEFAULT_OPEN_SECONDS,
+                 half_open_calls: int = 1):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        # (失败, 慢调用)
+        self._outcomes: deque = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, name=name)
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            return self.HALF_OPEN
+        return self._state
+
+    def _transition(self, state: str):
+        if state == self._state:
+            return
+        self._state = state
+        CIRCUIT_STATE.set(self._STATE_VALUES[state], name=self.name)
+        CIRCUIT_TRANSITIONS.inc(name=self.name, state=state)
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+            logger.warning("熔断器 %s 打开,%.0fs 后半开探测", self.name, self.open_seconds)
+        else:
+            logger.info("熔断器 %s 进入 %s", self.name, state)
+
+    def allow(self) -> bool:
+        """是否放行一次调用;放行半开探测时占用一个探测名额,调用结束后必须 record"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN:
+                if self._state == self.OPEN:
+                    self._transition(self.HALF_OPEN)
+                    self._probes = 0
+                if self._probes < self.half_open_calls:
+                    self._probes += 1
+                    return True
+            CIRCUIT_REJECTED.inc(name=self.name)
+            return False
+
+    def before_call(self):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} 熔断中")
+
+    def record(self, seconds: float, failed: bool):
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if failed or slow:
+                    self._transition(self.OPEN)
+                else:
+                    self._outcomes.clear()
+                    self._transition(self.CLOSED)
+                return
+            if self._state == self.OPEN:
+                # 熔断前已放行的调用,结果不再计入
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slows = sum(1 for _, slow in self._outcomes if slow)
+            if failures / calls >= self.failure_rate or slows / calls >= self.slow_rate:
+                logger.warning("熔断器 %s: 最近 %d 次调用失败 %d 次、慢调用 %d 次",
+                               self.name, calls, failures, slows)
+                self._outcomes.clear()
+                self._transition(self.OPEN)
+
+    def release(self):
+        """放行的调用不计结果地结束(如请求截止时间已到): 只归还半开探测名额"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                'state': self.state,
+                'calls': calls,
+                'failures': sum(1 for failed, _ in self._outcomes if failed),
+                'slow_calls': sum(1 for _, slow in self._outcomes if slow)
+            }
+
+
+class Hedger:
+    """
+    Args:
+        name: 指标标签
+        delay_ms: 原请求超过该时间未返回时发出对冲请求,<= 0 时不对冲
+        max_in_flight: 经由对冲执行的在途请求上限
+    """
+
+    def __init__(self, name: str, delay_ms: float, max_in_flight: int = 8):
+        self.name = name
+        self.delay = delay_ms / 1000
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.delay > 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # 线程池按进程创建,fork 后的子进程重新创建
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._slots = threading.BoundedSemaphore(self.max_in_flight)
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                        thread_name_prefix=f'hedge-{self.name}')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _submit(self, func: Callable[[], Any]) -> Future:
+        # 每个请求在调用方上下文的副本中执行,追踪 span 仍记在原请求下
+        future = self._pool().submit(contextvars.copy_context().run, func)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        if not self.enabled:
+            return func()
+        self._pool()
+        if not self._slots.acquire(blocking=False):
+            return func()
+
+        primary = self._submit(func)
+        futures = [primary]
+        done, _ = wait(futures, timeout=self.delay)
+        if not done and self._slots.acquire(blocking=False):
+            HEDGED.inc(name=self.name)
+            futures.append(self._submit(func))
+
+        # 取先成功的结果;全部失败时抛出原请求的异常
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        HEDGE_WINS.inc(name=self.name)
+                    return future.result()
+        raise primary.exception()
@@ -0,0 +1,255 @@
+"""
+知识检索的进程内倒排索引
+
+原来的 search_nodes 对每个节点的若干属性做 toLower(...) CONTAINS 扫描,每次搜索都全图遍历且结果没有排序。
+SearchIndex 在进程内对节点名称、别名和各文本属性(症状描述、注意事项等)建立倒排索引:
+- 分词: 中文按相邻两字(bigram)切分,连续字母数字作为一个词;单字查询展开为包含该字的全部词
+- 排序: BM25,名称与别名的词频加权(NAME_WEIGHT / ALIAS_WEIGHT)
+- 支持按节点类型过滤与分页
+
+GraphSearch 懒加载索引,图版本(GraphVersionWatcher)变化后下次搜索时重建,重建期间其他请求继续使用旧索引。
+有与当前图版本一致的快照(snapshot.matching_snapshot)时从快照构建: 索引只保存倒排表与各文档的类型、
+名称长度,结果中的节点按下标从映射中读取,各 worker 不再各自保存一份节点属性。
+"""
+import logging
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.app.service.lexicon import ALIAS_PROPERTIES, node_aliases
+from backend.app.service.metrics import REGISTRY
+from backend.knowledge.graph.snapshot import KnowledgeGraphSnapshot, matching_snapshot
+
+logger = logging.getLogger(__name__)
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+# 名称、别名相对其他属性的词频权重
+NAME_WEIGHT = 3.0
+ALIAS_WEIGHT = 2.0
+# 不参与检索的属性
+SKIPPED_PROPERTIES = ('id', 'name') + ALIAS_PROPERTIES
+
+MAX_PAGE_SIZE = 100
+# 加载失败后的重试间隔(秒)
+RETRY_SECONDS = 30.0
+
+INDEX_BUILDS = REGISTRY.counter(
+    'kg_search_index_builds_total', "知识检索索引构建次数", ['status'])
+INDEX_DOCUMENTS = REGISTRY.gauge(
+    'kg_search_index_documents', "知识检索索引中的节点数")
+SEARCH_SECONDS = REGISTRY.histogram(
+    'kg_search_duration_seconds', "知识检索耗时(不含索引构建)",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+_CJK = r'㐀-䶿一-鿿'
+_RUNS = re.compile(rf'[{_CJK}]+|[a-z0-9]+')
+_CJK_CHAR = re.compile(rf'[{_CJK}]')
+
+
+def tokenize(text: str) -> List[str]:
+    """中文连续片段切成相邻两字(单字片段保留单字),字母数字按连续片段成词,统一小写"""
+    tokens = []
+    for run in _RUNS.findall(text.lower()):
+        if len(run) > 1 and _CJK_CHAR.match(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class SearchIndex:
+    """
+    Args:
+        nodes: [{'key', 'name', 'type', 'properties'}],通常来自 GraphStore.dump_nodes()
+        graph_version: 构建时的图版本
+    """
+
+    def __init__(self, nodes: Iterable[Dict], graph_version: Any = None):
+        docs = list(nodes)
+        self._build(len(docs), docs.__getitem__, graph_version)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: KnowledgeGraphSnapshot, graph_version: Any = None) -> 'SearchIndex':
+        """从快照构建,文档即快照中的节点下标"""
+        index = cls.__new__(cls)
+        index._build(snapshot.num_nodes, snapshot.dump_node, graph_version)
+        return index
+
+    def _build(self, size: int, node: Callable[[int], Dict], graph_version: Any):
+        self.graph_version = graph_version
+        # 文档下标 -> 节点 {'key', 'name', 'type', 'properties'}
+        self.node = node
+        self.size = size
+        self.doc_types: List[Optional[str]] = []
+        self.name_lengths: List[int] = []
+        self.doc_lengths: List[float] = []
+        # 词 -> [(文档下标, 加权词频)]
+        postings: Dict[str, Dict[int, float]] = {}
+        # 类型字符串共用一份
+        types: Dict[Any, Any] = {}
+
+        for doc in range(size):
+            node_data = node(doc)
+            self.doc_types.append(types.setdefault(node_data['type'], node_data['type']))
+            self.name_lengths.append(len(node_data.get('name') or ''))
+            length = 0.0
+            for text, weight in self._fields(node_data):
+                for token in tokenize(text):
+                    counts = postings.setdefault(token, {})
+                    counts[doc] = counts.get(doc, 0.0) + weight
+                    length += weight
+            self.doc_lengths.append(length)
+
+        self.postings: Dict[str, List[Tuple[int, float]]] = {
+            token: list(counts.items()) for token, counts in postings.items()}
+        total = size
+        self.average_length = (sum(self.doc_lengths) / total) if total else 0.0
+        self.idf: Dict[str, float] = {
+            token: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for token, docs in self.postings.items()}
+        # 单字 -> 包含该字的词,单字查询时展开
+        self._terms_by_char: Dict[str, List[str]] = {}
+        for token in self.postings:
+            if _CJK_CHAR.match(token):
+                for char in set(token):
+                    self._terms_by_char.setdefault(char, []).append(token)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @staticmethod
+    def _fields(node: Dict) -> List[Tuple[str, float]]:
+        properties = node.get('properties') or {}
+        fields = [(node.get('name') or '', NAME_WEIGHT)]
+        fields.extend((alias, ALIAS_WEIGHT) for alias in node_aliases(properties))
+        fields.extend((value, 1.0) for key, value in properties.items()
+                      if key not in SKIPPED_PROPERTIES and isinstance(value, str))
+        return fields
+
+    def _query_terms(self, query: str) -> List[List[str]]:
+        """查询中的每个词对应的索引词(单字展开为多个)"""
+        groups = []
+        for token in dict.fromkeys(tokenize(query)):
+            if len(token) == 1 and _CJK_CHAR.match(token):
+                groups.append(self._terms_by_char.get(token, []))
+            else:
+                groups.append([token] if token in self.postings else [])
+        return groups
+
+    def search(self, query: str, types: Optional[Iterable[str]] = None, page: int = 1,
+               page_size: int = 20) -> Dict[str, Any]:
+        """
+        Returns:
+            {'total': 命中数, 'page', 'page_size',
+             'results': [{'key', 'name', 'type', 'properties', 'score', 'matched_fields'}]}
+        """
+        page = max(1, page)
+        page_size = min(max(1, page_size), MAX_PAGE_SIZE)
+        types = set(types) if types else None
+
+        groups = self._query_terms(query)
+        scores: Dict[int, float] = {}
+        # 文档命中的查询词数
+        hits: Dict[int, int] = {}
+        for terms in groups:
+            matched = set()
+            for term in terms:
+                idf = self.idf[term]
+                for doc, tf in self.postings[term]:
+                    if types is not None and self.doc_types[doc] not in types:
+                        continue
+                    norm = K1 * (1 - B + B * self.doc_lengths[doc] / self.average_length)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+                    matched.add(doc)
+            for doc in matched:
+                hits[doc] = hits.get(doc, 0) + 1
+
+        # 按命中查询词的比例折算,只命中部分片段(如 "呼吸困难" 只命中 "呼吸")的排在后面;得分相同时名称短的在前
+        ranked = sorted(((doc, score * hits[doc] / len(groups)) for doc, score in scores.items()),
+                        key=lambda item: (-item[1], self.name_lengths[item[0]]))
+        offset = (page - 1) * page_size
+        terms = {term for group in groups for term in group}
+        results = []
+        for doc, score in ranked[offset:offset + page_size]:
+            node = self.node(doc)
+            results.append(dict(node, score=round(score, 4), matched_fields=self._matched_fields(node, terms)))
+        return {'total': len(ranked), 'page': page, 'page_size': page_size, 'results': results}
+
+    @staticmethod
+    def _matched_fields(node: Dict, terms: set) -> List[str]:
+        """包含查询词的字段(用于结果展示)"""
+        matched = []
+        if terms & set(tokenize(node.get('name') or '')):
+            matched.append('name')
+        for key, value in (node.get('properties') or {}).items():
+            if key not in ('id', 'name') and isinstance(value, str) and terms & set(tokenize(value)):
+                matched.append(key)
+        return matched
+
+
+class GraphSearch:
+    """
+    懒加载的图谱检索索引
+    Args:
+        store: 图存储
+        version: 返回当前图版本的函数,与索引构建时的版本不同则重建
+    """
+
+    def __init__(self, store, version: Callable[[], Any] = lambda: None):
+        self.store = store
+        self.version = version
+        self._index: Optional[SearchIndex] = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _stale(self) -> bool:
+        if time.monotonic() < self._retry_at:
+            return False
+        return self._index is None or self._index.graph_version != self.version()
+
+    def get(self) -> Optional[SearchIndex]:
+        """当前索引;需要重建时由一个请求重建,已有旧索引的其他请求不等待"""
+        if self._stale() and self._lock.acquire(blocking=self._index is None):
+            try:
+                if self._stale():
+                    self.load()
+            finally:
+                self._lock.release()
+        return self._index
+
+    def load(self):
+        start = time.perf_counter()
+        try:
+            # 先读版本再读数据: 读取期间有写入时,版本落后,下次搜索时再次重建
+            version = self.version()
+            snapshot = matching_snapshot(version)
+            if snapshot is not None:
+                index = SearchIndex.from_snapshot(snapshot, version)
+            else:
+                index = SearchIndex(self.store.dump_nodes(), version)
+        except Exception as e:
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+            INDEX_BUILDS.inc(status='error')
+            logger.warning("⚠️  构建知识检索索引失败: %s", e)
+            return
+        self._index = index
+        INDEX_BUILDS.inc(status='ok')
+        INDEX_DOCUMENTS.set(len(index))
+        logger.info("知识检索索引构建完成: %d 个节点, %d 个词, 图版本 %s(%s), %.1fms", len(index),
+                    len(index.postings), version, "快照" if snapshot is not None else "图存储",
+                    (time.perf_counter() - start) * 1000)
+
+    def search(self, query: str, types: Optional[Iterable[str]] = None, page: int = 1,
+               page_size: int = 20) -> Optional[Dict[str, Any]]:
+        """索引不可用时返回 None"""
+        index = self.get()
+        if index is None:
+            return None
+        start = time.perf_counter()
+        result = index.search(query, types, page, page_size)
+        SEARCH_SECONDS.observe(time.perf_counter() - start)
+        return result
@@ -0,0 +1,63 @@
+"""
+构建后生成的附属文件(推理路径索引、知识卡片)
+
+服务端第一次使用时加载,之后每 CHECK_SECONDS 秒最多检查一次文件修改时间,重新生成后自动换用新文件;
+文件不存在或损坏时 get() 返回 None,调用方回退到在线计算。
+加载结果需提供 len() 与 graph_version(构建时的图版本),调用方据此判断是否与当前图谱一致。
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 检查文件是否更新的最小间隔(秒)
+CHECK_SECONDS = 5.0
+
+
+class SidecarFile:
+    """
+    Args:
+        path: 文件路径
+        load: 从路径加载对象的函数
+        name: 日志中的名称
+    """
+
+    def __init__(self, path: str, load: Callable[[str], Any], name: str):
+        self.path = path
+        self.name = name
+        self._load = load
+        self._value: Optional[Any] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[Any]:
+        if time.monotonic() - self._checked_at >= CHECK_SECONDS and self._lock.acquire(blocking=False):
+            try:
+                self._checked_at = time.monotonic()
+                self._reload()
+            finally:
+                self._lock.release()
+        return self._value
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._value, self._mtime = None, None
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        start = time.perf_counter()
+        try:
+            self._value = self._load(self.path)
+        except Exception as e:
+            self._value = None
+            logger.warning("⚠️  加载%s失败: %s", self.name, e)
+            return
+        logger.info("%s加载完成: %d 条, 图版本 %s, %.1fms", self.name, len(self._value),
+                    self._value.graph_version, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,227 @@
+"""
+延迟构建服务与后台预热
+
+蓝图模块导入时只登记服务的构建方式(LazyService),第一次使用时才真正创建,
+worker 启动不再等待图数据库。create_app() 之后由 WarmUp 在后台线程中:
+1. 构建已登记的服务
+2. 连接图存储(失败时退避重试,直到成功)
+3. 检查约束/索引是否齐全(只记录,不阻塞)
+4. 执行已登记的缓存预加载(WARMUP_PRELOAD=名称1,名称2 或 all)
+
+进度通过 /ready 接口对外报告,全部完成前返回 503。
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.app.service.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = REGISTRY.gauge(
+    'kg_startup_seconds', "启动各阶段耗时(导入、create_app、预热)", ['phase'])
+READY = REGISTRY.gauge('kg_ready', "预热是否完成(1 表示就绪)")
+
+# 连接失败时的重试间隔(秒),逐次翻倍到上限
+RETRY_INITIAL_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+
+class LazyService:
+    """
+    第一次访问属性时才调用 factory 构建的服务代理。
+    属性访问透传给真实对象,因此调用方写法与直接持有实例相同。
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        _services.append(self)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def constructed(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    self._instance = self._factory()
+                    logger.info("服务 %s 构建完成 %.1fms", self._name, (time.perf_counter() - start) * 1000)
+                instance = self._instance
+        return instance
+
+    def set(self, instance):
+        """替换为指定实例(基准测试、调试时使用)"""
+        with self._lock:
+            self._instance = instance
+
+    def __getattr__(self, item):
+        return getattr(self.get(), item)
+
+    def __setattr__(self, key, value):
+        if key.startswith('_'):
+            object.__setattr__(self, key, value)
+        else:
+            setattr(self.get(), key, value)
+
+
+_services: List[LazyService] = []
+
+# 缓存预加载: 名称 -> 函数,由各模块在导入时登记
+_preloaders: Dict[str, Callable[[], Any]] = {}
+
+
+def register_preload(name: str, func: Callable[[], Any]):
+    """登记一个预热阶段可选执行的缓存预加载函数"""
+    _preloaders[name] = func
+
+
+def _enabled_preloads() -> List[str]:
+    setting = os.getenv('WARMUP_PRELOAD', '').strip()
+    if not setting:
+        return []
+    if setting == 'all':
+        return list(_preloaders)
+    return [name.strip() for name in setting.split(',') if name.strip()]
+
+
+class WarmUp:
+    """后台预热,每个进程一次;fork 出的子进程会重新开始"""
+
+    STEPS = ('services', 'connect', 'schema', 'preload')
+    # 这两步失败时不就绪;约束检查与预加载失败只记录
+    REQUIRED = ('services', 'connect')
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.missing_schema: List[str] = []
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.started_at = time.perf_counter()
+            self.finished_at = 0.0
+            self.steps = {step: {'status': 'pending'} for step in self.STEPS}
+            READY.set(0)
+            self._thread = threading.Thread(target=self._run, name='kg-warmup', daemon=True)
+            self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        if self._pid != os.getpid() or not self.finished_at:
+            return False
+        return all(self.steps[step]['status'] == 'done' for step in self.REQUIRED)
+
+    def _step(self, name: str, func: Callable[[], Any]):
+        self.steps[name] = {'status': 'running'}
+        start = time.perf_counter()
+        try:
+            detail = func()
+            self.steps[name] = {'status': 'done', 'ms': round((time.perf_counter() - start) * 1000, 1)}
+            if detail:
+                self.steps[name]['detail'] = detail
+        except Exception as e:
+            self.steps[name] = {'status': 'failed', 'error': str(e),
+                                'ms': round((time.perf_counter() - start) * 1000, 1)}
+            logger.warning("预热阶段 %s 失败: %s", name, e)
+
+    def _stores(self) -> List[Any]:
+        stores = []
+        for service in _services:
+            store = getattr(service.get(), 'store', None)
+            if store is not None and all(store is not s for s in stores):
+                stores.append(store)
+        return stores
+
+    def _construct(self):
+        for service in _services:
+            service.get()
+        return [service.name for service in _services]
+
+    def _connect(self):
+        # 图数据库短暂不可用时持续重试,不让 worker 退出
+        delay = RETRY_INITIAL_DELAY
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                for store in self._stores():
+                    store.ping()
+                    logger.info("✓ 图存储连接成功 (%s)", store.backend)
+                return {'attempts': attempts}
+            except Exception as e:
+                self.steps['connect'] = {'status': 'retrying', 'attempts': attempts, 'error': str(e)}
+                logger.warning("图存储连接失败(第 %d 次),%.1fs 后重试: %s", attempts, delay, e)
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    def _check_schema(self):
+        missing = []
+        for store in self._stores():
+            missing.extend(store.missing_schema())
+        self.missing_schema = missing
+        if missing:
+            logger.warning("图存储缺少约束/索引: %s", ', '.join(missing))
+        return {'missing': missing} if missing else None
+
+    def _preload(self):
+        loaded = []
+        for name in _enabled_preloads():
+            func = _preloaders.get(name)
+            if func is None:
+                logger.warning("未知的预加载项: %s", name)
+                continue
+            func()
+            loaded.append(name)
+        return loaded
+
+    def _run(self):
+        self._step('services', self._construct)
+        if self.steps['services']['status'] != 'done':
+            self.finished_at = time.perf_counter()
+            return
+        self._step('connect', self._connect)
+        self._step('schema', self._check_schema)
+        if _enabled_preloads():
+            self._step('preload', self._preload)
+        else:
+            self.steps['preload'] = {'status': 'skipped'}
+
+        self.finished_at = time.perf_counter()
+        STARTUP_SECONDS.set(round(self.finished_at - self.started_at, 4), phase='warmup')
+        READY.set(1 if self.ready else 0)
+        logger.info("预热完成 %.1fms", (self.finished_at - self.started_at) * 1000)
+
+    def status(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at if self.started_at else 0
+        return {
+            'ready': self.ready,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'steps': dict(self.steps),
+            'startup_seconds': {
+                phase: STARTUP_SECONDS.value(phase=phase) for phase in ('import', 'create_app', 'warmup')
+            }
+        }
+
+
+WARMUP = WarmUp()
@@ -0,0 +1,201 @@
+"""
+紧凑子图表示
+
+热门节点会出现在几十条扩展路径中,自一致性检索又会同时持有多次采样的子图。
+Subgraph 把节点表、关系表各存一份(__slots__ 记录),路径只保存节点ID / 关系ID序列,
+读取方式与原来的字典子图相同:
+
+    subgraph['nodes'] / subgraph['relationships'] / subgraph['paths']   -> 记录列表
+    node['name'], node.get('rank', 0), rel['from_name'], path['nodes'], path['description']
+
+路径的节点列表与描述在读取时才生成。记录在检索阶段写入排序得分(rank)后由子图缓存在请求之间共享,
+之后只读;需要附加一致性等字段时先 copy()。
+"""
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+
+class _Record(Mapping):
+    """__slots__ 记录的映射视图;未设置的可选字段视为不存在"""
+
+    __slots__ = ()
+    # 对外的键,按顺序迭代
+    KEYS: Tuple[str, ...] = ()
+    # 允许通过 record[key] = value 写入的键
+    MUTABLE: Tuple[str, ...] = ('rank', 'consistency')
+
+    def _get(self, key: str) -> Any:
+        return getattr(self, key)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.KEYS:
+            raise KeyError(key)
+        try:
+            return self._get(key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self.MUTABLE:
+            raise TypeError(f"{type(self).__name__} 的 {key} 字段只读")
+        setattr(self, key, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in self.KEYS if key in self)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def copy(self) -> '_Record':
+        """浅复制(属性字典共享)"""
+        clone = object.__new__(type(self))
+        for slot in self.__slots__:
+            if hasattr(self, slot):
+                setattr(clone, slot, getattr(self, slot))
+        return clone
+
+
+class NodeRecord(_Record):
+    __slots__ = ('id', 'type', 'name', 'properties', 'rank', 'consistency')
+    KEYS = __slots__
+
+    def __init__(self, node_id: int, node_type: str, name: str, properties: Dict[str, Any]):
+        self.id = node_id
+        self.type = node_type
+        self.name = name
+        self.properties = properties
+
+
+class RelationshipRecord(_Record):
+    """start / end 为关系本身方向上的端点记录"""
+
+    __slots__ = ('id', 'start', 'end', 'type', 'properties', 'consistency')
+    KEYS = ('id', 'from', 'from_name', 'to', 'to_name', 'type', 'properties', 'consistency')
+    MUTABLE = ('consistency',)
+
+    def __init__(self, rel_id: int, start: NodeRecord, end: NodeRecord, rel_type: str,
+                 properties: Dict[str, Any]):
+        self.id = rel_id
+        self.start = start
+        self.end = end
+        self.type = rel_type
+        self.properties = properties
+
+    def _get(self, key: str) -> Any:
+        if key == 'from':
+            return self.start.id
+        if key == 'from_name':
+            return self.start.name
+        if key == 'to':
+            return self.end.id
+        if key == 'to_name':
+            return self.end.name
+        return getattr(self, key)
+
+
+class PathRecord(_Record):
+    """路径按经过顺序保存节点ID与关系ID,引用所属子图的节点表 / 关系表"""
+
+    __slots__ = ('node_table', 'relationship_table', 'node_ids', 'relationship_ids', 'length',
+                 'rank', 'consistency')
+    KEYS = ('nodes', 'relationships', 'description', 'length', 'rank', 'consistency')
+
+    def __init__(self, node_table: Dict[int, NodeRecord], relationship_table: Dict[int, RelationshipRecord],
+                 node_ids: Iterable[int], relationship_ids: Iterable[int], length: int):
+        self.node_table = node_table
+        self.relationship_table = relationship_table
+        self.node_ids = tuple(node_ids)
+        self.relationship_ids = tuple(relationship_ids)
+        self.length = length
+
+    def _get(self, key: str) -> Any:
+        if key == 'nodes':
+            return [self.node_table[node_id] for node_id in self.node_ids]
+        if key == 'relationships':
+            return [self.relationship_table[rel_id] for rel_id in self.relationship_ids]
+        if key == 'description':
+            return self.description()
+        return getattr(self, key)
+
+    def description(self) -> str:
+        """与原子图相同的路径描述: A[关系] -> B[关系] -> C"""
+        names = [self.node_table[node_id].name for node_id in self.node_ids]
+        types = [self.relationship_table[rel_id].type for rel_id in self.relationship_ids]
+        return ' -> '.join([f"{names[i]}[{types[i]}]" for i in range(len(types))] + [names[-1]])
+
+    def rebind(self, node_table: Dict[int, NodeRecord],
+               relationship_table: Dict[int, RelationshipRecord]) -> 'PathRecord':
+        """指向另一组节点表 / 关系表的同一路径(ID序列与得分共享)"""
+        clone = self.copy()
+        clone.node_table = node_table
+        clone.relationship_table = relationship_table
+        return clone
+
+
+class Subgraph(Mapping):
+    """
+    Args:
+        nodes: 节点ID -> 记录,迭代顺序即 subgraph['nodes'] 的顺序
+        relationships: 关系ID -> 记录
+        paths: 路径记录
+    """
+
+    __slots__ = ('node_table', 'relationship_table', 'path_records')
+    KEYS = ('nodes', 'relationships', 'paths')
+
+    def __init__(self, nodes: Dict[int, NodeRecord], relationships: Dict[int, RelationshipRecord],
+                 paths: List[PathRecord]):
+        self.node_table = nodes
+        self.relationship_table = relationships
+        self.path_records = paths
+
+    @classmethod
+    def from_tables(cls, data: Dict[str, List[Dict]]) -> 'Subgraph':
+        """由 GraphStore.expand_subgraph 的结果构建"""
+        nodes = {node['id']: NodeRecord(node['id'], node['type'], node['name'], node['properties'])
+                 for node in data['nodes']}
+        relationships = {rel['id']: RelationshipRecord(rel['id'], nodes[rel['start']], nodes[rel['end']],
+                                                       rel['type'], rel['properties'])
+                         for rel in data['relationships']}
+        paths = [PathRecord(nodes, relationships, path['nodes'], path['relationships'], path['length'])
+                 for path in data['paths']]
+        return cls(nodes, relationships, paths)
+
+    def select(self, nodes: Iterable[NodeRecord], paths: List[PathRecord]) -> 'Subgraph':
+        """
+        保留给定节点(按给定顺序,需覆盖路径经过的节点)、两端都被保留的关系和给定路径;
+        节点与关系记录与原子图共享,原子图的其余部分不再被引用
+        """
+        kept = {node.id: node for node in nodes}
+        relationships = {rel_id: rel for rel_id, rel in self.relationship_table.items()
+                         if rel.start.id in kept and rel.end.id in kept}
+        return Subgraph(kept, relationships, [path.rebind(kept, relationships) for path in paths])
+
+    def __getitem__(self, key: str) -> List[Any]:
+        if key == 'nodes':
+            return list(self.node_table.values())
+        if key == 'relationships':
+            return list(self.relationship_table.values())
+        if key == 'paths':
+            return list(self.path_records)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def __repr__(self) -> str:
+        return (f"Subgraph(nodes={len(self.node_table)}, relationships={len(self.relationship_table)}, "
+                f"paths={len(self.path_records)})")
@@ -0,0 +1,145 @@
+"""
+子图扩展结果缓存
+
+热门疾病的问题反复匹配到同一批种子节点,变长路径扩展是检索中最重的图查询。
+SubgraphCache 按 (种类, 排序后的种子ID, 深度, top_k, 扩展规则) 缓存扩展/路径查询结果:
+- LRU 淘汰,条目数与缓存的路径总数都有上限
+- 每个条目记录写入时的图版本,版本变化后读到的旧条目视为失效
+- 可选 ttl 作为没有版本信息时的兜底
+
+缓存的值由多个请求共享,调用方只读;get 返回的字典复制了外层列表,节点与路径不复制
+(Subgraph 每次读取都返回新列表,直接共享)。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from backend.app.service.metrics import REGISTRY
+
+DEFAULT_MAX_ENTRIES = int(os.getenv('SUBGRAPH_CACHE_SIZE', '1024'))
+DEFAULT_MAX_PATHS = int(os.getenv('SUBGRAPH_CACHE_MAX_PATHS', '200000'))
+DEFAULT_TTL = float(os.getenv('SUBGRAPH_CACHE_TTL', '0'))
+
+CACHE_REQUESTS = REGISTRY.counter(
+    'kg_subgraph_cache_requests_total', "子图缓存查询次数(hit 命中, miss 未命中, stale 图版本变化或过期)",
+    ['kind', 'result'])
+CACHE_ENTRIES = REGISTRY.gauge(
+    'kg_subgraph_cache_entries', "子图缓存条目数")
+CACHE_PATHS = REGISTRY.gauge(
+    'kg_subgraph_cache_paths', "子图缓存中的路径总数")
+CACHE_EVICTIONS = REGISTRY.counter(
+    'kg_subgraph_cache_evictions_total', "因容量淘汰的子图缓存条目数")
+
+
+def _weight(value: Any) -> int:
+    """条目大小按路径数计"""
+    if isinstance(value, Mapping):
+        return max(1, len(value.get('paths', ())))
+    if isinstance(value, list):
+        return max(1, len(value))
+    return 1
+
+
+def _share(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: list(item) if isinstance(item, list) else item for key, item in value.items()}
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+class SubgraphCache:
+    """
+    Args:
+        version: 返回当前图版本的函数,条目写入时记录,读取时版本不同即失效
+        max_entries / max_paths: 容量上限,超过时淘汰最久未使用的条目
+        ttl: 条目最长保留秒数,<= 0 表示只按版本失效
+    """
+
+    def __init__(self, version: Callable[[], Hashable] = lambda: None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, max_paths: int = DEFAULT_MAX_PATHS,
+                 ttl: float = DEFAULT_TTL):
+        self.version = version
+        self.max_entries = max_entries
+        self.max_paths = max_paths
+        self.ttl = ttl
+        # key -> (版本, 写入时间, 权重, 值)
+        self._entries: 'OrderedDict[Tuple, Tuple[Hashable, float, int, Any]]' = OrderedDict()
+        self._paths = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(kind: str, seeds, *params) -> Tuple:
+        """缓存键: 种子按 ID 排序,与匹配顺序无关"""
+        return (kind, tuple(sorted(seeds)), *params)
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                result = 'miss'
+            elif entry[0] != version or (self.ttl > 0 and time.monotonic() - entry[1] > self.ttl):
+                self._remove(key)
+                self._update_gauges()
+                result = 'stale'
+            else:
+                self._entries.move_to_end(key)
+                result = 'hit'
+        CACHE_REQUESTS.inc(kind=key[0], result=result)
+        return _share(entry[3]) if result == 'hit' else None
+
+    def put(self, key: Tuple, value: Any, version: Hashable = None):
+        """写入结果;version 为读取数据前取得的图版本(默认取当前版本)"""
+        if not self.enabled:
+            return
+        weight = _weight(value)
+        if weight > self.max_paths:
+            return
+        version = self.version() if version is None else version
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, time.monotonic(), weight, value)
+            self._paths += weight
+            while len(self._entries) > self.max_entries or self._paths > self.max_paths:
+                self._remove(next(iter(self._entries)))
+                CACHE_EVICTIONS.inc()
+            self._update_gauges()
+
+    def get_or_load(self, key: Tuple, loader: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+        version = self.version()
+        value = loader()
+        self.put(key, value, version)
+        return _share(value)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._paths = 0
+            self._update_gauges()
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self._paths -= entry[2]
+
+    def _update_gauges(self):
+        CACHE_ENTRIES.set(len(self._entries))
+        CACHE_PATHS.set(self._paths)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'paths': self._paths,
+                    'max_entries': self.max_entries, 'max_paths': self.max_paths}
@@ -0,0 +1,254 @@
+"""
+实体名称联想(输入提示)
+
+前端每次按键都请求一次,在 search_nodes 上做会变成每次按键一遍全图子串扫描。
+SuggestIndex 把节点名称、别名和拼音(安装 pypinyin 时: 全拼与首字母)统一小写、去空格后
+放进一个有序数组,前缀查询用二分查找定位区间:
+- 排序: 与查询完全相同的键在前,其次按节点度数(关联关系数)降序,再按名称长度
+- 同一节点多个键命中时只返回一次
+- 区间很大的短前缀(如单个汉字、单个字母)的前 MAX_LIMIT 个结果在第一次查询后缓存,
+  索引按图版本构建、之后只读,缓存在索引的生命周期内有效
+
+GraphSuggest 懒加载索引,图版本变化后下次查询时重建,重建期间其他请求继续使用旧索引。
+有与当前图版本一致的快照时从快照构建: 度数直接取快照的邻接偏移(不再读取全部关系),
+结果中的节点按下标从映射中读取。
+"""
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from heapq import nsmallest
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.app.service.lexicon import node_aliases
+from backend.app.service.metrics import REGISTRY
+from backend.knowledge.graph.snapshot import KnowledgeGraphSnapshot, matching_snapshot
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = int(os.getenv('SUGGEST_LIMIT', '10'))
+MAX_LIMIT = 50
+# 前缀区间超过该键数时缓存排序结果
+CACHE_SCAN_SIZE = 256
+# 每个索引缓存的前缀数上限
+MAX_CACHED_PREFIXES = 4096
+# 加载失败后的重试间隔(秒)
+RETRY_SECONDS = 30.0
+
+SUGGEST_BUILDS = REGISTRY.counter(
+    'kg_suggest_index_builds_total', "实体联想索引构建次数", ['status'])
+SUGGEST_KEYS = REGISTRY.gauge(
+    'kg_suggest_index_keys', "实体联想索引中的键数(名称、别名、拼音)")
+SUGGEST_SECONDS = REGISTRY.histogram(
+    'kg_suggest_duration_seconds', "实体联想查询耗时(不含索引构建)",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+
+_SPACES = re.compile(r'\s+')
+_CJK_CHAR = re.compile(r'[㐀-䶿一-鿿]')
+
+
+def normalize(text: str) -> str:
+    return _SPACES.sub('', text).lower()
+
+
+def pinyin_keys(name: str) -> List[str]:
+    """含汉字的名称的全拼与首字母,未安装 pypinyin 时为空"""
+    if lazy_pinyin is None or not _CJK_CHAR.search(name):
+        return []
+    full = normalize(''.join(lazy_pinyin(name)))
+    initials = normalize(''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)))
+    return [key for key in dict.fromkeys((full, initials)) if key]
+
+
+class SuggestIndex:
+    """
+    Args:
+        nodes: [{'key', 'name', 'type', 'properties'}],通常来自 GraphStore.dump_nodes()
+        relationships: [{'source', 'target', ...}],用于计算节点度数
+        graph_version: 构建时的图版本
+    """
+
+    def __init__(self, nodes: Iterable[Dict], relationships: Iterable[Dict], graph_version: Any = None):
+        degree: Dict[str, int] = {}
+        for rel in relationships:
+            degree[rel['source']] = degree.get(rel['source'], 0) + 1
+            degree[rel['target']] = degree.get(rel['target'], 0) + 1
+        nodes = list(nodes)
+        # 只保留结果需要的字段
+        docs = [(node['key'], node.get('name'), node.get('type')) for node in nodes]
+        self._build(len(nodes), nodes.__getitem__, lambda i: degree.get(docs[i][0], 0), docs.__getitem__,
+                    graph_version)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: KnowledgeGraphSnapshot, graph_version: Any = None) -> 'SuggestIndex':
+        """从快照构建,文档即快照中的节点下标"""
+        index = cls.__new__(cls)
+        index._build(snapshot.num_nodes, snapshot.dump_node, snapshot.degree,
+                     lambda i: (snapshot.node_key(i), snapshot.node_name(i), snapshot.node_type(i)),
+                     graph_version)
+        return index
+
+    def _build(self, size: int, node: Callable[[int], Dict], degree: Callable[[int], int],
+               doc: Callable[[int], Tuple[str, str, str]], graph_version: Any):
+        """
+        Args:
+            node: 下标 -> 节点 {'key', 'name', 'type', 'properties'}(只在构建时读取)
+            degree: 下标 -> 度数
+            doc: 下标 -> (key, name, type),查询结果按需读取
+        """
+        self.graph_version = graph_version
+        self._doc = doc
+        self.degrees: List[int] = []
+        self.name_lengths: List[int] = []
+        self.size = 0
+        # (键, 文档下标, 命中方式);同一文档的键去重
+        entries: List[Tuple[str, int, str]] = []
+        for i in range(size):
+            self.degrees.append(degree(i))
+            node_data = node(i)
+            name = node_data.get('name')
+            self.name_lengths.append(len(name or ''))
+            if not name:
+                continue
+            self.size += 1
+            aliases = node_aliases(node_data.get('properties') or {})
+            keys = {normalize(name): 'name'}
+            for alias in aliases:
+                keys.setdefault(normalize(alias), alias)
+            for source in [name] + aliases:
+                for key in pinyin_keys(source):
+                    keys.setdefault(key, 'pinyin')
+            entries.extend((key, i, matched) for key, matched in keys.items() if key)
+
+        entries.sort()
+        self.keys: List[str] = [key for key, _, _ in entries]
+        self._entries: List[Tuple[int, str]] = [(doc, matched) for _, doc, matched in entries]
+        # 前缀 -> 排好序的 (文档下标, 命中方式),只缓存大区间
+        self._cached: Dict[str, List[Tuple[int, str]]] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _ranked(self, prefix: str, lo: int, hi: int, limit: int) -> List[Tuple[int, str]]:
+        """区间内按排序规则去重后的前 limit 个 (文档下标, 命中方式)"""
+        def rank(position: int) -> Tuple:
+            doc = self._entries[position][0]
+            return self.keys[position] != prefix, -self.degrees[doc], self.name_lengths[doc], doc
+
+        # 一个节点在同一区间内最多命中名称、别名、拼音几个键,先取 limit 的数倍,去重后不足再全量排序
+        candidates = nsmallest(limit * 4, range(lo, hi), key=rank)
+        ranked = self._distinct(candidates, limit)
+        if len(ranked) < limit and len(candidates) < hi - lo:
+            ranked = self._distinct(sorted(range(lo, hi), key=rank), limit)
+        return ranked
+
+    def _distinct(self, positions: Iterable[int], limit: int) -> List[Tuple[int, str]]:
+        seen = set()
+        ranked = []
+        for position in positions:
+            doc, matched = self._entries[position]
+            if doc in seen:
+                continue
+            seen.add(doc)
+            ranked.append((doc, matched))
+            if len(ranked) >= limit:
+                break
+        return ranked
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_LIMIT) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            [{'key', 'name', 'type', 'degree', 'matched': 'name' | 'pinyin' | 命中的别名}]
+        """
+        prefix = normalize(prefix)
+        limit = min(max(1, limit), MAX_LIMIT)
+        if not prefix:
+            return []
+        lo = bisect_left(self.keys, prefix)
+        # 前缀区间的右端: 比所有以 prefix 开头的键都大的最小字符串
+        hi = bisect_left(self.keys, prefix + '\U0010ffff', lo)
+        if hi - lo > CACHE_SCAN_SIZE:
+            ranked = self._cached.get(prefix)
+            if ranked is None:
+                ranked = self._ranked(prefix, lo, hi, MAX_LIMIT)
+                if len(self._cached) >= MAX_CACHED_PREFIXES:
+                    self._cached.clear()
+                self._cached[prefix] = ranked
+        else:
+            ranked = self._ranked(prefix, lo, hi, limit)
+        results = []
+        for doc, matched in ranked[:limit]:
+            key, name, node_type = self._doc(doc)
+            results.append({'key': key, 'name': name, 'type': node_type, 'degree': self.degrees[doc],
+                            'matched': matched})
+        return results
+
+
+class GraphSuggest:
+    """
+    懒加载的实体联想索引
+    Args:
+        store: 图存储
+        version: 返回当前图版本的函数,与索引构建时的版本不同则重建
+    """
+
+    def __init__(self, store, version: Callable[[], Any] = lambda: None):
+        self.store = store
+        self.version = version
+        self._index: Optional[SuggestIndex] = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _stale(self) -> bool:
+        if time.monotonic() < self._retry_at:
+            return False
+        return self._index is None or self._index.graph_version != self.version()
+
+    def get(self) -> Optional[SuggestIndex]:
+        """当前索引;需要重建时由一个请求重建,已有旧索引的其他请求不等待"""
+        if self._stale() and self._lock.acquire(blocking=self._index is None):
+            try:
+                if self._stale():
+                    self.load()
+            finally:
+                self._lock.release()
+        return self._index
+
+    def load(self):
+        start = time.perf_counter()
+        try:
+            # 先读版本再读数据: 读取期间有写入时,版本落后,下次查询时再次重建
+            version = self.version()
+            snapshot = matching_snapshot(version)
+            if snapshot is not None:
+                index = SuggestIndex.from_snapshot(snapshot, version)
+            else:
+                index = SuggestIndex(self.store.dump_nodes(), self.store.dump_relationships(), version)
+        except Exception as e:
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+            SUGGEST_BUILDS.inc(status='error')
+            logger.warning("⚠️  构建实体联想索引失败: %s", e)
+            return
+        self._index = index
+        SUGGEST_BUILDS.inc(status='ok')
+        SUGGEST_KEYS.set(len(index.keys))
+        logger.info("实体联想索引构建完成: %d 个节点, %d 个键%s, 图版本 %s(%s), %.1fms", len(index),
+                    len(index.keys), "" if lazy_pinyin else "(未安装 pypinyin,不含拼音)",
+                    version, "快照" if snapshot is not None else "图存储", (time.perf_counter() - start) * 1000)
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_LIMIT) -> Optional[List[Dict[str, Any]]]:
+        """索引不可用时返回 None"""
+        index = self.get()
+        if index is None:
+            return None
+        start = time.perf_counter()
+        result = index.suggest(prefix, limit)
+        SUGGEST_SECONDS.observe(time.perf_counter() - start)
+        return result
@@ -0,0 +1,237 @@
+"""
+请求内分阶段追踪
+
+用法:
+    with span('expansion', seeds=3) as s:
+        ...
+        s.set(rows=len(paths))
+
+每个 span 结束时:
+- 写入 kg_stage_duration_seconds / kg_stage_calls_total 指标
+- 追加到当前请求的 Trace(如果有),用于 X-Debug-Timing 响应头开启时返回耗时明细
+- 以 DEBUG 级别记录日志
+"""
+import contextvars
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from backend.app.service.metrics import REGISTRY
+from backend.knowledge.graph.driver import pool_stats
+
+logger = logging.getLogger(__name__)
+
+STAGE_DURATION = REGISTRY.histogram(
+    'kg_stage_duration_seconds', "各处理阶段耗时", ['stage'])
+STAGE_CALLS = REGISTRY.counter(
+    'kg_stage_calls_total', "各处理阶段调用次数", ['stage', 'status'])
+STAGE_ROWS = REGISTRY.counter(
+    'kg_stage_rows_total', "图查询返回的记录数", ['stage'])
+STORE_QUERY_DURATION = REGISTRY.histogram(
+    'kg_store_query_duration_seconds', "图存储各操作耗时", ['backend', 'operation'])
+# Neo4j 连接池(本进程内共享驱动的汇总)
+NEO4J_POOL_MAX_SIZE = REGISTRY.gauge(
+    'kg_neo4j_pool_max_size', "Neo4j 连接池最大连接数", callback=lambda: pool_stats()['max_size'])
+NEO4J_POOL_OPEN = REGISTRY.gauge(
+    'kg_neo4j_pool_open_connections', "Neo4j 连接池已建立的连接数", callback=lambda: pool_stats()['open'])
+NEO4J_POOL_IN_USE = REGISTRY.gauge(
+    'kg_neo4j_pool_in_use_connections', "Neo4j 连接池使用中的连接数", callback=lambda: pool_stats()['in_use'])
+NEO4J_TX_IN_FLIGHT = REGISTRY.gauge(
+    'kg_neo4j_transactions_in_flight', "正在执行(含等待连接)的 Neo4j 事务数", callback=lambda: pool_stats()['in_flight'])
+NEO4J_TX_RETRIES = REGISTRY.counter(
+    'kg_neo4j_transaction_retries_total', "Neo4j 事务函数因瞬时错误重试的次数", callback=lambda: pool_stats()['retries'])
+NEO4J_ACQUISITION_TIMEOUTS = REGISTRY.counter(
+    'kg_neo4j_pool_acquisition_timeouts_total', "从 Neo4j 连接池获取连接超时的次数",
+    callback=lambda: pool_stats()['acquisition_timeouts'])
+LLM_TOKENS = REGISTRY.counter(
+    'kg_llm_tokens_total', "LLM 消耗的 token 数", ['stage', 'kind'])
+
+HTTP_DURATION = REGISTRY.histogram(
+    'kg_http_request_duration_seconds', "HTTP 请求耗时", ['endpoint', 'method', 'status'])
+HTTP_REQUESTS = REGISTRY.counter(
+    'kg_http_requests_total', "HTTP 请求数", ['endpoint', 'method', 'status'])
+
+DEBUG_TIMING_HEADER = 'X-Debug-Timing'
+
+
+class Span:
+    __slots__ = ('stage', 'attrs', 'start', 'duration', 'child_duration', 'parent', 'error')
+
+    def __init__(self, stage: str, attrs: Dict[str, Any], parent: Optional['Span']):
+        self.stage = stage
+        self.attrs = attrs
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.child_duration = 0.0
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def self_duration(self) -> float:
+        return self.duration - self.child_duration
+
+
+class Trace:
+    """一个请求内的全部 span"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.start = time.perf_counter()
+
+    def breakdown(self) -> Dict[str, Dict[str, Any]]:
+        """按阶段汇总: 总耗时(含子阶段)、自身耗时、次数,以及记录数/token 等数值属性之和"""
+        stages: Dict[str, Dict[str, Any]] = {}
+        for s in self.spans:
+            entry = stages.setdefault(s.stage, {'ms': 0.0, 'self_ms': 0.0, 'count': 0})
+            entry['ms'] += s.duration * 1000
+            entry['self_ms'] += s.self_duration * 1000
+            entry['count'] += 1
+            for key, value in s.attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + value
+        for entry in stages.values():
+            entry['ms'] = round(entry['ms'], 3)
+            entry['self_ms'] = round(entry['self_ms'], 3)
+        return stages
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'stages': self.breakdown()
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('kg_trace', default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('kg_span', default=None)
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def end_trace() -> Optional[Trace]:
+    trace = _current_trace.get()
+    _current_trace.set(None)
+    _current_span.set(None)
+    return trace
+
+
+def _finish(s: Span):
+    STAGE_DURATION.observe(s.duration, stage=s.stage)
+    STAGE_CALLS.inc(stage=s.stage, status='error' if s.error else 'ok')
+    rows = s.attrs.get('rows')
+    if isinstance(rows, int):
+        STAGE_ROWS.inc(rows, stage=s.stage)
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        tokens = s.attrs.get(kind)
+        if tokens:
+            LLM_TOKENS.inc(tokens, stage=s.stage, kind=kind)
+
+    if s.parent is not None:
+        s.parent.child_duration += s.duration
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(s)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[%s] %.1fms %s%s", s.stage, s.duration * 1000, s.attrs,
+                     f" error={s.error}" if s.error else "")
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    parent = _current_span.get()
+    s = Span(stage, attrs, parent)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.duration = time.perf_counter() - s.start
+        _current_span.reset(token)
+        _finish(s)
+
+
+def record_span(stage: str, duration: float, error: str = None, **attrs):
+    """记录一个已结束的 span(用于事后回调,如图存储的查询监听)"""
+    s = Span(stage, attrs, _current_span.get())
+    s.duration = duration
+    s.error = error
+    _finish(s)
+
+
+def traced(stage: str):
+    """方法装饰器: 整个调用作为一个 span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _on_store_query(event: Dict[str, Any]):
+    STORE_QUERY_DURATION.observe(event['duration'], backend=event['backend'], operation=event['operation'])
+    record_span('cypher', event['duration'], error=event.get('error'),
+                operation=event['operation'], rows=event.get('rows', 0))
+
+
+def instrument_store(store):
+    """为图存储的每次查询记录 span(同一存储只注册一次)"""
+    if not getattr(store, '_tracing_installed', False):
+        store.add_query_listener(_on_store_query)
+        store._tracing_installed = True
+    return store
+
+
+def init_request_tracing(app):
+    """
+    为每个请求开启 Trace 并记录 HTTP 指标。
+    请求头 X-Debug-Timing: 1 时,在 JSON 响应中附加 timings 字段并返回 Server-Timing 响应头。
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _begin_trace():
+        g.kg_trace = start_trace()
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = end_trace() or g.pop('kg_trace', None)
+        if trace is None:
+            return response
+
+        elapsed = time.perf_counter() - trace.start
+        labels = {
+            'endpoint': request.endpoint or 'unknown',
+            'method': request.method,
+            'status': str(response.status_code)
+        }
+        HTTP_DURATION.observe(elapsed, **labels)
+        HTTP_REQUESTS.inc(**labels)
+
+        if request.headers.get(DEBUG_TIMING_HEADER) in ('1', 'true', 'True'):
+            timings = trace.to_dict()
+            response.headers['Server-Timing'] = ', '.join(
+                f"{stage};dur={entry['ms']}" for stage, entry in timings['stages'].items())
+            if response.is_json and not response.is_streamed:
+                payload = response.get_json(silent=True)
+                if isinstance(payload, dict):
+                    payload['timings'] = timings
+                    response.set_data(app.json.dumps(payload))
+        return response
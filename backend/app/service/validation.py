@@ -0,0 +1,132 @@
+"""
+基于倒排索引的答案验证
+
+每个请求的子图建立两张索引:
+- 实体名 -> 经过该实体的路径下标
+- 实体对(无序) -> 两者之间的关系
+答案按句切分,每句用词典最长匹配扫描一遍找出提到的实体,
+陈述是否有依据变为实体对查表,不再对每条陈述遍历全部路径和节点。
+
+子图之外的实体用进程内的图谱词表(lexicon.GraphLexicon)识别,不再对每个答案做一次全图
+CONTAINS 扫描;答案中的别名按标准名计。
+
+打分:
+- 实体一致性: 答案提到的图谱实体中属于子图的比例
+- 关系一致性: 提到两个及以上实体的句子(关系陈述)中,至少有一对实体在子图中直接相连
+  或同在一条路径上的比例;答案中没有关系陈述时,总分只看实体一致性
+"""
+import re
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from backend.app.service.lexicon import EntityMatcher, GraphLexicon, spot_entities
+
+_SENTENCE_SPLIT = re.compile(r'[。！？!?；;\n]+')
+
+
+class SubgraphIndex:
+    """单个子图的倒排索引"""
+
+    def __init__(self, subgraph: Dict):
+        self.paths = subgraph['paths']
+        self.names = EntityMatcher(node['name'] for node in subgraph['nodes'])
+
+        self.paths_by_entity: Dict[str, Set[int]] = {}
+        for i, path in enumerate(self.paths):
+            for node in path['nodes']:
+                self.paths_by_entity.setdefault(node['name'], set()).add(i)
+
+        self.relations: Dict[Tuple[str, str], List[Dict]] = {}
+        for rel in subgraph['relationships']:
+            self.relations.setdefault(self._pair(rel['from_name'], rel['to_name']), []).append(rel)
+
+    @staticmethod
+    def _pair(a: str, b: str) -> Tuple[str, str]:
+        return (a, b) if a <= b else (b, a)
+
+    def relations_between(self, a: str, b: str) -> List[Dict]:
+        return self.relations.get(self._pair(a, b), [])
+
+    def shared_path(self, a: str, b: str) -> Optional[Dict]:
+        """同时经过 a 和 b 的路径中最短的一条"""
+        shared = self.paths_by_entity.get(a, set()) & self.paths_by_entity.get(b, set())
+        if not shared:
+            return None
+        return min((self.paths[i] for i in shared), key=lambda path: path['length'])
+
+    def support(self, a: str, b: str) -> Optional[Dict[str, Any]]:
+        """实体对在子图中的依据: 直接关系优先,其次是同一路径"""
+        rels = self.relations_between(a, b)
+        path = self.shared_path(a, b)
+        if rels:
+            rel = rels[0]
+            return {
+                'relation': f"{rel['from_name']} → {rel['type']} → {rel['to_name']}",
+                'supporting_path': path['description'] if path else None
+            }
+        if path:
+            return {'relation': None, 'supporting_path': path['description']}
+        return None
+
+
+class AnswerValidator:
+    """
+    Args:
+        lexicon: 图谱实体词表,为 None 时只识别子图中的实体
+    """
+
+    def __init__(self, lexicon: Optional[GraphLexicon] = None):
+        self.lexicon = lexicon
+
+    @staticmethod
+    def split_sentences(text: str) -> List[str]:
+        return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+    def validate(self, answer: str, subgraph: Dict) -> Dict[str, Any]:
+        index = SubgraphIndex(subgraph)
+        matchers = [index.names]
+        canonical: Dict[str, str] = {}
+        lexicon = self.lexicon.get() if self.lexicon is not None else None
+        if lexicon is not None:
+            matchers.append(lexicon.matcher)
+            canonical = lexicon.canonical
+
+        mentioned: Dict[str, None] = {}
+        claims = []
+        for sentence in self.split_sentences(answer):
+            entities = list(dict.fromkeys(
+                surface if surface in index.names else canonical.get(surface, surface)
+                for surface in spot_entities(sentence, matchers)))
+            for entity in entities:
+                mentioned.setdefault(entity)
+            if len(entities) < 2:
+                continue
+
+            claim = {'claim': sentence, 'entities': entities, 'verified': False,
+                     'relation': None, 'supporting_path': None}
+            for a, b in combinations(entities, 2):
+                support = index.support(a, b)
+                if support:
+                    claim.update(support, verified=True)
+                    break
+            claims.append(claim)
+
+        valid_entities = [e for e in mentioned if e in index.names]
+        invalid_entities = [e for e in mentioned if e not in index.names]
+
+        entity_consistency = len(valid_entities) / len(mentioned) if mentioned else 0
+        if claims:
+            claim_consistency = sum(1 for c in claims if c['verified']) / len(claims)
+            overall_score = 0.5 * entity_consistency + 0.5 * claim_consistency
+        else:
+            claim_consistency = 0
+            overall_score = entity_consistency
+
+        return {
+            'overall_score': overall_score,
+            'entity_consistency': entity_consistency,
+            'claim_consistency': claim_consistency,
+            'valid_entities': valid_entities,
+            'invalid_entities': invalid_entities,
+            'verified_claims': claims
+        }
@@ -0,0 +1,211 @@
+"""
+问答全链路基准测试
+
+在合成图谱(嵌入式 SQLite 存储)与本地模拟 DeepSeek 服务上反复运行
+controlled_generation_with_subgraph,统计端到端 p50/p95/p99 延迟、各阶段耗时与调用次数
+(各阶段耗时取自请求 Trace: total_ms 含嵌套阶段, self_ms 不含),
+结果保存为 JSON,可与历史结果对比以发现性能回退。
+
+用法(项目根目录下):
+    python -m backend.benchmarks.chat_pipeline --nodes 2000 --degree 4 --requests 50 --llm-latency-ms 200
+    python -m backend.benchmarks.chat_pipeline --compare bench_chat_pipeline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Any
+
+from backend.benchmarks.mock_llm import MockDeepSeekServer
+from backend.benchmarks.synthetic import generate_graph, generate_questions
+from backend.knowledge.graph.store import SQLiteGraphStore, load_kg_data
+
+# 报告中的阶段(与 KnowledgeGraphRetrieval 中的 span 名称一致), llm/cypher 为外部调用
+STAGES = ('extraction', 'matching', 'expansion', 'consistency', 'reasoning',
+          'generation', 'validation', 'llm', 'cypher')
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'mean': round(sum(values) / len(values), 3) if values else 0.0,
+        'max': round(max(values), 3) if values else 0.0,
+    }
+
+
+def run_benchmark(num_nodes: int, avg_degree: float, num_requests: int, warmup: int,
+                  llm_latency_ms: float, llm_jitter_ms: float, skew: float, seed: int,
+                  use_consistency: bool = True, use_reasoning: bool = True) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='kg_bench_')
+    db_path = os.path.join(workdir, 'graph.db')
+
+    from backend.app.service.kg_retrieval import KnowledgeGraphRetrieval
+    from backend.app.service.tracing import start_trace, end_trace
+
+    kg_data = generate_graph(num_nodes, avg_degree, seed=seed, skew=skew)
+    store = SQLiteGraphStore(db_path)
+    load_kg_data(store, kg_data)
+    questions = generate_questions(kg_data, warmup + num_requests, seed=seed)
+
+    entity_names = [entity['name'] for entity in kg_data['entities']]
+    latencies: List[float] = []
+    stage_samples: Dict[str, Dict[str, List[float]]] = {stage: {'total_ms': [], 'self_ms': [], 'calls': []}
+                                                       for stage in STAGES}
+
+    with MockDeepSeekServer(entity_names, llm_latency_ms, llm_jitter_ms) as llm:
+        retrieval = KnowledgeGraphRetrieval(None, None, None, 'benchmark-key', store=store)
+        retrieval.deepseek_api_url = llm.url
+
+        for i, question in enumerate(questions):
+            if i == warmup:
+                llm.reset_counts()
+            trace = start_trace()
+            start = time.perf_counter()
+            retrieval.controlled_generation_with_subgraph(
+                question, use_consistency=use_consistency, use_reasoning=use_reasoning)
+            elapsed = (time.perf_counter() - start) * 1000
+            end_trace()
+            if i < warmup:
+                continue
+
+            latencies.append(elapsed)
+            breakdown = trace.breakdown()
+            for stage in STAGES:
+                record = breakdown.get(stage, {'ms': 0.0, 'self_ms': 0.0, 'count': 0})
+                stage_samples[stage]['total_ms'].append(record['ms'])
+                stage_samples[stage]['self_ms'].append(record['self_ms'])
+                stage_samples[stage]['calls'].append(record['count'])
+
+        llm_calls = dict(llm.call_counts)
+
+    store.close()
+
+    return {
+        'benchmark': 'chat_pipeline',
+        'timestamp': datetime.utcnow().isoformat(),
+        'environment': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+        },
+        'config': {
+            'nodes': num_nodes,
+            'edges': len(kg_data['relationships']),
+            'avg_degree': avg_degree,
+            'skew': skew,
+            'requests': num_requests,
+            'warmup': warmup,
+            'llm_latency_ms': llm_latency_ms,
+            'llm_jitter_ms': llm_jitter_ms,
+            'use_consistency': use_consistency,
+            'use_reasoning': use_reasoning,
+            'seed': seed,
+        },
+        'latency_ms': summarize(latencies),
+        'stages': {
+            stage: {
+                'total_ms': summarize(samples['total_ms']),
+                'self_ms': summarize(samples['self_ms']),
+                'calls_per_request': round(sum(samples['calls']) / len(samples['calls']), 2)
+                if samples['calls'] else 0,
+            }
+            for stage, samples in stage_samples.items()
+        },
+        'llm_calls': {
+            'total': sum(llm_calls.values()),
+            'per_request': round(sum(llm_calls.values()) / num_requests, 2) if num_requests else 0,
+            'by_kind': llm_calls,
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_delta_ms: float = 1.0) -> List[str]:
+    """对比两次结果,返回增幅超过阈值(且绝对增量超过 min_delta_ms)的回退项"""
+    regressions = []
+
+    def check(label: str, now: float, before: float):
+        if before > 0 and now - before > min_delta_ms and (now - before) / before * 100 > threshold:
+            regressions.append(f"{label}: {before:.1f} -> {now:.1f} ms (+{(now - before) / before:.0%})")
+
+    for q in ('p50', 'p95', 'p99'):
+        check(f"latency {q}", current['latency_ms'][q], baseline['latency_ms'][q])
+    for stage, data in current['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if before:
+            check(f"{stage} p95", data['self_ms']['p95'], before['self_ms']['p95'])
+    return regressions
+
+
+def print_report(result: Dict[str, Any]):
+    latency = result['latency_ms']
+    print(f"\n{'=' * 60}")
+    print(f"问答全链路基准: {result['config']['nodes']} 节点 / {result['config']['edges']} 关系, "
+          f"{result['config']['requests']} 次请求")
+    print(f"{'=' * 60}")
+    print(f"端到端延迟(ms): p50={latency['p50']:.1f} p95={latency['p95']:.1f} p99={latency['p99']:.1f}")
+    print(f"\n{'阶段':<12}{'self p50':>10}{'self p95':>10}{'total p95':>11}{'调用/请求':>10}")
+    for stage, data in result['stages'].items():
+        print(f"{stage:<12}{data['self_ms']['p50']:>10.1f}{data['self_ms']['p95']:>10.1f}"
+              f"{data['total_ms']['p95']:>11.1f}{data['calls_per_request']:>10}")
+    print(f"\nLLM 调用: {result['llm_calls']['per_request']} 次/请求 {result['llm_calls']['by_kind']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="问答全链路基准测试")
+    parser.add_argument('--nodes', type=int, default=2000)
+    parser.add_argument('--degree', type=float, default=4.0, help="平均度数")
+    parser.add_argument('--skew', type=float, default=1.0, help=">1 时生成枢纽节点")
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--llm-latency-ms', type=float, default=0)
+    parser.add_argument('--llm-jitter-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-consistency', action='store_true')
+    parser.add_argument('--no-reasoning', action='store_true')
+    parser.add_argument('--output', default='bench_chat_pipeline.json')
+    parser.add_argument('--compare', default=None, help="与之前的结果文件对比")
+    parser.add_argument('--threshold', type=float, default=10.0, help="判定回退的增幅百分比")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="忽略小于该值的绝对增量")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.nodes, args.degree, args.requests, args.warmup,
+                           args.llm_latency_ms, args.llm_jitter_ms, args.skew, args.seed,
+                           use_consistency=not args.no_consistency,
+                           use_reasoning=not args.no_reasoning)
+    print_report(result)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print("\n⚠️  性能回退:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\n✓ 未发现超过阈值的性能回退")
+
+
+if __name__ == "__main__":
+    main()
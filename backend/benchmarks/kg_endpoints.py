@@ -0,0 +1,202 @@
+"""
+知识图谱读接口规模基准
+
+依次把 1k/10k/100k/1M 节点的合成图谱写入图存储,测量
+/knowledge_graph/get_kg、search_nodes 与 /knowledge_graph/neo4j/status 的
+延迟、Python 峰值内存(tracemalloc)与响应字节数,并输出随规模变化的曲线(含拟合的增长指数)。
+search_nodes 走进程内检索索引,索引在计时前构建,构建耗时与常驻内存单独列出。
+
+默认使用临时的嵌入式 SQLite 存储;--backend neo4j 会清空目标库,必须同时指定 --allow-clear。
+
+用法(项目根目录下):
+    python -m backend.benchmarks.kg_endpoints --sizes 1000,10000,100000
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from backend.benchmarks.chat_pipeline import summarize
+from backend.benchmarks.synthetic import load_synthetic_graph
+from backend.knowledge.graph.store import GraphStore, create_graph_store
+
+SEARCH_QUERIES = ['心脏骤停', '胸痛', '不存在的关键词']
+
+
+def measure(fn: Callable[[], int], repeat: int) -> Dict[str, Any]:
+    """fn 执行一次并返回响应字节数;先计时 repeat 次,再单独跑一次统计峰值内存"""
+    latencies = []
+    response_bytes = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response_bytes = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'latency_ms': summarize(latencies),
+        'peak_memory_mb': round(peak / 1024 / 1024, 3),
+        'response_bytes': response_bytes,
+    }
+
+
+def measure_index_build(search_index) -> Dict[str, Any]:
+    """检索索引的构建耗时(不开 tracemalloc),再构建一次统计常驻内存与构建峰值内存"""
+    start = time.perf_counter()
+    search_index.load()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    tracemalloc.start()
+    try:
+        search_index.load()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    index = search_index.get()
+    return {
+        'build_ms': round(build_ms, 2),
+        'memory_mb': round(retained / 1024 / 1024, 3),
+        'peak_memory_mb': round(peak / 1024 / 1024, 3),
+        'documents': len(index) if index is not None else 0,
+    }
+
+
+def bench_size(store: GraphStore, num_nodes: int, avg_degree: float, repeat: int, seed: int) -> Dict[str, Any]:
+    from flask import Flask
+    from backend.app.api import knowledge_graph
+    from backend.app.service.kg import Neo4jKnowledgeGraph
+
+    store.clear()
+    start = time.perf_counter()
+    kg_data = load_synthetic_graph(store, num_nodes, avg_degree, seed=seed)
+    load_seconds = time.perf_counter() - start
+
+    # 让蓝图使用本次的存储
+    knowledge_graph.graph_db.set(Neo4jKnowledgeGraph(None, None, None, store=store))
+    # 检索索引懒加载,先构建,search_nodes 的计时不含构建
+    search_index = measure_index_build(knowledge_graph.graph_db.search_index)
+    app = Flask(__name__)
+    app.register_blueprint(knowledge_graph.kg_bp, url_prefix='/knowledge_graph')
+    client = app.test_client()
+
+    def get_kg() -> int:
+        response = client.get('/knowledge_graph/get_kg')
+        return len(response.get_data())
+
+    def status() -> int:
+        response = client.get('/knowledge_graph/neo4j/status')
+        return len(response.get_data())
+
+    def search(query: str) -> Callable[[], int]:
+        def run() -> int:
+            return len(app.json.dumps(knowledge_graph.graph_db.search_nodes(query)).encode('utf-8'))
+        return run
+
+    results = {
+        'nodes': len(kg_data['entities']),
+        'edges': len(kg_data['relationships']),
+        'load_seconds': round(load_seconds, 3),
+        'search_index': search_index,
+        'endpoints': {
+            'get_kg': measure(get_kg, repeat),
+            'neo4j_status': measure(status, repeat),
+        }
+    }
+    for query in SEARCH_QUERIES:
+        results['endpoints'][f"search_nodes[{query}]"] = measure(search(query), repeat)
+    return results
+
+
+def scaling_exponents(sizes: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+    """相邻规模间 p50 延迟的增长指数: log(t2/t1) / log(n2/n1),约等于1表示线性增长"""
+    exponents: Dict[str, List[float]] = {}
+    for prev, curr in zip(sizes, sizes[1:]):
+        for endpoint, data in curr['endpoints'].items():
+            t1 = prev['endpoints'][endpoint]['latency_ms']['p50']
+            t2 = data['latency_ms']['p50']
+            if t1 > 0 and t2 > 0 and curr['nodes'] != prev['nodes']:
+                exponent = math.log(t2 / t1) / math.log(curr['nodes'] / prev['nodes'])
+                exponents.setdefault(endpoint, []).append(round(exponent, 2))
+    return exponents
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\n{'=' * 78}")
+    print(f"知识图谱读接口规模基准 ({result['config']['backend']})")
+    print(f"{'=' * 78}")
+    print(f"{'接口':<28}{'节点数':>10}{'p50(ms)':>11}{'p95(ms)':>11}{'峰值(MB)':>11}{'响应字节':>12}")
+    endpoints = result['sizes'][0]['endpoints'].keys() if result['sizes'] else []
+    for endpoint in endpoints:
+        for size in result['sizes']:
+            data = size['endpoints'][endpoint]
+            print(f"{endpoint:<28}{size['nodes']:>10}{data['latency_ms']['p50']:>11.2f}"
+                  f"{data['latency_ms']['p95']:>11.2f}{data['peak_memory_mb']:>11.2f}{data['response_bytes']:>12}")
+    print(f"\n{'检索索引':<28}{'节点数':>10}{'构建(ms)':>11}{'常驻(MB)':>11}{'峰值(MB)':>11}{'文档数':>12}")
+    for size in result['sizes']:
+        index = size['search_index']
+        print(f"{'search_index':<28}{size['nodes']:>10}{index['build_ms']:>11.2f}"
+              f"{index['memory_mb']:>11.2f}{index['peak_memory_mb']:>11.2f}{index['documents']:>12}")
+    print("\n增长指数 (≈1 线性, ≈0 常数):")
+    for endpoint, exponents in result['scaling_exponents'].items():
+        print(f"  {endpoint:<28}{exponents}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识图谱读接口规模基准")
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help="逗号分隔的节点规模")
+    parser.add_argument('--degree', type=float, default=4.0, help="平均度数")
+    parser.add_argument('--repeat', type=int, default=5, help="每个接口的计时次数")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--backend', default='sqlite', help="sqlite(临时库) 或 neo4j(使用 NEO4J_* 配置)")
+    parser.add_argument('--allow-clear', action='store_true', help="允许清空 Neo4j 中的现有数据")
+    parser.add_argument('--output', default='bench_kg_endpoints.json')
+    args = parser.parse_args()
+
+    if args.backend == 'neo4j' and not args.allow_clear:
+        parser.error("--backend neo4j 会清空数据库,请确认后加上 --allow-clear")
+
+    sqlite_path = os.path.join(tempfile.mkdtemp(prefix='kg_bench_'), 'graph.db')
+    store = create_graph_store(args.backend, sqlite_path=sqlite_path)
+
+    sizes = []
+    try:
+        for num_nodes in [int(size) for size in args.sizes.split(',') if size]:
+            print(f"规模 {num_nodes} 节点...", file=sys.stderr)
+            sizes.append(bench_size(store, num_nodes, args.degree, args.repeat, args.seed))
+    finally:
+        store.close()
+
+    result = {
+        'benchmark': 'kg_endpoints',
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {
+            'backend': args.backend,
+            'degree': args.degree,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'sizes': sizes,
+        'scaling_exponents': scaling_exponents(sizes),
+    }
+    print_report(result)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+本地模拟 DeepSeek 服务
+
+兼容 /v1/chat/completions 接口,按可配置延迟返回固定格式的回复:
+- 实体抽取类提示词(要求返回JSON数组)返回问题中出现的已知实体名
+- 批量实体抽取提示词(问题列表,要求返回JSON对象)按编号返回各问题中的实体名
+- 其余提示词返回固定的结构化答案
+同时按提示词类别统计调用次数。
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional
+
+CANNED_ANSWER = """1. 【核心答案】根据知识图谱,{entity}需要及时规范处理。
+2. 【详细说明】{entity}的相关治疗、检查与用药请参考图谱中的关联关系。
+3. 【重要提示】请在专业医师指导下进行处置。"""
+
+
+class _Server(ThreadingHTTPServer):
+    # 默认监听队列只有 5,并发压测时会被重置连接
+    request_queue_size = 256
+
+
+class MockDeepSeekServer:
+    """
+    模拟 DeepSeek 服务(在后台线程中运行)
+    Args:
+        entity_names: 已知实体名,用于构造抽取结果
+        latency_ms: 每次调用的固定延迟
+        jitter_ms: 在固定延迟上叠加的均匀随机抖动
+    """
+
+    def __init__(self, entity_names: Iterable[str] = (), latency_ms: float = 0,
+                 jitter_ms: float = 0, host: str = '127.0.0.1', port: int = 0):
+        self.entity_names = set(entity_names)
+        self._max_name_len = max((len(name) for name in self.entity_names), default=0)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.call_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self) -> 'MockDeepSeekServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def reset_counts(self):
+        with self._lock:
+            self.call_counts = {}
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.call_counts[kind] = self.call_counts.get(kind, 0) + 1
+
+    def _entities_in(self, text: str):
+        # 枚举问题的子串查表,同一起点取最长匹配,避免"心率"抢先匹配"心率失常"
+        found = []
+        i = 0
+        while i < len(text):
+            for length in range(min(self._max_name_len, len(text) - i), 0, -1):
+                if text[i:i + length] in self.entity_names:
+                    found.append(text[i:i + length])
+                    i += length
+                    break
+            else:
+                i += 1
+        return list(dict.fromkeys(found))
+
+    def respond(self, prompt: str) -> str:
+        """根据提示词生成回复内容"""
+        if '问题列表' in prompt and 'JSON对象' in prompt:
+            self._count('extraction')
+            questions = re.findall(r'^(\d+)\.\s*(.*)$', prompt, re.MULTILINE)
+            return json.dumps({number: self._entities_in(question) for number, question in questions},
+                              ensure_ascii=False)
+
+        if 'JSON数组' in prompt:
+            self._count('extraction')
+            match = re.search(r'问题:\s*(.*)', prompt)
+            question = match.group(1) if match else prompt
+            return json.dumps(self._entities_in(question), ensure_ascii=False)
+
+        self._count('generation')
+        match = re.search(r'【用户问题】\s*(.*)', prompt)
+        entities = self._entities_in(match.group(1) if match else prompt)
+        return CANNED_ANSWER.format(entity=entities[0] if entities else '该疾病')
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                prompt = payload.get('messages', [{}])[-1].get('content', '')
+
+                delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+                if delay > 0:
+                    time.sleep(delay / 1000)
+
+                content = server.respond(prompt)
+                body = json.dumps({
+                    'id': 'mock',
+                    'object': 'chat.completion',
+                    'model': payload.get('model', 'deepseek-chat'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                                 'finish_reason': 'stop'}],
+                    'usage': {'prompt_tokens': len(prompt), 'completion_tokens': len(content),
+                              'total_tokens': len(prompt) + len(content)}
+                }, ensure_ascii=False).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
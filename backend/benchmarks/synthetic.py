@@ -0,0 +1,135 @@
+"""
+合成医疗知识图谱
+
+按项目的实体类型与关系类型生成指定规模/平均度数的图,
+结构与 knowledge_graph.json 相同,可直接写入任意 GraphStore。
+"""
+import random
+from typing import Dict, List, Any
+
+from backend.knowledge.graph.store import GraphStore, load_kg_data
+
+# 实体类型 -> (ID前缀, 占比, 名称词根, 属性生成)
+ENTITY_SPECS = {
+    '疾病': ('d', 0.20, ['心脏骤停', '急性心肌梗死', '脑卒中', '休克', '呼吸衰竭', '糖尿病酮症', '消化道出血', '肺栓塞'],
+           lambda rng: {'严重程度': rng.choice(['危重', '急症', '一般']),
+                        '所属系统': rng.choice(['循环系统', '呼吸系统', '消化系统', '神经系统']),
+                        '症状描述': rng.choice(['胸痛伴大汗', '意识丧失', '呼吸困难', '呕血黑便'])}),
+    '治疗': ('t', 0.20, ['心肺复苏', '电除颤', '气管插管', '溶栓治疗', '介入手术', '液体复苏', '机械通气'],
+           lambda rng: {'紧急程度': rng.choice(['立即', '尽快', '常规']),
+                        '操作类型': rng.choice(['手术', '物理', '药物']),
+                        '注意事项': rng.choice(['注意按压深度', '监测出血', '避免误吸'])}),
+    '检查': ('e', 0.15, ['心电图', '头颅CT', '血气分析', '心肌酶', '胸片', '凝血功能'],
+           lambda rng: {'检查目的': rng.choice(['确诊', '监测', '评估']),
+                        '正常范围': rng.choice(['阴性', '正常', '<0.04ng/ml'])}),
+    '药物': ('m', 0.20, ['肾上腺素', '阿司匹林', '胺碘酮', '硝酸甘油', '多巴胺', '肝素', '胰岛素'],
+           lambda rng: {'用药途径': rng.choice(['静脉注射', '口服', '肌注']),
+                        '剂量': rng.choice(['1mg', '300mg', '0.5mg/kg']),
+                        '使用时机': rng.choice(['立即', '确诊后', '必要时'])}),
+    '生命体征': ('v', 0.10, ['心率', '血压', '血氧饱和度', '呼吸频率', '体温'],
+             lambda rng: {'正常范围': rng.choice(['60-100次/分', '90-140mmHg', '>95%']),
+                          '监测频率': rng.choice(['持续', '每小时', '定期'])}),
+    '并发症': ('c', 0.15, ['肋骨骨折', '再灌注损伤', '感染', '多器官衰竭', '心律失常'],
+            lambda rng: {'发生率': rng.choice(['常见', '少见']),
+                         '预防措施': rng.choice(['规范操作', '早期干预'])}),
+}
+
+# (起点类型, 关系类型, 终点类型)
+RELATIONSHIP_SCHEMA = [
+    ('疾病', '需要治疗', '治疗'),
+    ('疾病', '需要检查', '检查'),
+    ('疾病', '使用药物', '药物'),
+    ('治疗', '使用药物', '药物'),
+    ('疾病', '监测指标', '生命体征'),
+    ('疾病', '引起并发症', '并发症'),
+    ('治疗', '引起并发症', '并发症'),
+]
+
+RELATIONSHIP_PROPERTIES = {
+    '需要治疗': lambda rng: {'时机': rng.choice(['立即', '尽快', '必要时']), '顺序': rng.choice(['首选', '备选'])},
+    '需要检查': lambda rng: {'频率': rng.choice(['持续', '定期']), '目的': rng.choice(['确诊', '监测'])},
+    '使用药物': lambda rng: {'剂量': rng.choice(['1mg', '300mg']), '给药方式': rng.choice(['静脉', '口服'])},
+    '监测指标': lambda rng: {'监测频率': rng.choice(['持续', '每小时']), '目标值': rng.choice(['>90mmHg', '>95%'])},
+    '引起并发症': lambda rng: {'发生率': rng.choice(['常见', '少见'])},
+}
+
+
+def generate_graph(num_nodes: int, avg_degree: float = 4.0, seed: int = 42,
+                   skew: float = 1.0) -> Dict[str, List[Dict]]:
+    """
+    生成合成图谱
+    Args:
+        num_nodes: 节点数
+        avg_degree: 平均度数(关系数 = 节点数 * 平均度数 / 2)
+        seed: 随机种子
+        skew: 端点选择偏斜度, >1 时少量节点成为枢纽
+    Returns:
+        包含entities和relationships的字典
+    """
+    rng = random.Random(seed)
+    entities = []
+    ids_by_type: Dict[str, List[str]] = {}
+
+    for entity_type, (prefix, ratio, roots, make_props) in ENTITY_SPECS.items():
+        count = max(1, int(num_nodes * ratio))
+        ids = []
+        for i in range(count):
+            entity_id = f"{prefix}{i + 1}"
+            entities.append({
+                'id': entity_id,
+                'type': entity_type,
+                'name': f"{roots[i % len(roots)]}{i // len(roots) + 1}型" if i >= len(roots) else roots[i],
+                'properties': make_props(rng)
+            })
+            ids.append(entity_id)
+        ids_by_type[entity_type] = ids
+
+    def pick(ids: List[str]) -> str:
+        return ids[int(len(ids) * rng.random() ** skew)]
+
+    relationships = []
+    seen = set()
+    target_edges = int(num_nodes * avg_degree / 2)
+    attempts = 0
+    while len(relationships) < target_edges and attempts < target_edges * 3:
+        attempts += 1
+        from_type, rel_type, to_type = rng.choice(RELATIONSHIP_SCHEMA)
+        key = (pick(ids_by_type[from_type]), pick(ids_by_type[to_type]), rel_type)
+        if key in seen:
+            continue
+        seen.add(key)
+        relationships.append({
+            'from': key[0],
+            'to': key[1],
+            'type': rel_type,
+            'properties': RELATIONSHIP_PROPERTIES[rel_type](rng)
+        })
+
+    return {'entities': entities, 'relationships': relationships}
+
+
+def generate_questions(kg_data: Dict[str, List[Dict]], count: int, seed: int = 7) -> List[str]:
+    """基于图中真实存在的关系生成问题"""
+    rng = random.Random(seed)
+    names = {e['id']: e['name'] for e in kg_data['entities']}
+    templates = {
+        '需要治疗': "{0}应该如何处理?{1}的注意事项是什么?",
+        '需要检查': "怀疑{0}时需要做{1}吗?",
+        '使用药物': "{0}可以使用{1}吗?剂量是多少?",
+        '监测指标': "{0}患者需要监测{1}吗?",
+        '引起并发症': "{0}会引起{1}吗?",
+    }
+    relationships = kg_data['relationships']
+    questions = []
+    for _ in range(count):
+        rel = rng.choice(relationships)
+        questions.append(templates[rel['type']].format(names[rel['from']], names[rel['to']]))
+    return questions
+
+
+def load_synthetic_graph(store: GraphStore, num_nodes: int, avg_degree: float = 4.0,
+                         seed: int = 42, skew: float = 1.0) -> Dict[str, Any]:
+    """生成合成图谱并写入图存储"""
+    kg_data = generate_graph(num_nodes, avg_degree, seed, skew)
+    load_kg_data(store, kg_data)
+    return kg_data
@@ -1,22 +1,25 @@
 import json
 import re
-from neo4j import GraphDatabase
 from typing import Dict, List, Any
 from backend.knowledge.utils.readDocx import readDocx
+from backend.knowledge.graph.snapshot import write_store_snapshot, DEFAULT_SNAPSHOT_PATH
+from backend.knowledge.graph.store import GraphStore, NODE_TYPES, create_graph_store
 import requests
 import os
 
 
 class MedicalKGBuilder:
     def __init__(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str,
-                 deepseek_api_key: str = None):
-        self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+                 deepseek_api_key: str = None, store: GraphStore = None):
+        # GRAPH_BACKEND=sqlite 时写入嵌入式存储
+        self.store = store or create_graph_store(neo4j_uri=neo4j_uri, neo4j_user=neo4j_user,
+                                                 neo4j_password=neo4j_password)
         self.deepseek_api_key = deepseek_api_key or os.getenv('DEEPSEEK_API_KEY')
         self.deepseek_api_url = "https://api.deepseek.com/v1/chat/completions"
 
     def close(self):
         """关闭数据库连接"""
-        self.driver.close()
+        self.store.close()
 
     def extract_knowledge_from_text(self, text: str, chunk_size: int = 1500) -> Dict[str, Any]:
         """
@@ -463,119 +466,20 @@ class MedicalKGBuilder:
         return kg_data
 
     def create_constraints(self):
-        """创建Neo4j约束和索引(使用中文标签)"""
+        """创建约束和索引(使用中文标签)"""
         print("创建数据库约束和索引...")
-
-        constraints = [
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (d:疾病) REQUIRE d.id IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (t:治疗) REQUIRE t.id IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (e:检查) REQUIRE e.id IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (m:药物) REQUIRE m.id IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (v:生命体征) REQUIRE v.id IS UNIQUE",
-            "CREATE CONSTRAINT IF NOT EXISTS FOR (c:并发症) REQUIRE c.id IS UNIQUE"
-        ]
-
-        with self.driver.session() as session:
-            for constraint in constraints:
-                try:
-                    session.run(constraint)
-                except Exception as e:
-                    print(f"约束创建警告: {e}")
+        self.store.ensure_schema(NODE_TYPES)
 
     def create_entities(self, entities: List[Dict]):
         """创建实体节点(包含所有属性)"""
         print(f"创建{len(entities)}个实体节点...")
-
-        with self.driver.session() as session:
-            for entity in entities:
-                entity_type = entity['type']
-                entity_id = entity['id']
-                entity_name = entity['name']
-                properties = entity.get('properties', {})
-
-                # 构建属性设置语句 (正确的Cypher语法)
-                # SET n.prop1 = $prop1, n.prop2 = $prop2
-                prop_assignments = []
-                params = {
-                    'id': entity_id,
-                    'name': entity_name
-                }
-
-                # 添加所有properties到参数中
-                for key, value in properties.items():
-                    # 清理属性名(移除特殊字符,避免语法错误)
-                    safe_key = key.replace(' ', '_').replace('-', '_').replace('/', '_')
-                    prop_assignments.append(f"n.`{safe_key}` = ${safe_key}")
-                    params[safe_key] = value
-
-                # 构建SET子句
-                if prop_assignments:
-                    set_clause = f"SET n.name = $name, {', '.join(prop_assignments)}"
-                else:
-                    set_clause = "SET n.name = $name"
-
-                # 使用反引号包裹标签,支持中文
-                cypher = f"""
-                MERGE (n:`{entity_type}` {{id: $id}})
-                {set_clause}
-                """
-
-                try:
-                    session.run(cypher, params)
-                except Exception as e:
-                    print(f"  警告: 创建实体 {entity_name} 时出错: {e}")
-                    # 如果失败,尝试只创建基本信息
-                    cypher_fallback = f"""
-                    MERGE (n:`{entity_type}` {{id: $id}})
-                    SET n.name = $name
-                    """
-                    session.run(cypher_fallback, {'id': entity_id, 'name': entity_name})
-
+        self.store.upsert_nodes(entities)
         print("实体创建完成")
 
     def create_relationships(self, relationships: List[Dict]):
         """创建关系(包含所有属性)"""
         print(f"创建{len(relationships)}个关系...")
-
-        with self.driver.session() as session:
-            for rel in relationships:
-                from_id = rel['from']
-                to_id = rel['to']
-                rel_type = rel['type']
-                properties = rel.get('properties', {})
-
-                # 构建关系属性
-                params = {
-                    'from_id': from_id,
-                    'to_id': to_id
-                }
-
-                # 添加所有properties到参数中
-                prop_assignments = []
-                for key, value in properties.items():
-                    # 清理属性名
-                    safe_key = key.replace(' ', '_').replace('-', '_').replace('/', '_')
-                    prop_assignments.append(f"r.`{safe_key}` = ${safe_key}")
-                    params[safe_key] = value
-
-                # 构建SET子句
-                if prop_assignments:
-                    set_clause = f"SET {', '.join(prop_assignments)}"
-                else:
-                    set_clause = ""
-
-                # 使用反引号包裹关系类型,支持中文
-                cypher = f"""
-                MATCH (a {{id: $from_id}}), (b {{id: $to_id}})
-                MERGE (a)-[r:`{rel_type}`]->(b)
-                {set_clause}
-                """
-
-                try:
-                    session.run(cypher, params)
-                except Exception as e:
-                    print(f"  警告: 创建关系 {from_id} -> {to_id} 时出错: {e}")
-
+        self.store.upsert_edges(relationships)
         print("关系创建完成")
 
     def build_knowledge_graph(self, document_text: str, chunk_size: int = 3000):
@@ -615,34 +519,16 @@ class MedicalKGBuilder:
         Returns:
             查询结果列表
         """
-        with self.driver.session() as session:
-            result = session.run(cypher)
-            return [record.data() for record in result]
+        return self.store.run_cypher(cypher)
 
     def get_statistics(self) -> Dict:
         """获取图谱统计信息(支持中文标签)"""
-        stats = {}
+        store_stats = self.store.stats(NODE_TYPES)
 
-        with self.driver.session() as session:
-            # 统计各类型节点数量(支持中英文)
-            node_types = ['疾病', '治疗', '检查', '药物', '生命体征', '并发症']
-
-            for node_type in node_types:
-                try:
-                    result = session.run(f"MATCH (n:`{node_type}`) RETURN count(n) as count")
-                    count = result.single()
-                    if count:
-                        stats[node_type] = count['count']
-                except:
-                    stats[node_type] = 0
-
-            # 统计关系数量
-            result = session.run("MATCH ()-[r]->() RETURN count(r) as count")
-            stats['总关系数'] = result.single()['count']
-
-            # 统计总节点数
-            result = session.run("MATCH (n) RETURN count(n) as count")
-            stats['总节点数'] = result.single()['count']
+        stats = dict(store_stats['labels'])
+        stats['总关系数'] = store_stats['relationships']
+        stats['总节点数'] = store_stats['nodes']
+        stats['图谱版本'] = self.store.graph_version()['version']
 
         return stats
 
@@ -669,6 +555,10 @@ def main():
             json.dump(kg_data, f, ensure_ascii=False, indent=2)
         print("\n知识图谱数据已保存到 knowledge_graph.json")
 
+        # 快照取自图存储的当前内容并记录图版本,服务进程在版本一致时直接映射使用
+        write_store_snapshot(builder.store, DEFAULT_SNAPSHOT_PATH)
+        print(f"知识图谱快照已保存到 {DEFAULT_SNAPSHOT_PATH}")
+
         print("\n图谱统计信息:")
         stats = builder.get_statistics()
         for key, value in stats.items():
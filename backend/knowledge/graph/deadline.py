@@ -0,0 +1,54 @@
+"""
+查询截止时间
+
+调用方用 deadline_scope 为当前上下文(线程或协程)设置一个绝对截止时间(time.monotonic()),
+图存储据此为每个查询设置超时:
+- Neo4j: 剩余时间作为事务超时传给驱动
+- SQLite: 通过进度回调在截止时间后中断正在执行的语句
+截止时间已过或查询因此被中断时抛出 DeadlineExceeded。
+
+    with deadline_scope(time.monotonic() + 2.0):
+        store.expand_subgraph(...)
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+_DEADLINE: ContextVar[Optional[float]] = ContextVar('query_deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求截止时间已过"""
+
+
+@contextmanager
+def deadline_scope(expires_at: Optional[float]):
+    """在 with 块内设置截止时间;已有更早的截止时间时保留更早的"""
+    current = _DEADLINE.get()
+    if expires_at is None or (current is not None and current <= expires_at):
+        yield
+        return
+    token = _DEADLINE.set(expires_at)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    return _DEADLINE.get()
+
+
+def remaining() -> Optional[float]:
+    """剩余秒数,没有截止时间时返回 None"""
+    expires_at = _DEADLINE.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+def check_deadline(operation: str = '查询') -> Optional[float]:
+    """返回剩余秒数;截止时间已过时抛出 DeadlineExceeded"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{operation}前已超过请求截止时间")
+    return left
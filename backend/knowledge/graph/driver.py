@@ -0,0 +1,170 @@
+"""
+进程内共享的 Neo4j 驱动注册表
+
+同一进程内按 (uri, 用户名) 只保留一个驱动,所有蓝图和存储实例共用同一个连接池。
+驱动在第一次查询时才创建;gunicorn fork 出 worker 后子进程会丢弃从父进程继承的驱动
+(不关闭,避免影响父进程的套接字),在子进程内重新创建。
+
+连接池配置(环境变量):
+- NEO4J_MAX_POOL_SIZE            每个驱动的最大连接数,默认 50
+- NEO4J_ACQUISITION_TIMEOUT      从连接池获取连接的超时(秒),默认 30
+- NEO4J_MAX_CONNECTION_LIFETIME  连接最长存活时间(秒),默认 3600
+- NEO4J_MAX_RETRY_TIME           事务函数遇到瞬时错误时的最长重试时间(秒),默认 15
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_POOL_CONFIG = {
+    'max_connection_pool_size': 50,
+    'connection_acquisition_timeout': 30.0,
+    'max_connection_lifetime': 3600.0,
+    'max_transaction_retry_time': 15.0,
+}
+
+_ENV_KEYS = {
+    'max_connection_pool_size': ('NEO4J_MAX_POOL_SIZE', int),
+    'connection_acquisition_timeout': ('NEO4J_ACQUISITION_TIMEOUT', float),
+    'max_connection_lifetime': ('NEO4J_MAX_CONNECTION_LIFETIME', float),
+    'max_transaction_retry_time': ('NEO4J_MAX_RETRY_TIME', float),
+}
+
+
+def pool_config_from_env() -> Dict[str, Any]:
+    config = dict(DEFAULT_POOL_CONFIG)
+    for key, (env, cast) in _ENV_KEYS.items():
+        value = os.getenv(env)
+        if value:
+            config[key] = cast(value)
+    return config
+
+
+class _Entry:
+    __slots__ = ('driver', 'config', 'refs')
+
+    def __init__(self, driver, config: Dict[str, Any]):
+        self.driver = driver
+        self.config = config
+        self.refs = 0
+
+
+class DriverRegistry:
+    """按 (uri, 用户名) 复用驱动,并汇总连接池使用情况"""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # 事务层面的计数: 正在执行的事务、重试次数、获取连接超时次数
+        self.in_flight = 0
+        self.retries = 0
+        self.acquisition_timeouts = 0
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._after_fork()
+
+    def _after_fork(self):
+        # 子进程不能复用父进程的连接
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.in_flight = 0
+
+    def acquire(self, uri: str, username: str, password: str,
+                config: Optional[Dict[str, Any]] = None):
+        """取得(必要时创建)共享驱动,引用计数加一"""
+        key = (uri, username)
+        self._check_fork()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                from neo4j import GraphDatabase
+
+                config = config or pool_config_from_env()
+                driver = GraphDatabase.driver(uri, auth=(username, password), **config)
+                entry = self._entries[key] = _Entry(driver, config)
+            entry.refs += 1
+            return entry.driver
+
+    def release(self, uri: str, username: str):
+        """引用计数减一,归零时关闭驱动"""
+        key = (uri, username)
+        self._check_fork()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+            del self._entries[key]
+        entry.driver.close()
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries = {}
+        for entry in entries:
+            entry.driver.close()
+
+    def track(self, delta: int):
+        with self._lock:
+            self.in_flight += delta
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_acquisition_timeout(self):
+        with self._lock:
+            self.acquisition_timeouts += 1
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        连接池使用情况: 驱动数、最大连接数、已建立/使用中/空闲连接数,以及事务计数。
+        连接数读取自驱动内部结构,驱动版本不兼容时记为 0。
+        """
+        self._check_fork()
+        with self._lock:
+            entries = list(self._entries.values())
+            stats = {
+                'drivers': len(entries),
+                'max_size': sum(entry.config.get('max_connection_pool_size', 0) for entry in entries),
+                'open': 0,
+                'in_use': 0,
+                'idle': 0,
+                'in_flight': self.in_flight,
+                'retries': self.retries,
+                'acquisition_timeouts': self.acquisition_timeouts,
+            }
+        for entry in entries:
+            try:
+                pool = entry.driver._pool
+                with pool.lock:
+                    connections = [c for deque in pool.connections.values() for c in deque]
+            except AttributeError:
+                continue
+            in_use = sum(1 for c in connections if c.in_use)
+            stats['open'] += len(connections)
+            stats['in_use'] += in_use
+            stats['idle'] += len(connections) - in_use
+        return stats
+
+
+DRIVERS = DriverRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=DRIVERS._after_fork)
+
+
+def get_driver(uri: str, username: str, password: str, config: Optional[Dict[str, Any]] = None):
+    return DRIVERS.acquire(uri, username, password, config)
+
+
+def release_driver(uri: str, username: str):
+    DRIVERS.release(uri, username)
+
+
+def pool_stats() -> Dict[str, Any]:
+    return DRIVERS.pool_stats()
@@ -0,0 +1,147 @@
+"""
+Cypher 查询剖析与慢查询日志
+
+开启方式(环境变量):
+- NEO4J_PROFILE=summary  记录驱动返回的 ResultSummary(服务端耗时、返回行数)
+- NEO4J_PROFILE=profile  读查询加 PROFILE 前缀,额外记录 db hits 与执行计划算子
+- NEO4J_SLOW_QUERY_MS    超过该耗时(客户端测得)的查询连同参数写入慢查询日志,默认 1000
+
+统计按查询模板聚合: 模板即归一化空白后的查询文本,变长路径的跳数等拼入文本的部分会区分成不同模板。
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+slow_query_logger = logging.getLogger('backend.knowledge.graph.slow_query')
+
+PROFILE_MODES = ('off', 'summary', 'profile')
+
+# 不能加 PROFILE 前缀的语句
+_UNPROFILABLE = re.compile(r'^\s*(PROFILE|EXPLAIN|CREATE\s+(CONSTRAINT|INDEX)|DROP|SHOW|CALL\s+db\.)', re.IGNORECASE)
+
+_MAX_PARAM_REPR = 200
+
+
+def normalize_query(query: str) -> str:
+    return ' '.join(query.split())
+
+
+def _short_repr(value: Any) -> str:
+    text = repr(value)
+    return text if len(text) <= _MAX_PARAM_REPR else text[:_MAX_PARAM_REPR] + '...'
+
+
+def _walk_profile(plan: Optional[Dict[str, Any]], operators: List[str]) -> int:
+    """累计执行计划树的 db hits,并按先序收集算子名"""
+    if not plan:
+        return 0
+    operators.append(plan.get('operatorType', '?'))
+    db_hits = plan.get('dbHits', 0) or 0
+    for child in plan.get('children', []) or []:
+        db_hits += _walk_profile(child, operators)
+    return db_hits
+
+
+class QueryProfiler:
+    """按查询模板聚合的剖析统计"""
+
+    def __init__(self, mode: str = 'summary', slow_query_ms: float = 1000):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"未知的剖析模式: {mode}")
+        self.mode = mode
+        self.slow_query_ms = slow_query_ms
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['QueryProfiler']:
+        """按环境变量返回进程内共享的剖析器,未开启时返回 None"""
+        global _shared_profiler
+        mode = os.getenv('NEO4J_PROFILE', 'off').lower()
+        if mode == 'off':
+            return None
+        if _shared_profiler is None:
+            _shared_profiler = cls(mode, float(os.getenv('NEO4J_SLOW_QUERY_MS', '1000')))
+        return _shared_profiler
+
+    def prepare(self, query: str, readonly: bool = True) -> str:
+        """profile 模式下为读查询加 PROFILE 前缀"""
+        if self.mode == 'profile' and readonly and not _UNPROFILABLE.match(query):
+            return 'PROFILE ' + query.lstrip()
+        return query
+
+    def record(self, query: str, params: Dict[str, Any], duration_ms: float,
+               rows: int, summary=None):
+        """记录一次查询;summary 为驱动的 ResultSummary(可为空)"""
+        template = normalize_query(query)
+        template_id = hashlib.sha1(template.encode('utf-8')).hexdigest()[:10]
+
+        server_ms = None
+        db_hits = None
+        operators: List[str] = []
+        if summary is not None:
+            available = getattr(summary, 'result_available_after', None)
+            consumed = getattr(summary, 'result_consumed_after', None)
+            if available is not None or consumed is not None:
+                server_ms = (available or 0) + (consumed or 0)
+            profile = getattr(summary, 'profile', None)
+            if profile:
+                db_hits = _walk_profile(profile, operators)
+
+        with self._lock:
+            stats = self._stats.get(template_id)
+            if stats is None:
+                stats = self._stats[template_id] = {
+                    'template_id': template_id,
+                    'query': template,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'server_ms': 0.0,
+                    'rows': 0,
+                    'db_hits': 0,
+                    'max_db_hits': 0,
+                    'slow_count': 0,
+                    'operators': [],
+                }
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['rows'] += rows
+            if server_ms is not None:
+                stats['server_ms'] += server_ms
+            if db_hits is not None:
+                stats['db_hits'] += db_hits
+                if db_hits >= stats['max_db_hits']:
+                    stats['max_db_hits'] = db_hits
+                    stats['operators'] = operators
+            slow = self.slow_query_ms > 0 and duration_ms >= self.slow_query_ms
+            if slow:
+                stats['slow_count'] += 1
+
+        if slow:
+            slow_query_logger.warning(
+                "慢查询 %.1fms (服务端 %sms, 行数 %d, db hits %s) [%s] %s 参数: %s",
+                duration_ms, server_ms, rows, db_hits, template_id, template,
+                {key: _short_repr(value) for key, value in params.items()})
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """按总耗时降序返回各模板统计"""
+        with self._lock:
+            items = [dict(stats) for stats in self._stats.values()]
+        for stats in items:
+            stats['avg_ms'] = round(stats['total_ms'] / stats['count'], 3) if stats['count'] else 0
+            stats['avg_db_hits'] = round(stats['db_hits'] / stats['count'], 1) if stats['count'] else 0
+            stats['total_ms'] = round(stats['total_ms'], 3)
+            stats['max_ms'] = round(stats['max_ms'], 3)
+        return sorted(items, key=lambda stats: stats['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+_shared_profiler: Optional[QueryProfiler] = None
@@ -0,0 +1,519 @@
+"""
+知识图谱二进制快照
+
+列式存储格式(小端序):
+- 字符串全部驻留到一张字符串表中,其余各列只保存整数ID
+- 节点/关系属性使用偏移数组(CSR)存放
+- 出边/入边邻接同样使用偏移数组
+
+- 头部记录快照对应的图版本(store.graph_version),写入时未知则为 -1
+
+加载时通过 mmap 只读映射,各列直接以 memoryview 访问,不做反序列化,
+映射同一文件的多个进程共享同一份页缓存,打开几乎不耗时。
+
+服务进程通过 matching_snapshot(当前图版本) 使用快照: 实体词表、知识检索索引、联想索引
+在快照与当前图版本一致时直接从映射中读取节点(节点属性、度数按需从映射取出,不再各自保存一份),
+不一致或没有快照时退回图存储的 dump_nodes / dump_relationships。
+快照由构建器或 store 导入命令在写入图存储后生成(write_store_snapshot)。
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b'KGSNAP\x00\x00'
+FORMAT_VERSION = 2
+# 版本 1 的头部没有图版本
+_SUPPORTED_VERSIONS = (1, 2)
+
+# 空值(如缺失的 name)使用的字符串ID
+NULL_ID = 0xFFFFFFFF
+
+# 属性值类型: 字符串原样保存,其余值(数字、列表等)保存为JSON文本
+KIND_STR = 0
+KIND_JSON = 1
+
+DEFAULT_SNAPSHOT_PATH = os.getenv('KG_SNAPSHOT_PATH', 'knowledge_graph.kgs')
+
+# 区段顺序固定,头部按此顺序记录每个区段的 (偏移, 字节长度)
+SECTIONS = (
+    'str_offsets', 'str_blob',
+    'node_key', 'node_name', 'node_type',
+    'node_prop_offsets', 'node_prop_keys', 'node_prop_values', 'node_prop_kinds',
+    'edge_src', 'edge_dst', 'edge_type',
+    'edge_prop_offsets', 'edge_prop_keys', 'edge_prop_values', 'edge_prop_kinds',
+    'out_offsets', 'out_edges', 'in_offsets', 'in_edges',
+    'name_order', 'key_order',
+)
+_BYTE_SECTIONS = {'str_blob', 'node_prop_kinds', 'edge_prop_kinds'}
+
+_HEADER = struct.Struct('<8sIII')  # magic, 格式版本, 节点数, 关系数
+_GRAPH_VERSION = struct.Struct('<q')  # 格式版本 2: 图版本,未知为 -1
+_SECTION_ENTRY = struct.Struct('<QQ')
+_ALIGN = 8
+
+
+class SnapshotFormatError(Exception):
+    """快照文件格式错误"""
+
+
+class _StringPool:
+    """字符串驻留表"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.items: List[str] = []
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return NULL_ID
+        value = str(value)
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.items)
+            self.ids[value] = string_id
+            self.items.append(value)
+        return string_id
+
+
+def _u32(values=()) -> array:
+    return array('I', values)
+
+
+def _encode_value(value: Any) -> Tuple[Optional[str], int]:
+    if value is None or isinstance(value, str):
+        return value, KIND_STR
+    return json.dumps(value, ensure_ascii=False), KIND_JSON
+
+
+def _pack_properties(properties: Dict[str, Any], pool: _StringPool,
+                     keys: array, values: array, kinds: bytearray):
+    for key, value in (properties or {}).items():
+        encoded, kind = _encode_value(value)
+        keys.append(pool.intern(key))
+        values.append(pool.intern(encoded))
+        kinds.append(kind)
+
+
+def _to_le_bytes(column) -> bytes:
+    if isinstance(column, (bytes, bytearray)):
+        return bytes(column)
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def write_snapshot(kg_data: Dict[str, List[Dict]], path: str = DEFAULT_SNAPSHOT_PATH,
+                   graph_version: Optional[int] = None) -> str:
+    """
+    将构建结果写成二进制快照
+    Args:
+        kg_data: 包含entities和relationships的字典(与 knowledge_graph.json 相同)
+        path: 输出路径
+        graph_version: 快照内容对应的图版本,None 表示未知(服务进程不会使用)
+    Returns:
+        输出路径
+    """
+    if array('I').itemsize != 4:
+        raise SnapshotFormatError("当前平台 unsigned int 不是4字节,无法写入快照")
+
+    pool = _StringPool()
+    entities = kg_data.get('entities', [])
+
+    node_index: Dict[str, int] = {}
+    node_key, node_name, node_type = _u32(), _u32(), _u32()
+    node_prop_offsets = _u32([0])
+    node_prop_keys, node_prop_values, node_prop_kinds = _u32(), _u32(), bytearray()
+
+    for entity in entities:
+        entity_id = str(entity['id'])
+        if entity_id in node_index:
+            continue
+        node_index[entity_id] = len(node_key)
+        node_key.append(pool.intern(entity_id))
+        node_name.append(pool.intern(entity.get('name')))
+        node_type.append(pool.intern(entity.get('type')))
+        _pack_properties(entity.get('properties'), pool,
+                         node_prop_keys, node_prop_values, node_prop_kinds)
+        node_prop_offsets.append(len(node_prop_keys))
+
+    edge_src, edge_dst, edge_type = _u32(), _u32(), _u32()
+    edge_prop_offsets = _u32([0])
+    edge_prop_keys, edge_prop_values, edge_prop_kinds = _u32(), _u32(), bytearray()
+
+    for rel in kg_data.get('relationships', []):
+        src = node_index.get(str(rel.get('from')))
+        dst = node_index.get(str(rel.get('to')))
+        if src is None or dst is None:
+            continue
+        edge_src.append(src)
+        edge_dst.append(dst)
+        edge_type.append(pool.intern(rel.get('type')))
+        _pack_properties(rel.get('properties'), pool,
+                         edge_prop_keys, edge_prop_values, edge_prop_kinds)
+        edge_prop_offsets.append(len(edge_prop_keys))
+
+    num_nodes, num_edges = len(node_key), len(edge_src)
+
+    # 邻接(CSR): 按起点/终点对关系下标做计数排序
+    def build_adjacency(endpoints: array) -> Tuple[array, array]:
+        offsets = _u32([0] * (num_nodes + 1))
+        for node in endpoints:
+            offsets[node + 1] += 1
+        for i in range(num_nodes):
+            offsets[i + 1] += offsets[i]
+        cursor = array('I', offsets[:-1])
+        edges = _u32([0] * num_edges)
+        for edge, node in enumerate(endpoints):
+            edges[cursor[node]] = edge
+            cursor[node] += 1
+        return offsets, edges
+
+    out_offsets, out_edges = build_adjacency(edge_src)
+    in_offsets, in_edges = build_adjacency(edge_dst)
+
+    def sort_key(column: array):
+        return lambda i: (column[i] == NULL_ID, pool.items[column[i]] if column[i] != NULL_ID else '')
+
+    name_order = _u32(sorted(range(num_nodes), key=sort_key(node_name)))
+    key_order = _u32(sorted(range(num_nodes), key=sort_key(node_key)))
+
+    str_offsets = _u32([0])
+    str_blob = bytearray()
+    for item in pool.items:
+        str_blob += item.encode('utf-8')
+        str_offsets.append(len(str_blob))
+
+    columns = {
+        'str_offsets': str_offsets, 'str_blob': str_blob,
+        'node_key': node_key, 'node_name': node_name, 'node_type': node_type,
+        'node_prop_offsets': node_prop_offsets, 'node_prop_keys': node_prop_keys,
+        'node_prop_values': node_prop_values, 'node_prop_kinds': node_prop_kinds,
+        'edge_src': edge_src, 'edge_dst': edge_dst, 'edge_type': edge_type,
+        'edge_prop_offsets': edge_prop_offsets, 'edge_prop_keys': edge_prop_keys,
+        'edge_prop_values': edge_prop_values, 'edge_prop_kinds': edge_prop_kinds,
+        'out_offsets': out_offsets, 'out_edges': out_edges,
+        'in_offsets': in_offsets, 'in_edges': in_edges,
+        'name_order': name_order, 'key_order': key_order,
+    }
+
+    header_size = _HEADER.size + _GRAPH_VERSION.size + _SECTION_ENTRY.size * len(SECTIONS)
+    offset = header_size
+    entries, payloads = [], []
+    for name in SECTIONS:
+        offset += (-offset) % _ALIGN
+        payload = _to_le_bytes(columns[name])
+        entries.append((offset, len(payload)))
+        payloads.append((offset, payload))
+        offset += len(payload)
+
+    # 先写临时文件再原子替换,已映射旧文件的 worker 不受影响
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, num_nodes, num_edges))
+        f.write(_GRAPH_VERSION.pack(-1 if graph_version is None else graph_version))
+        for entry in entries:
+            f.write(_SECTION_ENTRY.pack(*entry))
+        for section_offset, payload in payloads:
+            f.write(b'\x00' * (section_offset - f.tell()))
+            f.write(payload)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+class KnowledgeGraphSnapshot:
+    """只读的内存映射知识图谱快照"""
+
+    def __init__(self, path: str = DEFAULT_SNAPSHOT_PATH):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotFormatError(f"快照文件为空: {path}")
+        self._buf = memoryview(self._mmap)
+        self._views: List[memoryview] = [self._buf]
+
+        try:
+            magic, version, self.num_nodes, self.num_edges = _HEADER.unpack_from(self._buf, 0)
+        except struct.error:
+            self.close()
+            raise SnapshotFormatError(f"快照文件头不完整: {path}")
+        if magic != MAGIC:
+            self.close()
+            raise SnapshotFormatError(f"不是知识图谱快照文件: {path}")
+        if version not in _SUPPORTED_VERSIONS:
+            self.close()
+            raise SnapshotFormatError(f"不支持的快照版本: {version}")
+
+        # 快照对应的图版本,未知时为 None
+        self.graph_version: Optional[int] = None
+        table = _HEADER.size
+        if version >= 2:
+            (graph_version,) = _GRAPH_VERSION.unpack_from(self._buf, table)
+            self.graph_version = graph_version if graph_version >= 0 else None
+            table += _GRAPH_VERSION.size
+
+        for i, name in enumerate(SECTIONS):
+            offset, length = _SECTION_ENTRY.unpack_from(self._buf, table + i * _SECTION_ENTRY.size)
+            setattr(self, '_' + name, self._column(name, offset, length))
+
+    def _column(self, name: str, offset: int, length: int):
+        raw = self._buf[offset:offset + length]
+        self._views.append(raw)
+        if name in _BYTE_SECTIONS:
+            return raw
+        if sys.byteorder == 'big':
+            # 大端平台无法零拷贝,退化为复制一份
+            column = array('I', raw.tobytes())
+            column.byteswap()
+            return column
+        view = raw.cast('I')
+        self._views.append(view)
+        return view
+
+    def close(self):
+        """释放映射"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        try:
+            if not self._mmap.closed:
+                self._mmap.close()
+        except BufferError:
+            # 调用方仍持有邻接切片,映射交给垃圾回收释放
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ========== 字符串与属性 ==========
+
+    def string(self, string_id: int) -> Optional[str]:
+        if string_id == NULL_ID:
+            return None
+        start, end = self._str_offsets[string_id], self._str_offsets[string_id + 1]
+        return str(self._str_blob[start:end], 'utf-8')
+
+    def _properties(self, offsets, keys, values, kinds, index: int) -> Dict[str, Any]:
+        properties = {}
+        for i in range(offsets[index], offsets[index + 1]):
+            value = self.string(values[i])
+            if kinds[i] == KIND_JSON:
+                value = json.loads(value)
+            properties[self.string(keys[i])] = value
+        return properties
+
+    # ========== 节点 ==========
+
+    def node_key(self, index: int) -> str:
+        return self.string(self._node_key[index])
+
+    def node_name(self, index: int) -> Optional[str]:
+        return self.string(self._node_name[index])
+
+    def node_type(self, index: int) -> Optional[str]:
+        return self.string(self._node_type[index])
+
+    def node_properties(self, index: int) -> Dict[str, Any]:
+        return self._properties(self._node_prop_offsets, self._node_prop_keys,
+                                self._node_prop_values, self._node_prop_kinds, index)
+
+    def node(self, index: int) -> Dict[str, Any]:
+        """按下标取节点(格式与 knowledge_graph.json 中的实体一致)"""
+        return {
+            'id': self.node_key(index),
+            'type': self.node_type(index),
+            'name': self.node_name(index),
+            'properties': self.node_properties(index)
+        }
+
+    def dump_node(self, index: int) -> Dict[str, Any]:
+        """按下标取节点(格式与 GraphStore.dump_nodes() 一致)"""
+        return {
+            'key': self.node_key(index),
+            'name': self.node_name(index),
+            'type': self.node_type(index),
+            'properties': self.node_properties(index)
+        }
+
+    def iter_nodes(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.num_nodes):
+            yield self.node(i)
+
+    def _bisect(self, order, column, value: str) -> int:
+        lo, hi = 0, self.num_nodes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.string(column[order[mid]])
+            if current is not None and current < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find_node(self, entity_id: str) -> Optional[int]:
+        """按实体ID查找节点下标"""
+        pos = self._bisect(self._key_order, self._node_key, entity_id)
+        if pos < self.num_nodes and self.string(self._node_key[self._key_order[pos]]) == entity_id:
+            return self._key_order[pos]
+        return None
+
+    def find_nodes_by_name(self, name: str) -> List[int]:
+        """按名称精确查找节点下标"""
+        matched = []
+        pos = self._bisect(self._name_order, self._node_name, name)
+        while pos < self.num_nodes:
+            index = self._name_order[pos]
+            if self.node_name(index) != name:
+                break
+            matched.append(index)
+            pos += 1
+        return matched
+
+    # ========== 关系与邻接 ==========
+
+    def edge_properties(self, index: int) -> Dict[str, Any]:
+        return self._properties(self._edge_prop_offsets, self._edge_prop_keys,
+                                self._edge_prop_values, self._edge_prop_kinds, index)
+
+    def edge_endpoints(self, index: int) -> Tuple[int, int]:
+        return self._edge_src[index], self._edge_dst[index]
+
+    def edge_type(self, index: int) -> Optional[str]:
+        return self.string(self._edge_type[index])
+
+    def edge(self, index: int) -> Dict[str, Any]:
+        """按下标取关系(格式与 knowledge_graph.json 中的关系一致)"""
+        return {
+            'from': self.node_key(self._edge_src[index]),
+            'to': self.node_key(self._edge_dst[index]),
+            'type': self.edge_type(index),
+            'properties': self.edge_properties(index)
+        }
+
+    def iter_edges(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.num_edges):
+            yield self.edge(i)
+
+    def out_edges(self, node: int) -> memoryview:
+        return self._out_edges[self._out_offsets[node]:self._out_offsets[node + 1]]
+
+    def in_edges(self, node: int) -> memoryview:
+        return self._in_edges[self._in_offsets[node]:self._in_offsets[node + 1]]
+
+    def degree(self, node: int) -> int:
+        return (self._out_offsets[node + 1] - self._out_offsets[node]
+                + self._in_offsets[node + 1] - self._in_offsets[node])
+
+    def neighbors(self, node: int) -> Iterator[Tuple[int, int]]:
+        """遍历无向邻居,产出 (关系下标, 邻居节点下标)"""
+        for edge in self.out_edges(node):
+            yield edge, self._edge_dst[edge]
+        for edge in self.in_edges(node):
+            yield edge, self._edge_src[edge]
+
+    def to_kg_data(self) -> Dict[str, List[Dict]]:
+        """还原为与 knowledge_graph.json 相同的结构"""
+        return {
+            'entities': list(self.iter_nodes()),
+            'relationships': list(self.iter_edges())
+        }
+
+
+_open_snapshots: Dict[str, Tuple[float, KnowledgeGraphSnapshot]] = {}
+
+
+def open_snapshot(path: str = DEFAULT_SNAPSHOT_PATH) -> KnowledgeGraphSnapshot:
+    """
+    打开(并缓存)快照。文件被原子替换后会自动重新映射。
+    在 gunicorn master 中打开后 fork 出的 worker 也共享同一映射。
+    """
+    real_path = os.path.realpath(path)
+    mtime = os.stat(real_path).st_mtime
+    cached = _open_snapshots.get(real_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    snapshot = KnowledgeGraphSnapshot(real_path)
+    _open_snapshots[real_path] = (mtime, snapshot)
+    # 旧映射可能仍被其他引用持有,不主动关闭,交给垃圾回收
+    return snapshot
+
+
+def matching_snapshot(graph_version: Optional[int],
+                      path: str = DEFAULT_SNAPSHOT_PATH) -> Optional[KnowledgeGraphSnapshot]:
+    """与 graph_version 一致的快照;版本未知、没有快照文件、文件损坏或版本不一致时返回 None"""
+    if graph_version is None:
+        return None
+    try:
+        snapshot = open_snapshot(path)
+    except (OSError, SnapshotFormatError):
+        return None
+    return snapshot if snapshot.graph_version == graph_version else None
+
+
+def write_store_snapshot(store, path: str = DEFAULT_SNAPSHOT_PATH) -> str:
+    """把图存储的当前内容写成快照(store 为 GraphStore),记录读取时的图版本"""
+    # 先读版本再读数据: 读取期间有写入时,快照的版本落后,服务进程不会使用
+    graph_version = store.graph_version()['version']
+    kg_data = {
+        'entities': [{'id': node['key'], 'type': node['type'], 'name': node['name'],
+                      'properties': node['properties']} for node in store.dump_nodes()],
+        'relationships': [{'from': rel['source'], 'to': rel['target'], 'type': rel['type'],
+                           'properties': rel['properties']} for rel in store.dump_relationships()]
+    }
+    return write_snapshot(kg_data, path, graph_version=graph_version)
+
+
+def json_to_snapshot(json_path: str, snapshot_path: str) -> str:
+    """knowledge_graph.json -> 快照"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        kg_data = json.load(f)
+    return write_snapshot(kg_data, snapshot_path)
+
+
+def snapshot_to_json(snapshot_path: str, json_path: str) -> str:
+    """快照 -> knowledge_graph.json"""
+    with KnowledgeGraphSnapshot(snapshot_path) as snapshot:
+        kg_data = snapshot.to_kg_data()
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(kg_data, f, ensure_ascii=False, indent=2)
+    return json_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识图谱JSON与二进制快照互相转换")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    to_snapshot = subparsers.add_parser('to-snapshot', help="JSON -> 快照")
+    to_snapshot.add_argument('json_path')
+    to_snapshot.add_argument('snapshot_path', nargs='?', default=DEFAULT_SNAPSHOT_PATH)
+
+    to_json = subparsers.add_parser('to-json', help="快照 -> JSON")
+    to_json.add_argument('snapshot_path')
+    to_json.add_argument('json_path', nargs='?', default='knowledge_graph.json')
+
+    args = parser.parse_args()
+
+    if args.command == 'to-snapshot':
+        json_to_snapshot(args.json_path, args.snapshot_path)
+        print(f"快照已保存到 {args.snapshot_path}")
+    else:
+        snapshot_to_json(args.snapshot_path, args.json_path)
+        print(f"JSON已保存到 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1184 @@
+"""
+图存储抽象
+
+检索、可视化与构建三处用到的图操作统一收敛到 GraphStore 接口:
+- Neo4jGraphStore: 原有的 Neo4j 实现
+- SQLiteGraphStore: 嵌入式实现,邻接表加索引,无需图数据库服务,适合单机部署与基准测试
+
+通过环境变量 GRAPH_BACKEND=neo4j|sqlite 选择后端。
+
+查询遵守 deadline.deadline_scope 设置的截止时间,超时抛出 DeadlineExceeded。
+
+图版本: 每个写入批次(节点/关系合并写入、清空)在同一事务内把图版本加 1,
+并按节点标签 / 关系类型累加写入行数,服务端读取 graph_version() 判断进程内缓存是否过期。
+Neo4j 记录在 :_GraphMeta 节点上,SQLite 记录在 graph_meta 表中。
+
+节点字典约定:
+- 检索相关方法返回的节点 'id' 为存储内部ID(Neo4j 的 id(n) / SQLite 的 rowid)
+- dump/search 返回的节点 'key' 为实体ID(构建时的 n.id,如 d1)
+
+子图扩展(expand_subgraph)返回节点表与关系表,每个节点 / 关系只返回一次,路径是节点ID与关系ID序列,
+热门节点出现在几十条路径中时属性也只传输、保存一份。
+"""
+import argparse
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.knowledge.graph.deadline import DeadlineExceeded, check_deadline, current_deadline
+from backend.knowledge.graph.driver import DRIVERS, get_driver, release_driver
+from backend.knowledge.graph.profiling import QueryProfiler
+
+NODE_TYPES = ['疾病', '治疗', '检查', '药物', '生命体征', '并发症']
+
+DEFAULT_SEARCH_FIELDS = ('name', '症状描述', '注意事项')
+
+# 路径枚举时单层最多保留的候选路径数,防止枢纽节点导致组合爆炸
+MAX_FRONTIER_PATHS = 100000
+
+# UNWIND 批量写入时每个事务的行数
+WRITE_BATCH_SIZE = 10000
+
+# SQLite 每执行多少条虚拟机指令检查一次截止时间
+SQLITE_PROGRESS_STEPS = 1000
+
+# Neo4j 中记录图版本的节点标签,不属于图谱内容,全量导出与统计时排除
+META_LABEL = '_GraphMeta'
+
+
+def _safe_key(key: str) -> str:
+    """清理属性名(移除特殊字符,避免语法错误)"""
+    return key.replace(' ', '_').replace('-', '_').replace('/', '_')
+
+
+def _batches(rows: List[Any], size: int = WRITE_BATCH_SIZE):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _safe_properties(properties: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {_safe_key(k): v for k, v in (properties or {}).items()}
+
+
+def _empty_subgraph() -> Dict[str, List[Dict]]:
+    return {'nodes': [], 'relationships': [], 'paths': []}
+
+
+def _split_subgraphs(groups: List[List[Dict]], nodes: Dict[int, Dict],
+                     relationships: Dict[int, Dict]) -> List[Dict[str, List[Dict]]]:
+    """批量扩展共用一张节点表 / 关系表,按组取出各自路径引用到的部分(字典对象在组之间共享)"""
+    results = []
+    for paths in groups:
+        node_ids = dict.fromkeys(node_id for path in paths for node_id in path['nodes'])
+        rel_ids = dict.fromkeys(rel_id for path in paths for rel_id in path['relationships'])
+        results.append({
+            'nodes': [nodes[node_id] for node_id in node_ids],
+            'relationships': [relationships[rel_id] for rel_id in rel_ids],
+            'paths': paths
+        })
+    return results
+
+
+def _change_counters(kind: str, counts: Dict[str, int]) -> Dict[str, int]:
+    """图版本中的变更计数键: nodes:<标签> / relationships:<关系类型>"""
+    return {f"{kind}:{name}": count for name, count in counts.items() if count}
+
+
+def _parse_version(counters: Dict[str, Any]) -> Dict[str, Any]:
+    version = {'version': int(counters.get('version') or 0), 'nodes': {}, 'relationships': {}}
+    for key, value in counters.items():
+        kind, _, name = key.partition(':')
+        if name and kind in ('nodes', 'relationships'):
+            version[kind][name] = int(value)
+    return version
+
+
+def _deadline_passed() -> int:
+    """SQLite 进度回调: 返回非 0 时中断当前语句"""
+    expires_at = current_deadline()
+    return 1 if expires_at is not None and time.monotonic() >= expires_at else 0
+
+
+def _observed(operation: str):
+    """记录一次存储操作的耗时与返回行数,通知查询监听器;截止时间导致的中断转换为 DeadlineExceeded"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return observe(self, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if str(e) == 'interrupted' and _deadline_passed():
+                    raise DeadlineExceeded(f"{operation} 超过请求截止时间") from e
+                raise
+
+        def observe(self, *args, **kwargs):
+            if not self._query_listeners:
+                return func(self, *args, **kwargs)
+
+            start = time.perf_counter()
+            result, error = None, None
+            try:
+                result = func(self, *args, **kwargs)
+                return result
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                self._notify({
+                    'backend': self.backend,
+                    'operation': operation,
+                    'duration': time.perf_counter() - start,
+                    'rows': len(result) if isinstance(result, list) else (result if isinstance(result, int) else 0),
+                    'error': error
+                })
+        return wrapper
+    return decorator
+
+
+class GraphStore(ABC):
+    """图存储接口"""
+
+    backend = ''
+    _query_listeners: tuple = ()
+
+    def add_query_listener(self, listener):
+        """
+        注册查询监听器,每次存储操作结束后以事件字典回调:
+        {'backend', 'operation', 'duration'(秒), 'rows', 'error'}
+        """
+        self._query_listeners = tuple(self._query_listeners) + (listener,)
+
+    def _notify(self, event: Dict[str, Any]):
+        for listener in self._query_listeners:
+            try:
+                listener(event)
+            except Exception:
+                pass
+
+    @abstractmethod
+    def close(self):
+        """关闭连接"""
+
+    @abstractmethod
+    def ping(self):
+        """连通性检查,失败时抛出异常"""
+
+    # ========== 写入 ==========
+
+    @abstractmethod
+    def ensure_schema(self, labels: Iterable[str] = NODE_TYPES):
+        """创建约束和索引"""
+
+    @abstractmethod
+    def missing_schema(self, labels: Iterable[str] = NODE_TYPES) -> List[str]:
+        """返回缺失的约束/索引描述,为空表示结构完整"""
+
+    @abstractmethod
+    def clear(self):
+        """删除全部节点和关系"""
+
+    @abstractmethod
+    def upsert_nodes(self, entities: List[Dict]) -> int:
+        """按 (类型, id) 合并写入实体节点,返回写入数量"""
+
+    @abstractmethod
+    def upsert_edges(self, relationships: List[Dict]) -> int:
+        """按 (起点, 终点, 类型) 合并写入关系,返回写入数量"""
+
+    # ========== 检索 ==========
+
+    @abstractmethod
+    def find_nodes_by_name(self, text: str, limit: int = 5) -> List[Dict]:
+        """名称包含 text 的节点"""
+
+    @abstractmethod
+    def find_names_in_text(self, text: str, limit: Optional[int] = None) -> List[str]:
+        """名称出现在 text 中的节点名(去重)"""
+
+    @abstractmethod
+    def expand_subgraph(self, seed_ids: List[int], max_depth: int, top_k: int) -> Dict[str, List[Dict]]:
+        """
+        从种子节点出发做 k 跳扩展,按路径长度升序取前 top_k 条
+        Returns:
+            {'nodes': [{'id', 'type', 'name', 'properties'}],
+             'relationships': [{'id', 'start', 'end', 'type', 'properties'}],  # start/end 为关系本身方向的节点ID
+             'paths': [{'nodes': [节点ID], 'relationships': [关系ID], 'length': int}]}
+        """
+
+    @abstractmethod
+    def find_paths(self, start: str, end: str, max_hops: int, limit: int = 10) -> List[Dict]:
+        """
+        名称包含 start / end 的节点之间的路径,按跳数升序
+        Returns:
+            [{'nodes': [节点名], 'relations': [关系类型], 'hops': int}]
+        """
+
+    @abstractmethod
+    def search_nodes(self, query: str, fields: Iterable[str] = DEFAULT_SEARCH_FIELDS,
+                     limit: int = 20) -> List[Dict]:
+        """在若干文本属性上做不区分大小写的子串搜索"""
+
+    # ========== 批量检索(默认逐个执行,支持的后端一次往返完成) ==========
+
+    def find_nodes_by_names(self, texts: List[str], limit: int = 5) -> List[List[Dict]]:
+        """对每个 text 执行 find_nodes_by_name,结果与 texts 一一对应"""
+        return [self.find_nodes_by_name(text, limit) for text in texts]
+
+    def expand_subgraph_batch(self, seed_groups: List[List[int]], max_depth: int,
+                              top_k: int) -> List[Dict[str, List[Dict]]]:
+        """对每组种子节点执行 expand_subgraph,结果与 seed_groups 一一对应"""
+        return [self.expand_subgraph(seed_ids, max_depth, top_k) if seed_ids else _empty_subgraph()
+                for seed_ids in seed_groups]
+
+    def find_paths_batch(self, pairs: List[Tuple[str, str]], max_hops: int, limit: int = 10) -> List[List[Dict]]:
+        """对每个 (start, end) 执行 find_paths,结果与 pairs 一一对应"""
+        return [self.find_paths(start, end, max_hops, limit) for start, end in pairs]
+
+    # ========== 全量与统计 ==========
+
+    @abstractmethod
+    def dump_nodes(self) -> List[Dict]:
+        """全部节点 [{'key', 'name', 'type', 'properties'}],按 key 排序"""
+
+    @abstractmethod
+    def dump_relationships(self) -> List[Dict]:
+        """全部关系 [{'source', 'target', 'type', 'properties'}],按 source 排序"""
+
+    @abstractmethod
+    def stats(self, labels: Iterable[str] = NODE_TYPES) -> Dict[str, Any]:
+        """{'labels': {类型: 数量}, 'nodes': 总节点数, 'relationships': 总关系数}"""
+
+    @abstractmethod
+    def graph_version(self) -> Dict[str, Any]:
+        """
+        图版本与累计变更计数,从未写入过时版本为 0
+        Returns:
+            {'version': int, 'nodes': {标签: 写入行数}, 'relationships': {关系类型: 写入行数}}
+        """
+
+    @abstractmethod
+    def run_cypher(self, cypher: str, **params) -> List[Dict]:
+        """执行原始 Cypher;不支持 Cypher 的后端抛出 ValueError"""
+
+    def query_stats(self) -> Optional[List[Dict[str, Any]]]:
+        """按查询模板聚合的剖析统计,未开启剖析时返回 None"""
+        profiler = getattr(self, 'profiler', None)
+        return profiler.snapshot() if profiler else None
+
+
+class Neo4jGraphStore(GraphStore):
+    """Neo4j 实现"""
+
+    backend = 'neo4j'
+
+    def __init__(self, uri: str, username: str, password: str,
+                 profiler: Optional[QueryProfiler] = None, pool_config: Optional[Dict[str, Any]] = None):
+        self.uri = uri
+        self._username = username
+        self._password = password
+        self._pool_config = pool_config
+        # 驱动在第一次查询时从进程内注册表获取,fork 后的子进程会重新获取
+        self._driver = None
+        self._driver_pid = None
+        # NEO4J_PROFILE 未开启时为 None,不产生额外开销
+        self.profiler = profiler or QueryProfiler.from_env()
+
+    @property
+    def driver(self):
+        if self._driver is None or self._driver_pid != os.getpid():
+            self._driver = get_driver(self.uri, self._username, self._password, self._pool_config)
+            self._driver_pid = os.getpid()
+        return self._driver
+
+    def close(self):
+        if self._driver is not None and self._driver_pid == os.getpid():
+            release_driver(self.uri, self._username)
+        self._driver = None
+
+    def enable_profiling(self, mode: str = 'summary', slow_query_ms: float = 1000) -> QueryProfiler:
+        self.profiler = None if mode == 'off' else QueryProfiler(mode, slow_query_ms)
+        return self.profiler
+
+    def _run(self, query: str, params: Dict[str, Any], readonly: bool) -> List[Any]:
+        """在托管事务中执行: 读查询走 execute_read,写查询走 execute_write,瞬时错误由驱动重试"""
+        from neo4j import unit_of_work
+        from neo4j.exceptions import ClientError, ConnectionAcquisitionTimeoutError
+
+        # 有截止时间时,剩余时间作为事务超时
+        timeout = check_deadline('图查询')
+        profiler = self.profiler
+        prepared = profiler.prepare(query, readonly) if profiler else query
+        attempts = 0
+
+        def work(tx):
+            nonlocal attempts
+            attempts += 1
+            if attempts > 1:
+                DRIVERS.record_retry()
+            result = tx.run(prepared, **params)
+            records = list(result)
+            return records, (result.consume() if profiler else None)
+
+        if timeout is not None:
+            work = unit_of_work(timeout=timeout)(work)
+
+        start = time.perf_counter()
+        DRIVERS.track(1)
+        try:
+            with self.driver.session() as session:
+                if readonly:
+                    records, summary = session.execute_read(work)
+                else:
+                    records, summary = session.execute_write(work)
+        except ConnectionAcquisitionTimeoutError:
+            DRIVERS.record_acquisition_timeout()
+            raise
+        except ClientError as e:
+            if timeout is not None and 'TransactionTimedOut' in (e.code or ''):
+                raise DeadlineExceeded(f"图查询超过请求截止时间({timeout:.2f}s)") from e
+            raise
+        finally:
+            DRIVERS.track(-1)
+
+        if profiler:
+            profiler.record(query, params, (time.perf_counter() - start) * 1000, len(records), summary)
+        return records
+
+    def _read(self, query: str, **params) -> List[Any]:
+        return self._run(query, params, readonly=True)
+
+    def _write(self, query: str, **params) -> List[Any]:
+        return self._run(query, params, readonly=False)
+
+    @_observed('ping')
+    def ping(self):
+        self._read("RETURN 1 as test")
+
+    def ensure_schema(self, labels: Iterable[str] = NODE_TYPES):
+        statements = [f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:`{label}`) REQUIRE n.id IS UNIQUE"
+                      for label in labels]
+        # 版本节点唯一,并发写入时 MERGE 不会建出第二个
+        statements.append(f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:`{META_LABEL}`) REQUIRE n.key IS UNIQUE")
+        for statement in statements:
+            try:
+                self._write(statement)
+            except Exception as e:
+                print(f"约束创建警告: {e}")
+
+    @_observed('missing_schema')
+    def missing_schema(self, labels: Iterable[str] = NODE_TYPES) -> List[str]:
+        records = self._read("""
+            SHOW CONSTRAINTS YIELD type, labelsOrTypes, properties
+            WHERE type CONTAINS 'UNIQUENESS' AND properties = ['id']
+            RETURN labelsOrTypes[0] as label
+        """)
+        existing = {record['label'] for record in records}
+        return [f"{label}.id 唯一约束" for label in labels if label not in existing]
+
+    @staticmethod
+    def _version_clause(counter: str, amount: str) -> str:
+        """追加在写入语句末尾: 同一事务内版本加 1,counter 累加 amount"""
+        return f"""
+            WITH {amount} as changed
+            MERGE (meta:`{META_LABEL}` {{key: 'graph'}})
+            SET meta.version = coalesce(meta.version, 0) + 1,
+                meta.`{counter}` = coalesce(meta.`{counter}`, 0) + changed
+        """
+
+    def _bump_version(self, counters: Dict[str, int]):
+        assignments = ''.join(f", meta.`{key}` = coalesce(meta.`{key}`, 0) + {int(count)}"
+                              for key, count in counters.items())
+        self._write(f"""
+            MERGE (meta:`{META_LABEL}` {{key: 'graph'}})
+            SET meta.version = coalesce(meta.version, 0) + 1{assignments}
+        """)
+
+    @_observed('clear')
+    def clear(self):
+        # 删除的行数计入变更;版本节点保留,清空后版本仍然递增
+        counters = _change_counters('nodes', {
+            record['label']: record['count'] for record in self._read(f"""
+                MATCH (n) WHERE NOT n:`{META_LABEL}`
+                RETURN labels(n)[0] as label, count(*) as count
+            """)})
+        counters.update(_change_counters('relationships', {
+            record['type']: record['count'] for record in self._read("""
+                MATCH ()-[r]->() RETURN type(r) as type, count(*) as count
+            """)}))
+        # 分批删除,避免单个事务过大
+        while self._write(f"""
+            MATCH (n) WHERE NOT n:`{META_LABEL}`
+            WITH n LIMIT 10000
+            DETACH DELETE n
+            RETURN count(*) as deleted
+        """)[0]['deleted']:
+            pass
+        self._bump_version(counters)
+
+    @_observed('upsert_nodes')
+    def upsert_nodes(self, entities: List[Dict]) -> int:
+        # 按标签分组后用 UNWIND 批量写入,失败时逐个回退
+        by_label: Dict[str, List[Dict]] = {}
+        for entity in entities:
+            by_label.setdefault(entity['type'], []).append({
+                'id': entity['id'],
+                'name': entity['name'],
+                'props': _safe_properties(entity.get('properties'))
+            })
+
+        written = 0
+        for label, label_rows in by_label.items():
+            for rows in _batches(label_rows):
+                try:
+                    self._write(f"""
+                        UNWIND $rows AS row
+                        MERGE (n:`{label}` {{id: row.id}})
+                        SET n.name = row.name, n += row.props
+                    """ + self._version_clause(f"nodes:{label}", 'count(*)'), rows=rows)
+                    written += len(rows)
+                except Exception:
+                    fallback = sum(self._upsert_node_fallback(label, row) for row in rows)
+                    self._bump_version({f"nodes:{label}": fallback})
+                    written += fallback
+        return written
+
+    def _upsert_node_fallback(self, label: str, row: Dict) -> int:
+        try:
+            self._write(f"""
+                MERGE (n:`{label}` {{id: $id}})
+                SET n.name = $name, n += $props
+            """, **row)
+        except Exception as e:
+            print(f"  警告: 创建实体 {row['name']} 时出错: {e}")
+            # 如果失败,尝试只创建基本信息
+            self._write(f"""
+                MERGE (n:`{label}` {{id: $id}})
+                SET n.name = $name
+            """, id=row['id'], name=row['name'])
+        return 1
+
+    @_observed('upsert_edges')
+    def upsert_edges(self, relationships: List[Dict]) -> int:
+        by_type: Dict[str, List[Dict]] = {}
+        for rel in relationships:
+            by_type.setdefault(rel['type'], []).append({
+                'from_id': rel['from'],
+                'to_id': rel['to'],
+                'props': _safe_properties(rel.get('properties'))
+            })
+
+        cypher_template = """
+            UNWIND $rows AS row
+            MATCH (a {{id: row.from_id}}), (b {{id: row.to_id}})
+            MERGE (a)-[r:`{rel_type}`]->(b)
+            SET r += row.props
+        """
+        written = 0
+        for rel_type, type_rows in by_type.items():
+            cypher = (cypher_template.format(rel_type=rel_type)
+                      + self._version_clause(f"relationships:{rel_type}", 'count(*)'))
+            for rows in _batches(type_rows):
+                try:
+                    self._write(cypher, rows=rows)
+                    written += len(rows)
+                except Exception:
+                    for row in rows:
+                        try:
+                            self._write(cypher, rows=[row])
+                            written += 1
+                        except Exception as e:
+                            print(f"  警告: 创建关系 {row['from_id']} -> {row['to_id']} 时出错: {e}")
+        return written
+
+    @_observed('find_nodes_by_name')
+    def find_nodes_by_name(self, text: str, limit: int = 5) -> List[Dict]:
+        records = self._read("""
+            MATCH (n)
+            WHERE n.name CONTAINS $entity
+            RETURN id(n) as node_id,
+                   labels(n)[0] as type,
+                   n.name as name,
+                   properties(n) as properties
+            LIMIT $limit
+        """, entity=text, limit=limit)
+        return [{
+            'id': record['node_id'],
+            'type': record['type'],
+            'name': record['name'],
+            'properties': dict(record['properties'])
+        } for record in records]
+
+    @_observed('find_names_in_text')
+    def find_names_in_text(self, text: str, limit: Optional[int] = None) -> List[str]:
+        limit_clause = "LIMIT $limit" if limit else ""
+        records = self._read(f"""
+            MATCH (n)
+            WHERE $text_content CONTAINS n.name
+            RETURN DISTINCT n.name as name
+            {limit_clause}
+        """, text_content=text, limit=limit)
+        return [record['name'] for record in records]
+
+    # 节点 / 关系在子查询中 DISTINCT 后各返回一次,路径只返回ID序列
+    _SUBGRAPH_TABLES = """
+            CALL {
+                WITH paths
+                UNWIND paths as path
+                UNWIND nodes(path) as node
+                WITH DISTINCT node
+                RETURN collect({
+                    id: id(node),
+                    type: labels(node)[0],
+                    name: node.name,
+                    properties: properties(node)
+                }) as nodes
+            }
+            CALL {
+                WITH paths
+                UNWIND paths as path
+                UNWIND relationships(path) as rel
+                WITH DISTINCT rel
+                RETURN collect({
+                    id: id(rel),
+                    start: id(startNode(rel)),
+                    end: id(endNode(rel)),
+                    type: type(rel),
+                    properties: properties(rel)
+                }) as relationships
+            }
+    """
+    _PATH_IDS = """{
+                       nodes: [node in nodes(path) | id(node)],
+                       relationships: [rel in relationships(path) | id(rel)],
+                       length: length(path)
+                   }"""
+
+    @_observed('expand_subgraph')
+    def expand_subgraph(self, seed_ids: List[int], max_depth: int, top_k: int) -> Dict[str, List[Dict]]:
+        records = self._read(f"""
+            MATCH path = (start)-[*1..{int(max_depth)}]-(end)
+            WHERE id(start) IN $node_ids
+            WITH path
+            ORDER BY length(path) ASC
+            LIMIT $top_k
+            WITH collect(path) as paths
+            {self._SUBGRAPH_TABLES}
+            RETURN [path in paths | {self._PATH_IDS}] as paths,
+                   nodes,
+                   relationships
+        """, node_ids=seed_ids, top_k=top_k)
+        if not records:
+            return _empty_subgraph()
+        record = records[0]
+        return {
+            'nodes': record['nodes'],
+            'relationships': record['relationships'],
+            'paths': record['paths']
+        }
+
+    @_observed('find_paths')
+    def find_paths(self, start: str, end: str, max_hops: int, limit: int = 10) -> List[Dict]:
+        records = self._read(f"""
+            MATCH path = (start)-[*1..{int(max_hops)}]-(end)
+            WHERE start.name CONTAINS $start AND end.name CONTAINS $end
+            WITH path,
+                 [node in nodes(path) | node.name] as node_names,
+                 [rel in relationships(path) | type(rel)] as rel_types,
+                 length(path) as hops
+            RETURN node_names, rel_types, hops
+            ORDER BY hops ASC
+            LIMIT $limit
+        """, start=start, end=end, limit=limit)
+        return [{
+            'nodes': record['node_names'],
+            'relations': record['rel_types'],
+            'hops': record['hops']
+        } for record in records]
+
+    # 批量版本: UNWIND 下标,子查询内各自 LIMIT,一次往返完成
+
+    @_observed('find_nodes_by_names')
+    def find_nodes_by_names(self, texts: List[str], limit: int = 5) -> List[List[Dict]]:
+        if not texts:
+            return []
+        records = self._read("""
+            UNWIND range(0, size($entities) - 1) as idx
+            CALL {
+                WITH idx
+                MATCH (n)
+                WHERE n.name CONTAINS $entities[idx]
+                RETURN n
+                LIMIT $limit
+            }
+            RETURN idx,
+                   id(n) as node_id,
+                   labels(n)[0] as type,
+                   n.name as name,
+                   properties(n) as properties
+        """, entities=texts, limit=limit)
+        results: List[List[Dict]] = [[] for _ in texts]
+        for record in records:
+            results[record['idx']].append({
+                'id': record['node_id'],
+                'type': record['type'],
+                'name': record['name'],
+                'properties': dict(record['properties'])
+            })
+        return results
+
+    @_observed('expand_subgraph_batch')
+    def expand_subgraph_batch(self, seed_groups: List[List[int]], max_depth: int,
+                              top_k: int) -> List[Dict[str, List[Dict]]]:
+        if not seed_groups:
+            return []
+        # 各组的路径分别 LIMIT,节点表 / 关系表整批共用一张
+        records = self._read(f"""
+            UNWIND range(0, size($groups) - 1) as idx
+            CALL {{
+                WITH idx
+                MATCH path = (start)-[*1..{int(max_depth)}]-(end)
+                WHERE id(start) IN $groups[idx]
+                WITH path
+                ORDER BY length(path) ASC
+                LIMIT $top_k
+                RETURN path
+            }}
+            WITH idx, collect(path) as group_paths
+            WITH collect({{idx: idx, paths: group_paths}}) as groups,
+                 reduce(all_paths = [], path_list in collect(group_paths) | all_paths + path_list) as paths
+            {self._SUBGRAPH_TABLES}
+            RETURN [group in groups | {{
+                       idx: group.idx,
+                       paths: [path in group.paths | {self._PATH_IDS}]
+                   }}] as groups,
+                   nodes,
+                   relationships
+        """, groups=seed_groups, top_k=top_k)
+        groups: List[List[Dict]] = [[] for _ in seed_groups]
+        if not records:
+            return _split_subgraphs(groups, {}, {})
+        record = records[0]
+        for group in record['groups']:
+            groups[group['idx']] = sorted(group['paths'], key=lambda path: path['length'])
+        return _split_subgraphs(groups, {node['id']: node for node in record['nodes']},
+                                {rel['id']: rel for rel in record['relationships']})
+
+    @_observed('find_paths_batch')
+    def find_paths_batch(self, pairs: List[Tuple[str, str]], max_hops: int, limit: int = 10) -> List[List[Dict]]:
+        if not pairs:
+            return []
+        records = self._read(f"""
+            UNWIND range(0, size($pairs) - 1) as idx
+            CALL {{
+                WITH idx
+                MATCH path = (start)-[*1..{int(max_hops)}]-(end)
+                WHERE start.name CONTAINS $pairs[idx][0] AND end.name CONTAINS $pairs[idx][1]
+                WITH path, length(path) as hops
+                ORDER BY hops ASC
+                LIMIT $limit
+                RETURN path, hops
+            }}
+            RETURN idx,
+                   [node in nodes(path) | node.name] as node_names,
+                   [rel in relationships(path) | type(rel)] as rel_types,
+                   hops
+        """, pairs=[list(pair) for pair in pairs], limit=limit)
+        results: List[List[Dict]] = [[] for _ in pairs]
+        for record in records:
+            results[record['idx']].append({
+                'nodes': record['node_names'],
+                'relations': record['rel_types'],
+                'hops': record['hops']
+            })
+        for paths in results:
+            paths.sort(key=lambda path: path['hops'])
+        return results
+
+    @_observed('search_nodes')
+    def search_nodes(self, query: str, fields: Iterable[str] = DEFAULT_SEARCH_FIELDS,
+                     limit: int = 20) -> List[Dict]:
+        conditions = '\n   OR '.join(f"toLower(n.`{field}`) CONTAINS toLower($query)" for field in fields)
+        records = self._read(f"""
+            MATCH (n)
+            WHERE {conditions}
+            RETURN n.id as key,
+                   n.name as name,
+                   labels(n)[0] as type,
+                   properties(n) as properties
+            LIMIT $limit
+        """, query=query, limit=limit)
+        return [self._node_row(record) for record in records]
+
+    @staticmethod
+    def _node_row(record) -> Dict:
+        return {
+            'key': record['key'],
+            'name': record['name'],
+            'type': record['type'],
+            'properties': dict(record['properties'])
+        }
+
+    @_observed('dump_nodes')
+    def dump_nodes(self) -> List[Dict]:
+        records = self._read(f"""
+            MATCH (n) WHERE NOT n:`{META_LABEL}`
+            RETURN n.id as key,
+                   n.name as name,
+                   labels(n)[0] as type,
+                   properties(n) as properties
+            ORDER BY key
+        """)
+        return [self._node_row(record) for record in records]
+
+    @_observed('dump_relationships')
+    def dump_relationships(self) -> List[Dict]:
+        records = self._read("""
+            MATCH (a)-[r]->(b)
+            RETURN a.id as source,
+                   b.id as target,
+                   type(r) as type,
+                   properties(r) as properties
+            ORDER BY source
+        """)
+        return [{
+            'source': record['source'],
+            'target': record['target'],
+            'type': record['type'],
+            'properties': dict(record['properties'])
+        } for record in records]
+
+    @_observed('stats')
+    def stats(self, labels: Iterable[str] = NODE_TYPES) -> Dict[str, Any]:
+        label_counts = {}
+        for label in labels:
+            try:
+                label_counts[label] = self._read(f"MATCH (n:`{label}`) RETURN count(n) as count")[0]['count']
+            except Exception:
+                label_counts[label] = 0
+
+        return {
+            'labels': label_counts,
+            'relationships': self._read("MATCH ()-[r]->() RETURN count(r) as count")[0]['count'],
+            'nodes': self._read(f"MATCH (n) WHERE NOT n:`{META_LABEL}` RETURN count(n) as count")[0]['count']
+        }
+
+    @_observed('graph_version')
+    def graph_version(self) -> Dict[str, Any]:
+        records = self._read(f"MATCH (meta:`{META_LABEL}` {{key: 'graph'}}) RETURN properties(meta) as meta")
+        return _parse_version(dict(records[0]['meta']) if records else {})
+
+    def run_cypher(self, cypher: str, **params) -> List[Dict]:
+        return [record.data() for record in self._read(cypher, **params)]
+
+
+class SQLiteGraphStore(GraphStore):
+    """
+    嵌入式 SQLite 实现
+
+    nodes/edges 两张表,边表在 src/dst 上建索引作为邻接表;
+    k 跳扩展与路径搜索在进程内逐层展开,语义与 Cypher 变长模式一致(同一路径内关系不重复,方向无关)。
+    """
+
+    backend = 'sqlite'
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS nodes (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL,
+            label TEXT NOT NULL,
+            name TEXT,
+            properties TEXT NOT NULL DEFAULT '{}',
+            UNIQUE (label, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_nodes_key ON nodes (key);
+        CREATE INDEX IF NOT EXISTS idx_nodes_name ON nodes (name);
+        CREATE TABLE IF NOT EXISTS edges (
+            id INTEGER PRIMARY KEY,
+            src INTEGER NOT NULL REFERENCES nodes (id),
+            dst INTEGER NOT NULL REFERENCES nodes (id),
+            type TEXT NOT NULL,
+            properties TEXT NOT NULL DEFAULT '{}',
+            UNIQUE (src, dst, type)
+        );
+        CREATE INDEX IF NOT EXISTS idx_edges_dst ON edges (dst);
+        CREATE TABLE IF NOT EXISTS graph_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._conn().executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # 路径枚举等在 Python 中逐层查询的操作,每次取连接时检查一次截止时间
+        check_deadline('图查询')
+        # 每个线程一个连接;WAL 模式下多进程可并发读
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.set_progress_handler(_deadline_passed, SQLITE_PROGRESS_STEPS)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    @_observed('ping')
+    def ping(self):
+        self._conn().execute("SELECT 1").fetchone()
+
+    def ensure_schema(self, labels: Iterable[str] = NODE_TYPES):
+        self._conn().executescript(self._SCHEMA)
+
+    @_observed('missing_schema')
+    def missing_schema(self, labels: Iterable[str] = NODE_TYPES) -> List[str]:
+        existing = {row[0] for row in self._conn().execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+        required = ('nodes', 'edges', 'idx_nodes_key', 'idx_nodes_name', 'idx_edges_dst', 'graph_meta')
+        return [name for name in required if name not in existing]
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection, counters: Dict[str, int]):
+        """在调用方的事务内把版本加 1 并累加变更计数"""
+        conn.executemany("""
+            INSERT INTO graph_meta (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = value + excluded.value
+        """, [('version', 1)] + list(counters.items()))
+
+    @_observed('clear')
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            counters = _change_counters('nodes', dict(
+                conn.execute("SELECT label, count(*) FROM nodes GROUP BY label").fetchall()))
+            counters.update(_change_counters('relationships', dict(
+                conn.execute("SELECT type, count(*) FROM edges GROUP BY type").fetchall())))
+            conn.execute("DELETE FROM edges")
+            conn.execute("DELETE FROM nodes")
+            self._bump_version(conn, counters)
+
+    # ========== 写入 ==========
+
+    @_observed('upsert_nodes')
+    def upsert_nodes(self, entities: List[Dict]) -> int:
+        rows = []
+        for entity in entities:
+            properties = _safe_properties(entity.get('properties'))
+            properties.pop('id', None)
+            properties.pop('name', None)
+            rows.append((entity['id'], entity['type'], entity['name'],
+                         json.dumps(properties, ensure_ascii=False)))
+        if not rows:
+            return 0
+
+        conn = self._conn()
+        with conn:
+            conn.executemany("""
+                INSERT INTO nodes (key, label, name, properties) VALUES (?, ?, ?, ?)
+                ON CONFLICT (label, key) DO UPDATE
+                SET name = excluded.name, properties = json_patch(nodes.properties, excluded.properties)
+            """, rows)
+            self._bump_version(conn, _change_counters('nodes', Counter(row[1] for row in rows)))
+        return len(rows)
+
+    @_observed('upsert_edges')
+    def upsert_edges(self, relationships: List[Dict]) -> int:
+        rows = [(rel['type'], json.dumps(_safe_properties(rel.get('properties')), ensure_ascii=False),
+                 rel['from'], rel['to'])
+                for rel in relationships]
+
+        # 与 MATCH (a {id: $from_id}), (b {id: $to_id}) 一致: 按实体ID匹配任意标签的节点
+        conn = self._conn()
+        with conn:
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT INTO edges (src, dst, type, properties)
+                SELECT a.id, b.id, ?, ? FROM nodes a, nodes b
+                WHERE a.key = ? AND b.key = ?
+                ON CONFLICT (src, dst, type) DO UPDATE
+                SET properties = json_patch(edges.properties, excluded.properties)
+            """, rows)
+            written = conn.total_changes - before
+            if written:
+                # 按类型计的是本批提交的行数(端点不存在而未写入的行也计入)
+                self._bump_version(conn, _change_counters('relationships', Counter(row[0] for row in rows)))
+            return written
+
+    # ========== 行转换 ==========
+
+    @staticmethod
+    def _node_properties(row) -> Dict[str, Any]:
+        # 与 Neo4j 的 properties(n) 保持一致: id 与 name 也是属性
+        properties = {'id': row['key'], 'name': row['name']}
+        properties.update(json.loads(row['properties']))
+        return properties
+
+    def _node(self, row) -> Dict:
+        return {
+            'id': row['id'],
+            'type': row['label'],
+            'name': row['name'],
+            'properties': self._node_properties(row)
+        }
+
+    def _load_nodes(self, node_ids: Iterable[int]) -> Dict[int, Dict]:
+        node_ids = list(set(node_ids))
+        nodes = {}
+        conn = self._conn()
+        # SQLite 默认最多 999 个绑定参数
+        for i in range(0, len(node_ids), 900):
+            chunk = node_ids[i:i + 900]
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(f"SELECT * FROM nodes WHERE id IN ({placeholders})", chunk):
+                nodes[row['id']] = self._node(row)
+        return nodes
+
+    def _incident_edges(self, node_ids: Iterable[int]) -> Dict[int, List[tuple]]:
+        """批量取邻接: 节点ID -> [(关系ID, 邻居ID)]"""
+        node_ids = list(set(node_ids))
+        adjacency: Dict[int, List[tuple]] = {node_id: [] for node_id in node_ids}
+        conn = self._conn()
+        for i in range(0, len(node_ids), 450):
+            chunk = node_ids[i:i + 450]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f"""
+                SELECT id, src, dst FROM edges
+                WHERE src IN ({placeholders}) OR dst IN ({placeholders})
+                ORDER BY id
+            """, chunk + chunk)
+            for row in rows:
+                if row['src'] in adjacency:
+                    adjacency[row['src']].append((row['id'], row['dst']))
+                if row['dst'] in adjacency and row['dst'] != row['src']:
+                    adjacency[row['dst']].append((row['id'], row['src']))
+        return adjacency
+
+    def _load_edges(self, edge_ids: Iterable[int]) -> Dict[int, Dict]:
+        edge_ids = list(set(edge_ids))
+        edges = {}
+        conn = self._conn()
+        for i in range(0, len(edge_ids), 900):
+            chunk = edge_ids[i:i + 900]
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(f"SELECT id, src, dst, type, properties FROM edges WHERE id IN ({placeholders})",
+                                    chunk):
+                edges[row['id']] = {'id': row['id'], 'start': row['src'], 'end': row['dst'],
+                                    'type': row['type'], 'properties': json.loads(row['properties'])}
+        return edges
+
+    def _walk(self, seeds: List[int], max_depth: int, accept, limit: int) -> List[tuple]:
+        """
+        逐层展开路径,返回 (节点ID序列, 关系ID序列),按长度升序,最多 limit 条
+        accept(node_id) 决定以该节点结尾的路径是否计入结果
+        """
+        found = []
+        frontier = [((seed,), ()) for seed in dict.fromkeys(seeds)]
+        for _ in range(max_depth):
+            if not frontier:
+                break
+            adjacency = self._incident_edges(path_nodes[-1] for path_nodes, _ in frontier)
+            next_frontier = []
+            for path_nodes, path_edges in frontier:
+                for edge_id, neighbor in adjacency[path_nodes[-1]]:
+                    if edge_id in path_edges:
+                        continue
+                    path = (path_nodes + (neighbor,), path_edges + (edge_id,))
+                    if accept(neighbor):
+                        found.append(path)
+                        if len(found) >= limit:
+                            return found
+                    if len(next_frontier) < MAX_FRONTIER_PATHS:
+                        next_frontier.append(path)
+            frontier = next_frontier
+        return found
+
+    # ========== 检索 ==========
+
+    @_observed('find_nodes_by_name')
+    def find_nodes_by_name(self, text: str, limit: int = 5) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT * FROM nodes WHERE instr(name, ?) > 0 ORDER BY id LIMIT ?", (text, limit))
+        return [self._node(row) for row in rows]
+
+    @_observed('find_names_in_text')
+    def find_names_in_text(self, text: str, limit: Optional[int] = None) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT DISTINCT name FROM nodes WHERE instr(?, name) > 0 LIMIT ?", (text, limit or -1))
+        return [row['name'] for row in rows]
+
+    @_observed('expand_subgraph')
+    def expand_subgraph(self, seed_ids: List[int], max_depth: int, top_k: int) -> Dict[str, List[Dict]]:
+        walks = self._walk(seed_ids, max_depth, lambda node_id: True, top_k)
+        node_ids = dict.fromkeys(node_id for path_nodes, _ in walks for node_id in path_nodes)
+        edge_ids = dict.fromkeys(edge_id for _, path_edges in walks for edge_id in path_edges)
+        nodes = self._load_nodes(node_ids)
+        edges = self._load_edges(edge_ids)
+        return {
+            'nodes': [nodes[node_id] for node_id in node_ids],
+            'relationships': [edges[edge_id] for edge_id in edge_ids],
+            'paths': [{'nodes': list(path_nodes), 'relationships': list(path_edges), 'length': len(path_edges)}
+                      for path_nodes, path_edges in walks]
+        }
+
+    @_observed('find_paths')
+    def find_paths(self, start: str, end: str, max_hops: int, limit: int = 10) -> List[Dict]:
+        conn = self._conn()
+        starts = [row['id'] for row in conn.execute("SELECT id FROM nodes WHERE instr(name, ?) > 0", (start,))]
+        ends = {row['id'] for row in conn.execute("SELECT id FROM nodes WHERE instr(name, ?) > 0", (end,))}
+        if not starts or not ends:
+            return []
+
+        walks = self._walk(starts, max_hops, ends.__contains__, limit)
+        nodes = self._load_nodes(node_id for path_nodes, _ in walks for node_id in path_nodes)
+        edges = self._load_edges(edge_id for _, path_edges in walks for edge_id in path_edges)
+        return [{
+            'nodes': [nodes[node_id]['name'] for node_id in path_nodes],
+            'relations': [edges[edge_id]['type'] for edge_id in path_edges],
+            'hops': len(path_edges)
+        } for path_nodes, path_edges in walks]
+
+    @_observed('search_nodes')
+    def search_nodes(self, query: str, fields: Iterable[str] = DEFAULT_SEARCH_FIELDS,
+                     limit: int = 20) -> List[Dict]:
+        query = query.lower()
+        matched = []
+        for row in self._conn().execute("SELECT * FROM nodes ORDER BY id"):
+            properties = self._node_properties(row)
+            if any(isinstance(properties.get(field), str) and query in properties[field].lower()
+                   for field in fields):
+                matched.append(self._dump_node(row, properties))
+                if len(matched) >= limit:
+                    break
+        return matched
+
+    # ========== 全量与统计 ==========
+
+    def _dump_node(self, row, properties: Dict[str, Any] = None) -> Dict:
+        return {
+            'key': row['key'],
+            'name': row['name'],
+            'type': row['label'],
+            'properties': properties or self._node_properties(row)
+        }
+
+    @_observed('dump_nodes')
+    def dump_nodes(self) -> List[Dict]:
+        rows = self._conn().execute("SELECT * FROM nodes ORDER BY key")
+        return [self._dump_node(row) for row in rows]
+
+    @_observed('dump_relationships')
+    def dump_relationships(self) -> List[Dict]:
+        rows = self._conn().execute("""
+            SELECT a.key AS source, b.key AS target, e.type AS type, e.properties AS properties
+            FROM edges e
+            JOIN nodes a ON a.id = e.src
+            JOIN nodes b ON b.id = e.dst
+            ORDER BY source
+        """)
+        return [{
+            'source': row['source'],
+            'target': row['target'],
+            'type': row['type'],
+            'properties': json.loads(row['properties'])
+        } for row in rows]
+
+    @_observed('graph_version')
+    def graph_version(self) -> Dict[str, Any]:
+        return _parse_version(dict(self._conn().execute("SELECT key, value FROM graph_meta").fetchall()))
+
+    @_observed('stats')
+    def stats(self, labels: Iterable[str] = NODE_TYPES) -> Dict[str, Any]:
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT label, count(*) FROM nodes GROUP BY label").fetchall())
+        return {
+            'labels': {label: counts.get(label, 0) for label in labels},
+            'relationships': conn.execute("SELECT count(*) FROM edges").fetchone()[0],
+            'nodes': conn.execute("SELECT count(*) FROM nodes").fetchone()[0]
+        }
+
+    def run_cypher(self, cypher: str, **params) -> List[Dict]:
+        raise ValueError("SQLite 图存储不支持 Cypher 查询,需要执行 Cypher 时请设置 GRAPH_BACKEND=neo4j")
+
+
+def create_graph_store(backend: str = None, neo4j_uri: str = None, neo4j_user: str = None,
+                       neo4j_password: str = None, sqlite_path: str = None) -> GraphStore:
+    """
+    按配置创建图存储
+    Args:
+        backend: neo4j 或 sqlite,默认读取环境变量 GRAPH_BACKEND
+        neo4j_uri/neo4j_user/neo4j_password: Neo4j 连接信息,默认读取 NEO4J_URI 等环境变量
+        sqlite_path: SQLite 数据库文件,默认读取 GRAPH_SQLITE_PATH
+    """
+    backend = (backend or os.getenv('GRAPH_BACKEND', 'neo4j')).lower()
+
+    if backend == 'sqlite':
+        return SQLiteGraphStore(sqlite_path or os.getenv('GRAPH_SQLITE_PATH', 'knowledge_graph.db'))
+    if backend == 'neo4j':
+        return Neo4jGraphStore(
+            neo4j_uri or os.getenv('NEO4J_URI', 'bolt://localhost:7687'),
+            neo4j_user or os.getenv('NEO4J_USERNAME', 'neo4j'),
+            neo4j_password or os.getenv('NEO4J_PASSWORD', 'aqzdwsfneo')
+        )
+    raise ValueError(f"未知的图存储后端: {backend}")
+
+
+def load_kg_data(store: GraphStore, kg_data: Dict[str, List[Dict]]):
+    """把构建结果(knowledge_graph.json 结构)写入图存储"""
+    store.ensure_schema()
+    store.upsert_nodes(kg_data['entities'])
+    store.upsert_edges(kg_data['relationships'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把 knowledge_graph.json 或快照导入图存储")
+    parser.add_argument('source', help="knowledge_graph.json 或 .kgs 快照")
+    parser.add_argument('--backend', default=None, help="neo4j 或 sqlite,默认读取 GRAPH_BACKEND")
+    parser.add_argument('--sqlite-path', default=None)
+    parser.add_argument('--snapshot', default=None,
+                        help="导入后把图存储内容写成快照(服务进程在图版本一致时直接映射使用),默认 KG_SNAPSHOT_PATH")
+    parser.add_argument('--no-snapshot', action='store_true', help="导入后不写快照")
+    args = parser.parse_args()
+
+    from backend.knowledge.graph.snapshot import DEFAULT_SNAPSHOT_PATH, KnowledgeGraphSnapshot, \
+        write_store_snapshot
+
+    if args.source.endswith('.json'):
+        with open(args.source, 'r', encoding='utf-8') as f:
+            kg_data = json.load(f)
+    else:
+        with KnowledgeGraphSnapshot(args.source) as snapshot:
+            kg_data = snapshot.to_kg_data()
+
+    store = create_graph_store(args.backend, sqlite_path=args.sqlite_path)
+    try:
+        load_kg_data(store, kg_data)
+        print(f"已导入 {len(kg_data['entities'])} 个实体, {len(kg_data['relationships'])} 个关系")
+        if not args.no_snapshot:
+            snapshot_path = write_store_snapshot(store, args.snapshot or DEFAULT_SNAPSHOT_PATH)
+            print(f"快照已保存到 {snapshot_path}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -46,6 +46,12 @@ export const knowledgeTestApi = {
 export const knowledgeApi = {
   getKnowledgeGraph() {
     return api.get('/knowledge_graph/get_kg')
+  },
+  searchKnowledge(query, options = {}) {
+    return api.post('/search/knowledge_search', { query, ...options })
+  },
+  suggest(q, limit) {
+    return api.get('/knowledge_graph/suggest', { params: { q, limit } })
   }
 }
 export const neo4jApi = {